@@ -0,0 +1,95 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Convert ASCII data files to (memory-mappable) binary data files.
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import sys
+from optparse import OptionParser
+
+import dsutil.dsutil as dsutil
+import dsutil.dsinfo as dsinfo
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+
+
+def usage():
+    """Print usage information"""
+    print("""
+Convert an ASCII data file ('aFile') to a binary data file ('bFile').
+
+USAGE:
+    {0} [OPTIONS]
+    {0} -h
+
+OPTIONS (Overview):
+
+    -i ARG -- Input ASCII data file
+    -o ARG -- Output binary data file
+    [-v] -- Verbose output (default: False)
+
+AUTHOR: Roland Kwitt, Kitware Inc., 2013
+        roland.kwitt@kitware.com
+""".format(sys.argv[0]))
+    sys.exit(-1)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-i", dest="inFile")
+    parser.add_option("-o", dest="outFile")
+    parser.add_option("-h", dest="shoHelp", action="store_true", default=False)
+    parser.add_option("-v", dest="verbose", action="store_true", default=False)
+    opt, args = parser.parse_args()
+
+    if opt.shoHelp:
+        usage()
+
+    if opt.inFile is None or opt.outFile is None:
+        dsinfo.warn('Options missing!')
+        usage()
+
+    try:
+        dataSiz = dsutil.convertASCIIToBinary(opt.inFile, opt.outFile)
+    except ErrorDS as e:
+        dsinfo.fail(e)
+        return -1
+    
+    if opt.verbose:
+        dsinfo.info("wrote %s (%dx%d, %d frames)" % ((opt.outFile,) + dataSiz))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -27,20 +27,27 @@ import sys
 import time
 import json
 import glob
-import pickle
 import numpy as np
 from optparse import OptionParser
 
 import dsutil.dsutil as dsutil
 import dsutil.dsinfo as dsinfo
+import dsutil.dssink as dssink
+import dsutil.dsio as dsio
 import dscore.dsdist as dsdist
 
 from dsutil.dsutil import Timer
+from dsutil.dsprof import Profiler
+from dsutil.dscache import FrameCache
 from dscore.system import LinearDS
 from dscore.system import NonLinearDS
 from dscore.system import OnlineLinearDS
 from dscore.system import OnlineNonLinearDS
+from dscore.system import ChangeSchedule
+from dscore.system import OnlineMultiDS
 from dscore.dskpca import kpca, KPCAParam, rbfK, RBFParam
+from dscore.dsbasis import ObservationBasis, BASIS_FILE
+from dscore.dsexcp import ErrorDS
 
 
 def usage():
@@ -59,7 +66,20 @@ OPTIONS (Overview):
     -c ARG -- Config file in JSON format
     -v ARG -- Base directory of template videos
     -m ARG -- Base directory of template models
-    [-o ARG] -- Write distance matrix to file
+    [-o ARG] -- Write distance matrix to file (rows written as computed)
+    [-f ARG] -- Distance matrix format (default: 'npy' for *.npy, else 'txt')
+    
+        'npy'  - Growable binary .npy file
+        'mmap' - Binary .npy file, written through a memory map
+        'txt'  - ASCII file
+        
+        For all formats, the frame index of each row and the template 
+        labels are written to ARG.frames.npy and ARG.json (extension of
+        ARG removed, see dsutil/dssink.py).
+        
+    [-C ARG] -- Cache decoded source videos in directory ARG
+    [-r ARG] -- Write JSON timing/throughput report to file
+    [-i ARG] -- Write report every ARG seconds (default: at exit only)
     [-x] -- Verbose output
 
 AUTHOR: Roland Kwitt, Kitware Inc., 2013
@@ -87,8 +107,9 @@ def loadDB(videoDir, modelDir, dbFile):
             "video" -- Name of DS file
             "label" -- Name of corresponding AVI video file
             "model" -- Loaded DS model
-    winSize : int 
-        Length (#frames) of the templates
+            "winSize" -- Length (#frames) of the template
+    winSizes : list
+        Lengths (#frames) of the templates (in ascending order)
     nStates : int
         Number of DS models for templates
     dynType : string
@@ -109,29 +130,231 @@ def loadDB(videoDir, modelDir, dbFile):
         res = glob.glob(os.path.join(videoDir, '%s*.avi' % tplEntry))
         for entry in res:
             videoFile = os.path.basename(entry)
-            modelFile = os.path.splitext(videoFile)[0]+".pkl"
-            modelFile = os.path.join(modelDir, modelFile)
+            modelBase = os.path.join(modelDir, 
+                                     os.path.splitext(videoFile)[0])
+            
+            # versioned (*.npz) or pickled (*.pkl) models
+            modelFile = modelBase + ".npz"
+            if not os.path.exists(modelFile):
+                modelFile = modelBase + ".pkl"
                                      
             if not os.path.exists(modelFile):                         
                 dsinfo.fail("%s does not exist!" % modelFile)
                 raise Exception()
                                      
-            db.append({ "model" : pickle.load(open(modelFile)),
+            # only parameters for distance computation are kept
+            db.append({ "model" : dsio.loadModel(modelFile).compact(),
                         "video" : videoFile,
                         "label" : labEntry })                     
-            winSize.add(db[-1]["model"]._Xhat.shape[1])
+            db[-1]["winSize"] = db[-1]["model"].numFrames()
+            winSize.add(db[-1]["winSize"])
             nStates.add(db[-1]["model"]._nStates)
             dynType.add(type(db[-1]["model"]))
       
-    if not (len(winSize) == 1 and len(nStates) == 1 and len(dynType) == 1):
+    dsinfo.info("loaded %d templates (%.1f [MB], %.1f [MB] mapped)" % 
+        (len(db), sum([e["model"].footprint() for e in db])/1024.**2,
+         sum([e["model"].footprint(True) for e in db])/1024.**2))
+    
+    # templates of different lengths are matched per length
+    if not (len(winSize) >= 1 and len(nStates) == 1 and len(dynType) == 1):
         dsinfo.fail("Incompatible template configuration!")
         raise Exception()
     
     return (db, 
-            iter(winSize).next(), # common sliding window size
+            sorted(winSize),      # sliding window sizes
             iter(nStates).next(), # common number of DS states
             iter(dynType).next()) # common DS type
    
+
+def createKPCAParam(config):
+    """Create KPCA parameters from the detection configuration.
+    
+    Parameters
+    ----------
+    config : dict
+        Detection configuration (see -c option).
+        
+    Returns
+    -------
+    kpcaP : KPCAParam instance
+        KPCA parameters, or None if the kernel is not supported.
+    """
+    
+    kpcaP = KPCAParam()
+   
+    # select kernel
+    if config["kdtKern"] == "rbf":
+        kpcaP._kPar = RBFParam()
+        kpcaP._kFun = rbfK
+    else:
+        dsinfo.fail("Kernel %s not supported!" % config["kdtKern"])
+        return None
+    
+    # configure kernel
+    if config["kCenter"] == 1:
+        kpcaP._kPar._kCen = True
+    else:
+        kpcaP._kPar._kCen = False
+    return kpcaP
+    
+
+def loadBasis(db, modelDir):
+    """Load the observation basis of the templates (see gendb -b).
+    
+    Returns
+    -------
+    basis : dsbasis.ObservationBasis instance
+        Basis of the templates (None: templates are full-space models). 
+        
+    Raises
+    ------
+    Exception, if the templates live in different bases or the basis file
+    does not match.
+    """
+    
+    basisIds = set([getattr(dbentry["model"], '_basisId', None) 
+                    for dbentry in db])
+    if basisIds == set([None]):
+        return None
+    if len(basisIds) > 1:
+        dsinfo.fail("Templates live in different observation bases!")
+        raise Exception()
+    
+    basis = ObservationBasis.load(os.path.join(modelDir, BASIS_FILE))
+    if basis.id() != iter(basisIds).next():
+        dsinfo.fail("Observation basis does not match the templates!")
+        raise Exception()
+    return basis
+    
+
+def createOnlineDS(config, dynType, nStates, winSizes, shiftMe, verbose=False,
+                   basis=None):
+    """Create the online DS that matches the template configuration.
+    
+    For templates of different lengths, an OnlineMultiDS (i.e., one DS per
+    length; all sharing one frame buffer) is created; it re-estimates all
+    DS's every shiftMe frames, i.e., the "adaptive" and "warmStart" options
+    are not supported (and rejected) in that case.
+    
+    Parameters
+    ----------
+    config : dict
+        Detection configuration (see -c option).
+    dynType : type
+        DS type of the templates (i.e., the result of type(...)).
+    nStates : int
+        Number of DS states.
+    winSizes : list
+        Lengths (#frames) of the sliding windows.
+    shiftMe : int
+        Shift of the sliding window (#frames).
+    verbose : boolean (default: False)
+        Verbose output.
+    basis : dsbasis.ObservationBasis instance (default: None)
+        Observation basis of the templates (DT only).
+        
+    Returns
+    -------
+    ds : OnlineLinearDS, OnlineNonLinearDS or OnlineMultiDS instance
+        Online DS, or None if the configuration is not supported.
+    """
+    
+    if not dynType.__name__ in ["LinearDS", "NonLinearDS"]:
+        dsinfo.fail('System type %s not supported!' % dynType.__name__)
+        return None
+    
+    if len(winSizes) > 1:
+        for key in ["adaptive", "warmStart"]:
+            if config.get(key, 0):
+                dsinfo.fail('Option %s is not supported for templates of '
+                            'different lengths!' % key)
+                return None
+        
+        models = {}
+        for winSize in winSizes:
+            if dynType.__name__ == "LinearDS":
+                models[winSize] = LinearDS(nStates, False, verbose)
+            else:
+                kpcaP = createKPCAParam(config)
+                if kpcaP is None:
+                    return None
+                models[winSize] = NonLinearDS(nStates, kpcaP, verbose)
+        return OnlineMultiDS(models, shiftMe, basis)
+    
+    winSize = winSizes[0]
+    
+    # adaptive re-estimation, e.g., "adaptive" : {"loTh" : 5, "hiTh" : 50}
+    schedule = None
+    if "adaptive" in config:
+        schedule = ChangeSchedule(**config["adaptive"])
+    
+    if dynType.__name__ == "LinearDS":
+        # create online version of LinearDS
+        return OnlineLinearDS(nStates, winSize, shiftMe, False, verbose, 
+                              schedule, basis)
+    else:
+        kpcaP = createKPCAParam(config)
+        if kpcaP is None:
+            return None
+            
+        # create online version of KDT; "warmStart" : 1 starts KPCA from
+        # the eigenvectors of the previous window
+        return OnlineNonLinearDS(nStates, kpcaP, winSize, shiftMe, verbose,
+                                 schedule, config.get("warmStart", 0) == 1)
+    
+
+def computeDistances(ds, db, dynType, numIter, bank=None):
+    """Compute distances between the current DS and all templates.
+    
+    In case of an OnlineMultiDS, only templates whose length matches one 
+    of the changed DS's are evaluated, the remaining distances are NaN.
+    
+    Parameters
+    ----------
+    ds : OnlineLinearDS, OnlineNonLinearDS or OnlineMultiDS instance
+        Current (online) DS model.
+    db : list
+        Template database (see loadDB).
+    dynType : type
+        DS type of the templates.
+    numIter : int
+        Iterations for solving the Lyapunov eq.
+    bank : dsdist.TemplateBank instance (default: None)
+        Templates of the database (KDT only), prepared for computing the 
+        distances of one DS to all templates at once.
+    
+    Returns
+    -------
+    dists : numpy.array, shape = (len(db),)
+        Martin distances to each template.
+    """
+    
+    distFun = { "LinearDS" : dsdist.ldsMartinDistance,
+                "NonLinearDS": dsdist.nldsMartinDistance }[dynType.__name__]
+    
+    if isinstance(ds, OnlineMultiDS):
+        dists = np.empty((len(db),))
+        dists.fill(np.nan)
+        for winSize in ds.changed():
+            model = ds.model(winSize)
+            if not bank is None:
+                idx = [j for j, dbentry in enumerate(db) 
+                       if dbentry["winSize"] == winSize]
+                dists[idx] = bank.distances(model, numIter, idx)
+                continue
+            for j, dbentry in enumerate(db):
+                if dbentry["winSize"] == winSize:
+                    dists[j] = distFun(model, dbentry["model"], numIter)
+        return dists
+    
+    if not bank is None:
+        return bank.distances(ds, numIter)
+    
+    dists = np.zeros((len(db),))
+    for j, dbentry in enumerate(db):
+        dists[j] = distFun(ds, dbentry["model"], numIter)
+    return dists
+    
           
 def main(argv=None):
     if argv is None: 
@@ -145,6 +368,10 @@ def main(argv=None):
     parser.add_option("-v", dest="videos")
     parser.add_option("-c", dest="config")
     parser.add_option("-o", dest="mdFile")
+    parser.add_option("-f", dest="mdType")
+    parser.add_option("-C", dest="vCache")
+    parser.add_option("-r", dest="prFile")
+    parser.add_option("-i", dest="prIntv", type="float", default=None)
 
     parser.add_option("-h", dest="doUsage", action="store_true", default=False)
     parser.add_option("-x", dest="verbose", action="store_true", default=False) 
@@ -170,62 +397,103 @@ def main(argv=None):
     videos = options.videos
     mdFile = options.mdFile
     
+    # instrumentation (report is written at exit)
+    prof = Profiler(options.prFile, options.prIntv)
+    
     # check if the required options are present
     if (inFile is None or dbFile is None or
         models is None or videos is None):
         dsinfo.warn('Options missing!')
         usage()
     
-    inVideo, inVideoSize = dsutil.loadDataFromVideoFile(inFile)
-    if verbose:
-        dsinfo.info("Loaded source video with %d frames!" % inVideo.shape[1])
+    # video reader options, e.g., "video" : {"size" : "64x64", "stride" : 2}
+    try:
+        vidOpts = dsutil.videoOptions(**config.get("video", {}))
+    except ErrorDS as e:
+        dsinfo.fail(e)
+        return -1
+    
+    (db, winSizes, nStates, dynType) = loadDB(videos, models, dbFile)
+    prof.setTemplates([dbentry["video"] for dbentry in db])
     
-    (db, winSize, nStates, dynType) = loadDB(videos, models, dbFile)
+    # DT templates might live in a global observation basis
+    basis = loadBasis(db, models)
+    if verbose and not basis is None:
+        dsinfo.info("Observation basis %s (%d dims)" % (basis.id(), 
+                                                       basis.dim()))
+    
+    # KDT templates are prepared for one-vs-all distance computation
+    bank = None
+    if dynType.__name__ == "NonLinearDS":
+        bank = dsdist.TemplateBank([dbentry["model"] for dbentry in db])
     
     if verbose:
-        dsinfo.info("#Templates: %d #States: %d, WinSize: %d, Shift: %d" % 
-                     (len(db), nStates, winSize, shiftMe))
+        dsinfo.info("#Templates: %d #States: %d, WinSize: %s, Shift: %d" % 
+                     (len(db), nStates, winSizes, shiftMe))
     
-    if dynType.__name__ == "LinearDS":
-        # create online version of LinearDS
-        ds = OnlineLinearDS(nStates, winSize, shiftMe, False, verbose)
-    elif dynType.__name__ == "NonLinearDS":
-        kpcaP = KPCAParam()
-       
-        # select kernel
-        if config["kdtKern"] == "rbf":
-            kpcaP._kPar = RBFParam()
-            kpcaP._kFun = rbfK
-        else:
-            dsinfo.fail("Kernel %s not supported!" % kdtKern)
-            return -1
-        
-        # configure kernel
-        if config["kCenter"] == 1:
-            kpcaP._kPar._kCen = True
-        else:
-            kpcaP._kPar._kCen = False
-            
-        # create online version of KDT
-        ds = OnlineNonLinearDS(nStates, kpcaP, winSize, shiftMe, verbose)
-    else:
-        dsinfo.fail('System type %s not supported!' % options.dsType)        
+    ds = createOnlineDS(config, dynType, nStates, winSizes, shiftMe, verbose,
+                        basis)
+    if ds is None:
         return -1
 
-    dList = []
-    for f in range(inVideo.shape[1]):
-        ds.update(inVideo[:,f])
-        if ds.check() and ds.hasChanged():
-            dists = np.zeros((len(db),))
-            for j, dbentry in enumerate(db):
-                dists[j] = { "LinearDS" : dsdist.ldsMartinDistance,
-                             "NonLinearDS": dsdist.nldsMartinDistance
-                }[dynType.__name__](ds, dbentry["model"], numIter)
-            dList.append(dists)
-    
-    # write distance matrix
+    # open distance matrix sink (index: window end frames, template labels)
+    sink = None
     if not mdFile is None:
-        np.savetxt(mdFile, np.asmatrix(dList), fmt='%.5f', delimiter=' ')
+        sink = dssink.openSink(mdFile, len(db), 
+            [dbentry["label"] for dbentry in db],
+            { "videos" : [dbentry["video"] for dbentry in db] },
+            options.mdType)
+    
+    # frames are decoded block-wise, as they are consumed
+    cache = None
+    if not options.vCache is None:
+        cache = FrameCache(options.vCache)
+        blocks = cache.iterVideoBlocks(inFile, **vidOpts)
+    else:
+        blocks = dsutil.iterVideoBlocks(inFile, **vidOpts)
+    # re-estimations are timed by the DS ('sysid'); 'update' is the total 
+    # time to process a block (incl. re-estimations and the callbacks)
+    ds.setProfiler(prof)
+    
+    # called by the DS after each re-estimation (i = frame index in block)
+    state = { "f" : 0 }
+    def onChange(i):
+        if ds.check():
+            with prof.stage('distance'):
+                dists = computeDistances(ds, db, dynType, numIter, bank)
+            prof.countEvals(~np.isnan(dists))
+            prof.count('windows')
+            
+            if not sink is None:
+                with prof.stage('output'):
+                    sink.write(state["f"] + i, dists)
+    
+    while True:
+        with prof.stage('decode'):
+            block = next(blocks, None)
+        if block is None:
+            break
+        
+        # frames are copied into the DS's buffer (blocks are reused)
+        with prof.stage('update'):
+            ds.updateMany(block[0], onChange)
+        prof.count('frames', block[0].shape[1])
+        prof.tick()
+        state["f"] += block[0].shape[1]
+    f = state["f"]
+    
+    if verbose:
+        dsinfo.info("Processed source video with %d frames!" % f)
+        if not cache is None:
+            dsinfo.info("Cache: %(hits)d hits, %(misses)d misses, "
+                        "%(evictions)d evictions" % cache.stats())
+    
+    if verbose:
+        dsinfo.info("Re-estimations: %(executed)d executed, %(skipped)d "
+                    "skipped, %(forced)d forced" % ds.stats())
+    
+    if not sink is None:
+        sink.close()
     
     
 if __name__ == '__main__':
@@ -0,0 +1,157 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Client for the multi-stream template detection service (detectd.py).
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import sys
+import socket
+import itertools
+import threading
+import numpy as np
+from optparse import OptionParser
+
+import dsutil.dsnet as dsnet
+import dsutil.dsutil as dsutil
+import dsutil.dsinfo as dsinfo
+import dsutil.dssink as dssink
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+
+
+def usage():
+    """Print usage information"""
+    print("""
+Stream a video to the template detection service.
+
+USAGE:
+    {0} [OPTIONS]
+    {0} -h
+
+OPTIONS (Overview):
+
+    -u ARG -- Unix socket of the detection service
+    -s ARG -- Source video file (only AVI videos are supported!)
+    [-o ARG] -- Write distance matrix to file (rows written as received)
+    [-f ARG] -- Distance matrix format ('npy', 'mmap' or 'txt', see detect.py;
+                the row index and labels are written to separate files)
+    [-x] -- Verbose output
+
+AUTHOR: Roland Kwitt, Kitware Inc., 2013
+        roland.kwitt@kitware.com
+""".format(sys.argv[0]))
+    sys.exit(-1)
+
+
+def streamFrames(sock, blocks):
+    """Send all frames (block-wise, as decoded), then end the stream.
+    
+    Stops if the server closes the stream (the error is then reported to the
+    receiving side).
+    """
+
+    try:
+        for (block, _) in blocks:
+            for x in block.T:
+                dsnet.sendFrame(sock, x)
+        dsnet.sendEnd(sock)
+    except socket.error:
+        pass
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-u", dest="sockFile")
+    parser.add_option("-s", dest="inFile")
+    parser.add_option("-o", dest="mdFile")
+    parser.add_option("-f", dest="mdType")
+    parser.add_option("-h", dest="doUsage", action="store_true", default=False)
+    parser.add_option("-x", dest="verbose", action="store_true", default=False)
+    options, args = parser.parse_args()
+
+    if options.doUsage:
+        usage()
+
+    if options.sockFile is None or options.inFile is None:
+        dsinfo.warn('Options missing!')
+        usage()
+
+    # frames are decoded while streaming (decode the first block up front)
+    blocks = dsutil.iterVideoBlocks(options.inFile)
+    first = next(blocks)
+    dim = first[0].shape[0]
+
+    sock = dsnet.connect(options.sockFile)
+    hello = dsnet.recvJSON(sock)
+    if options.verbose:
+        dsinfo.info("#Templates: %d" % len(hello["labels"]))
+    dsnet.sendJSON(sock, { "dim" : dim })
+
+    # send frames while receiving results
+    sender = threading.Thread(target=streamFrames, args=(sock,
+        itertools.chain([first], blocks)))
+    sender.daemon = True
+    sender.start()
+
+    sink = None
+    if not options.mdFile is None:
+        sink = dssink.openSink(options.mdFile, len(hello["labels"]),
+            hello["labels"], { "videos" : hello["videos"] }, options.mdType)
+
+    ok = True
+    try:
+        while True:
+            res = dsnet.recvResult(sock)
+            if res is None:
+                break
+            if not sink is None:
+                sink.write(res[0], res[1])
+            if options.verbose:
+                dsinfo.info("frame %d: argmin = %s" %
+                            (res[0], hello["labels"][np.nanargmin(res[1])]))
+    except ErrorDS as e:
+        dsinfo.fail("server: %s" % e)
+        ok = False
+    sender.join()
+    sock.close()
+
+    if not sink is None:
+        sink.close()
+    if not ok:
+        return -1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Multi-stream template detection service (Unix socket front-end).
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import os
+import sys
+import json
+import Queue
+import threading
+import SocketServer
+from optparse import OptionParser
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+import dsutil.dsnet as dsnet
+import dsutil.dsinfo as dsinfo
+
+from detect import loadDB, loadBasis, createOnlineDS, computeDistances
+
+
+def usage():
+    """Print usage information"""
+    print("""
+Multi-stream template detection service.
+
+Loads the template database once and serves an arbitrary number of concurrent
+frame streams over a Unix socket (see dsutil/dsnet.py for the protocol and
+detectc.py for a client).
+
+USAGE:
+    {0} [OPTIONS]
+    {0} -h
+
+OPTIONS (Overview):
+
+    -u ARG -- Unix socket to listen on
+    -d ARG -- Database file in JSON format
+    -c ARG -- Config file in JSON format
+    -v ARG -- Base directory of template videos
+    -m ARG -- Base directory of template models
+    [-p ARG] -- Number of worker threads (default: #CPUs)
+    [-q ARG] -- Max. number of queued frames per stream (default: 64)
+    [-x] -- Verbose output
+
+AUTHOR: Roland Kwitt, Kitware Inc., 2013
+        roland.kwitt@kitware.com
+""".format(sys.argv[0]))
+    sys.exit(-1)
+
+
+class Stream(object):
+    """Detection state of one client stream.
+
+    Frames are queued in a bounded inbox (the producer blocks once the inbox
+    is full, which in turn stops reading from the client's socket) and are
+    processed, in order, by the worker pool that is shared among all streams.
+    At any time, at most one worker processes the frames of a stream. Once
+    processing fails, the client is sent the error and all further frames
+    are discarded.
+    """
+
+    def __init__(self, server, sock):
+        """Initialization.
+
+        Parameters:
+        -----------
+        server : DetectionServer instance
+            Server holding the shared template database and worker pool.
+
+        sock : socket.socket instance
+            Client connection (results are pushed back on that socket).
+        """
+
+        self._server = server
+        self._sock = sock
+        self._ds = server.createDS()
+        self._inbox = Queue.Queue(server._maxQueued)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._busy = False
+        self._fail = False
+        self._f = 0
+
+
+    def put(self, x):
+        """Queue a frame (None marks the end of the stream).
+        """
+
+        if self._fail:
+            return
+        self._inbox.put(x)
+        with self._lock:
+            if self._busy:
+                return
+            self._busy = True
+        self._server._pool.apply_async(self._drain)
+
+
+    def wait(self):
+        """Wait until all queued frames are processed.
+
+        Returns
+        -------
+        ok : boolean
+            False if processing failed.
+        """
+
+        while not self._done.is_set():
+            self._done.wait(1.0)
+        return not self._fail
+
+
+    def _drain(self):
+        """Process queued frames (runs on the shared worker pool).
+        """
+
+        server = self._server
+        if self._fail:
+            self._discard()
+            return
+
+        for i in range(server._maxQueued):
+            try:
+                x = self._inbox.get_nowait()
+            except Queue.Empty:
+                with self._lock:
+                    if self._inbox.empty():
+                        self._busy = False
+                        return
+                continue
+
+            if x is None:
+                self._finish()
+                return
+
+            try:
+                self._ds.update(x)
+                if self._ds.check() and self._ds.hasChanged():
+                    dists = computeDistances(self._ds, server._db,
+                        server._dynType, server._numIter)
+                    dsnet.sendResult(self._sock, self._f, dists)
+            except Exception as e:
+                msg = "stream failed at frame %d: %s" % (self._f, e)
+                dsinfo.fail(msg)
+                self._fail = True
+                try:
+                    dsnet.sendError(self._sock, msg)
+                except Exception:
+                    pass
+                # (unblocks a producer waiting for space in the inbox)
+                self._discard()
+                self._done.set()
+                return
+            self._f += 1
+
+        # be fair to the other streams and re-schedule
+        server._pool.apply_async(self._drain)
+
+
+    def _discard(self):
+        """Discard all queued frames (of a failed stream).
+        """
+
+        with self._lock:
+            while True:
+                try:
+                    self._inbox.get_nowait()
+                except Queue.Empty:
+                    break
+            self._busy = False
+
+
+    def _finish(self):
+        """Mark the stream as done.
+        """
+
+        with self._lock:
+            self._busy = False
+        self._done.set()
+
+
+def frameDim(db, basis=None):
+    """Dimensionality of the frames the templates were estimated from.
+    """
+
+    if not basis is None:
+        return basis._U.shape[0]
+    model = db[0]["model"]
+    if hasattr(model, "_Chat"):
+        return model._Chat.shape[0]
+    return model._kpcaParams._data.shape[0]
+
+
+class StreamHandler(SocketServer.BaseRequestHandler):
+    """Handles one client connection.
+    """
+
+    def handle(self):
+        server = self.server
+        sock = self.request
+
+        dsnet.sendJSON(sock, { "labels" : [e["label"] for e in server._db],
+                               "videos" : [e["video"] for e in server._db] })
+        header = dsnet.recvJSON(sock)
+        dim = int(header["dim"])
+        if dim != server._dim:
+            dsnet.sendError(sock, "frame dimensionality %d does not match "
+                            "the templates (%d)!" % (dim, server._dim))
+            if server._verbose:
+                dsinfo.warn("rejected stream (dim=%d)" % dim)
+            return
+
+        stream = Stream(server, sock)
+        if server._verbose:
+            dsinfo.info("new stream (dim=%d)" % dim)
+
+        try:
+            while True:
+                x = dsnet.recvFrame(sock, dim)
+                stream.put(x)
+                if x is None:
+                    break
+        except Exception as e:
+            dsinfo.fail(e)
+            stream.put(None)
+
+        if stream.wait():
+            dsnet.sendEnd(sock)
+        if server._verbose:
+            dsinfo.info("stream closed after %d frames" % stream._f)
+
+
+class DetectionServer(SocketServer.ThreadingUnixStreamServer):
+    """Detection server holding the (shared) template database.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, sockFile, db, winSizes, nStates, dynType, config,
+                 nWorkers, maxQueued, verbose=False, basis=None):
+        SocketServer.ThreadingUnixStreamServer.__init__(self, sockFile,
+                                                        StreamHandler)
+        self._db = db
+        self._winSizes = winSizes
+        self._nStates = nStates
+        self._dynType = dynType
+        self._config = config
+        self._numIter = config["numIter"]
+        self._shiftMe = config["shiftMe"]
+        self._maxQueued = maxQueued
+        self._verbose = verbose
+        self._basis = basis
+        self._dim = frameDim(db, basis)
+        self._pool = ThreadPool(nWorkers)
+
+
+    def createDS(self):
+        """Create the online DS for a new stream.
+        """
+
+        ds = createOnlineDS(self._config, self._dynType, self._nStates,
+            self._winSizes, self._shiftMe, False, self._basis)
+        if ds is None:
+            raise Exception("unsupported template configuration!")
+        return ds
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-u", dest="sockFile")
+    parser.add_option("-d", dest="dbFile")
+    parser.add_option("-m", dest="models")
+    parser.add_option("-v", dest="videos")
+    parser.add_option("-c", dest="config")
+    parser.add_option("-p", dest="nWorkers", type="int", default=cpu_count())
+    parser.add_option("-q", dest="maxQueued", type="int", default=64)
+    parser.add_option("-h", dest="doUsage", action="store_true", default=False)
+    parser.add_option("-x", dest="verbose", action="store_true", default=False)
+    options, args = parser.parse_args()
+
+    if options.doUsage:
+        usage()
+
+    if (options.sockFile is None or options.dbFile is None or
+        options.models is None or options.videos is None or
+        options.config is None):
+        dsinfo.warn('Options missing!')
+        usage()
+
+    config = json.load(open(options.config))
+    (db, winSizes, nStates, dynType) = loadDB(options.videos,
+                                             options.models,
+                                             options.dbFile)
+
+    # DT templates might live in a global observation basis
+    basis = loadBasis(db, options.models)
+
+    if options.verbose:
+        dsinfo.info("#Templates: %d #States: %d, WinSize: %s, Workers: %d" %
+                     (len(db), nStates, winSizes, options.nWorkers))
+        if not basis is None:
+            dsinfo.info("Observation basis %s (%d dims)" % (basis.id(),
+                                                           basis.dim()))
+
+    if os.path.exists(options.sockFile):
+        os.remove(options.sockFile)
+
+    server = DetectionServer(options.sockFile, db, winSizes, nStates, dynType,
+        config, options.nWorkers, options.maxQueued, options.verbose, basis)
+    dsinfo.info("listening on %s" % options.sockFile)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(options.sockFile)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""pydstk's global observation-space basis for DT models.
+
+All DT models (templates and online models) that are fitted in (or
+projected into) a common, low-dimensional PCA basis U (N x d, d << N) of 
+the observation space store d x k observation matrices (i.e., C = U*c). 
+Since U has orthonormal columns, C1^T*C2 = c1^T*c2, i.e., Martin distances
+are computed on the reduced coordinates as is. Models record the basis 
+they live in (_basisId); distances between models of different bases are 
+refused.
+
+    basis = ObservationBasis.fit(blocks, 64)
+    lds = LinearDS(5)
+    lds.suboptimalSysID(basis.project(dataMat))
+    basis.assign(lds)
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import hashlib
+import numpy as np
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+
+
+# name of the basis file (in a template model directory, see gendb.py)
+BASIS_FILE = 'basis.npz'
+
+
+class ObservationBasis(object):
+    """Orthonormal basis of (a subspace of) the observation space.
+    """
+    
+    def __init__(self, U):
+        """Initialization.
+        
+        Parameters:
+        -----------
+        U : numpy.array, shape = (N, d)
+            Basis vectors (orthonormal columns).
+        """
+        
+        self._U = np.asarray(U, dtype=np.float64)
+        self._id = hashlib.sha1(np.ascontiguousarray(self._U).tostring())
+        self._id = self._id.hexdigest()[0:16]
+        
+        
+    def id(self):
+        """Identifier of the basis (hash of the basis vectors).
+        """
+        return self._id
+        
+        
+    def dim(self):
+        """Dimensionality (d) of the basis.
+        """
+        return self._U.shape[1]
+        
+        
+    def project(self, Y):
+        """Coordinates of observations in the basis, i.e., U^T*Y.
+        
+        Parameters:
+        -----------
+        Y : numpy.array, shape = (N, ) or (N, D)
+            Observation(s).
+            
+        Returns:
+        --------
+        Z : numpy.array, shape = (d, ) or (d, D)
+            Coordinates.
+        """
+        
+        if Y.shape[0] != self._U.shape[0]:
+            raise ErrorDS('observation dimension mismatch!')
+        return self._U.T.dot(Y)
+        
+        
+    def assign(self, lds):
+        """Mark a DT model (fitted to projected observations) as a model of
+        this basis.
+        """
+        
+        if lds._Chat.shape[0] != self.dim():
+            raise ErrorDS('model is not in the basis!')
+        lds._basisId = self._id
+        return lds
+        
+        
+    def projectModel(self, lds):
+        """Project a (full-space) DT model into the basis (in place).
+        
+        The observation matrix (and the mean observation) are replaced by 
+        their coordinates, i.e., C is approximated by U*U^T*C.
+        
+        Parameters:
+        -----------
+        lds : LinearDS instance
+            DT model (in the full observation space).
+            
+        Returns:
+        --------
+        lds : LinearDS instance
+        """
+        
+        if hasattr(lds, '_basisId'):
+            raise ErrorDS('model is already in a basis!')
+        lds._Chat = self.project(np.asarray(lds._Chat))
+        if hasattr(lds, '_Yavg'):
+            lds._Yavg = self.project(np.asarray(lds._Yavg))
+        return self.assign(lds)
+        
+        
+    def save(self, fileName):
+        """Write the basis to a .npz file.
+        """
+        
+        with open(fileName, 'wb') as fid:
+            np.savez(fid, U=self._U)
+        
+        
+    @staticmethod
+    def load(fileName):
+        """Read a basis from a .npz file.
+        """
+        
+        with np.load(fileName) as data:
+            return ObservationBasis(data["U"])
+        
+        
+    @staticmethod
+    def fit(blocks, d, rate=1.0, seed=0, callback=None):
+        """Learn a PCA basis from a stream of observations.
+        
+        Observations are (optionally) randomly subsampled and processed 
+        block-by-block, i.e., the full sample is never in memory. The 
+        truncated SVD of the centered data is updated with each block, 
+        including a correction for the change of the mean (see [1]); d + 10
+        singular vectors are kept during the updates.
+        
+        [1] D. Ross, J. Lim, R.-S. Lin and M.-H. Yang, "Incremental Learning
+            for Robust Visual Tracking", In: IJCV, vol. 77, pp. 125-141, 2008
+        
+        Parameters:
+        -----------
+        blocks : iterable
+            Blocks of observations, numpy.arrays of shape (N, b), e.g., the
+            frames of dsutil.iterVideoBlocks.
+            
+        d : int
+            Dimensionality of the basis.
+            
+        rate : float (default : 1.0)
+            Fraction of the observations to use (random sample).
+            
+        seed : int (default : 0)
+            Seed of the random sampling.
+            
+        callback : function (default : None)
+            Called as callback(n) after each block (n = #observations used).
+            
+        Returns:
+        --------
+        basis : ObservationBasis instance
+        """
+        
+        rng = np.random.RandomState(seed)
+        r = d + 10
+        (U, s, mean, n) = (None, None, None, 0)
+        for B in blocks:
+            if rate < 1:
+                B = B[:,rng.rand(B.shape[1]) < rate]
+            m = B.shape[1]
+            if m == 0:
+                continue
+            
+            B = np.asarray(B, dtype=np.float64)
+            bMean = np.mean(B, axis=1)
+            if U is None:
+                M = B - bMean[:,np.newaxis]
+                mean = bMean
+            else:
+                # mean correction (the previous data was centered w.r.t. 
+                # the previous mean)
+                corr = np.sqrt(n*m/float(n + m))*(mean - bMean)
+                M = np.hstack((U*s, B - bMean[:,np.newaxis], 
+                               corr[:,np.newaxis]))
+                mean = (n*mean + m*bMean)/(n + m)
+            n += m
+            
+            (U, s, _) = np.linalg.svd(M, full_matrices=0)
+            (U, s) = (U[:,0:r], s[0:r])
+            if not callback is None:
+                callback(n)
+        
+        if U is None or U.shape[1] < d:
+            raise ErrorDS('not enough observations for a %d-dim. basis!' % d)
+        return ObservationBasis(U[:,0:d])
@@ -34,23 +34,86 @@ __status__  = "Development"
 
 
 import time
-import copy
 import pickle
 import numpy as np
-import scipy.linalg
-from termcolor import colored
-from sklearn.utils.extmath import randomized_svd
 
 # import module dsinfo from package dsutil
 import dsutil.dsinfo as dsinfo
 
 # import ErrorDS class
 from dscore.dsexcp import ErrorDS
+from dscore.dskpca import rbfKernel, RBFParam
+
+
+def _eigvals(K, L):
+    """Generalized eigenvalues of (K, L) (scipy is imported on first use).
+    """
+    import scipy.linalg
+    return scipy.linalg.eigvals(K, L)
+
+
+def _martinDistance(A1, A2, C1C1, C1C2, C2C2, N):
+    """Martin distance, given the state matrices and the inner products 
+    between the observation matrices (see ldsMartinDistance).
+    """
+    
+    dx1 = C1C1.shape[0]
+    dx2 = C2C2.shape[0]
+    
+    # matrices that are used for the GEP
+    K = np.zeros((dx1+dx2, dx1+dx2))
+    L = np.zeros((dx1+dx2, dx1+dx2))
+
+    # N summation terms
+    for i in range(N+1):
+        if i == 0:
+            O1O2 = C1C2
+            O1O1 = C1C1
+            O2O2 = C2C2
+            a1t = A1
+            a2t = A2
+        else:
+            O1O2 = O1O2 + a1t.T*C1C2*a2t
+            O1O1 = O1O1 + a1t.T*C1C1*a1t
+            O2O2 = O2O2 + a2t.T*C2C2*a2t
+            if i != N-1:
+                a1t = a1t*A1
+                a2t = a2t*A2
+                
+        # we are at the end
+        if i == N-1:
+            K[0:dx1,dx1:] = O1O2
+            K[dx1:,0:dx1] = O1O2.T
+            L[0:dx1,0:dx1] = O1O1
+            L[dx1:,dx1:] = O2O2
+            ev = np.flipud(np.sort(np.real(_eigvals(K, L))))
+            if len(np.nonzero(ev)[0]) != len(ev):
+                return np.inf
+            else:
+                return -2*np.sum(np.log(ev[0:dx1]))
+
+
+def _kpcaWeights(kpcaParams):
+    """KPCA weight matrix w.r.t. the (uncentered) feature space images of
+    the data, i.e., centered weights if the kernel is centered.
+    
+    The KPCA components are sum_i A[i,j] (phi(y_i) - m), m being the mean of
+    the phi(y_i); this equals sum_i (A[i,j] - mean(A[:,j])) phi(y_i).
+    """
+    
+    A = kpcaParams._A
+    if kpcaParams._kPar._kCen:
+        A = A - np.mean(A, axis=0)
+    return A
 
 
 def nldsIP(nlds1, nlds2):
     """Inner product between NLDS feature spaces.
     
+    Neither NLDS (nor its KPCA parameters) is modified, i.e., the inner 
+    product can be computed concurrently on shared models. Kernel centering
+    is taken into account per NLDS (see _kpcaWeights).
+    
     Parameters:
     -----------
     nlds1 : nlds instance
@@ -67,24 +130,12 @@ def nldsIP(nlds1, nlds2):
     
     if not type(nlds1._kpcaParams._kPar) is type(nlds2._kpcaParams._kPar):
         raise ErrorDS('kernel types are incompatible!')
+    if not isinstance(nlds1._kpcaParams._kPar, RBFParam):
+        raise ErrorDS('only RBF kernels are supported!')
     
-    # KPCA weight matrices
-    A1 = nlds1._kpcaParams._A
-    A2 = nlds2._kpcaParams._A
-    
-    N1 = A1.shape[0]
-    N2 = A2.shape[0]
-            
-    if nlds1._kpcaParams._kPar._kCen:
-        A1n = copy.copy(A1)
-        A2n = copy.copy(A2)
-        A1n -= np.tile(np.mean(A1, axis=0),(N1, 1))
-        A2n -= np.tile(np.mean(A2, axis=0),(N2, 1))
-  
-    # copy kernel params of nlds1 and enforce NO centering/scaling
-    kPar = copy.copy(nlds1._kpcaParams._kPar)
-    kPar._kCen = False
-    kPar._sig2 = 1
+    # KPCA weight matrices (centered, if the kernel is centered)
+    A1 = _kpcaWeights(nlds1._kpcaParams)
+    A2 = _kpcaWeights(nlds2._kpcaParams)
     
     # data of both NLDS's
     Y1 = nlds1._kpcaParams._data
@@ -93,12 +144,175 @@ def nldsIP(nlds1, nlds2):
     sig1s = np.sqrt(nlds1._kpcaParams._kPar._sig2)
     sig2s = np.sqrt(nlds2._kpcaParams._kPar._sig2)
         
-    # inner-product (in feature space) between Gaussian kernels (updates kPar)
-    nlds1._kpcaParams._kFun(Y1/sig1s, Y2/sig2s, kPar)
-    F = np.asmatrix(A1).T*kPar._kMat*A2
+    # inner-product (in feature space) between Gaussian kernels, i.e., an
+    # uncentered RBF kernel (of unit width) between the scaled data
+    kMat = rbfKernel(Y1/sig1s, Y2/sig2s, 1)
+    F = np.asmatrix(A1).T*kMat*A2
     return F
     
     
+class TemplateBank(object):
+    """NLDS templates, prepared for computing distances (or feature space 
+    inner products, see nldsIP) between one query NLDS and all templates.
+    
+    The (scaled) data of all templates and its squared norms are computed 
+    once and stacked. For a query, the data is scaled once; cross kernels 
+    against the stacked template data are computed in blocks of (about) 
+    blockSize template frames. Per block, the product of the query's KPCA
+    weights and the cross kernel is computed once and shared by all 
+    templates of the block.
+    
+        bank = TemplateBank(templates)
+        dists = bank.distances(query, N=20)
+    """
+    
+    def __init__(self, templates, blockSize=4096):
+        """Initialization.
+        
+        Parameters:
+        -----------
+        templates : list of NonLinearDS instances
+            Template NLDS's (RBF kernel).
+            
+        blockSize : int (default : 4096)
+            Number of template frames per cross kernel block.
+        """
+        
+        for nlds in templates:
+            if not isinstance(nlds._kpcaParams._kPar, RBFParam):
+                raise ErrorDS('only RBF kernels are supported!')
+        
+        self._templates = templates
+        self._blockSize = blockSize
+        
+        # KPCA weights (see nldsIP)
+        self._A = [_kpcaWeights(nlds._kpcaParams) for nlds in templates]
+        
+        # scaled data (see nldsIP), its squared norms and column offsets
+        Z = [nlds._kpcaParams._data/np.sqrt(nlds._kpcaParams._kPar._sig2) 
+             for nlds in templates]
+        self._offsets = np.cumsum([0] + [z.shape[1] for z in Z])
+        self._Z = np.hstack(Z) if len(Z) > 0 else None
+        self._zz = None
+        if len(Z) > 0:
+            self._zz = np.einsum('ij,ij->j', self._Z, self._Z)
+        
+        
+    def __len__(self):
+        """Number of templates.
+        """
+        return len(self._templates)
+        
+        
+    def _blocks(self, idx):
+        """Split templates into blocks (w/ at most blockSize frames, unless
+        a template is longer).
+        """
+        
+        offsets = self._offsets
+        (b, n) = (0, len(idx))
+        while b < n:
+            e = b + 1
+            cnt = offsets[idx[b]+1] - offsets[idx[b]]
+            while e < n:
+                m = offsets[idx[e]+1] - offsets[idx[e]]
+                if cnt + m > self._blockSize:
+                    break
+                cnt += m
+                e += 1
+            yield idx[b:e]
+            b = e
+            
+            
+    def innerProducts(self, nlds, idx=None):
+        """Feature space inner products between an NLDS and the templates.
+        
+        Parameters:
+        -----------
+        nlds : NonLinearDS instance
+            Query NLDS (RBF kernel).
+            
+        idx : list (default : None)
+            Indices of the templates (None: all).
+            
+        Returns:
+        --------
+        F : list of numpy.matrix, shape = (nStates, nStates)
+            Inner products (see nldsIP), one per template (in order of idx).
+        """
+        
+        if not isinstance(nlds._kpcaParams._kPar, RBFParam):
+            raise ErrorDS('kernel types are incompatible!')
+        if idx is None:
+            idx = range(len(self._templates))
+        
+        # scaled query data and its squared norms
+        X = nlds._kpcaParams._data/np.sqrt(nlds._kpcaParams._kPar._sig2)
+        xx = np.einsum('ij,ij->j', X, X)
+        At = np.asmatrix(_kpcaWeights(nlds._kpcaParams)).T
+        
+        F = []
+        offsets = self._offsets
+        for block in self._blocks(idx):
+            # template frames of the block (a view, if contiguous)
+            if block[-1] - block[0] == len(block) - 1:
+                cols = slice(offsets[block[0]], offsets[block[-1]+1])
+            else:
+                cols = np.concatenate([np.arange(offsets[j], offsets[j+1]) 
+                                       for j in block])
+            
+            # uncentered RBF kernel of unit width (see nldsIP), in place
+            kMat = -2*np.dot(X.T, self._Z[:,cols])
+            kMat += xx[:,np.newaxis]
+            kMat += self._zz[np.newaxis,cols]
+            np.maximum(kMat, 0, out=kMat)
+            np.negative(kMat, out=kMat)
+            np.exp(kMat, out=kMat)
+            P = At*kMat
+            
+            pos = 0
+            for j in block:
+                n = offsets[j+1] - offsets[j]
+                F.append(P[:,pos:pos+n]*self._A[j])
+                pos += n
+        return F
+        
+        
+    def distances(self, nlds, N=20, idx=None):
+        """Martin distances between an NLDS and the templates.
+        
+        Parameters:
+        -----------
+        nlds : NonLinearDS instance
+            Query NLDS (RBF kernel).
+            
+        N : int (default: 20)
+            Number of iterations to compute the "infinite sum" that is the 
+            solution to the Lyapunov equation.
+            
+        idx : list (default : None)
+            Indices of the templates (None: all).
+            
+        Returns:
+        --------
+        dists : numpy.array, shape = (len(idx), )
+            Martin distances (see nldsMartinDistance).
+        """
+        
+        if idx is None:
+            idx = range(len(self._templates))
+        
+        dx1 = len(nlds._initX0)
+        F = self.innerProducts(nlds, idx)
+        dists = np.empty((len(idx),))
+        for (i, j) in enumerate(idx):
+            template = self._templates[j]
+            dx2 = len(template._initX0)
+            dists[i] = _martinDistance(nlds._Ahat, template._Ahat, 
+                                       np.eye(dx1), F[i], np.eye(dx2), N)
+        return dists
+        
+        
 def nldsMartinDistance(nlds1, nlds2, N=20):
     """Martin distance between two NLDS's.
     
@@ -137,46 +351,12 @@ def nldsMartinDistance(nlds1, nlds2, N=20):
         Martin distance between nlds1 and nlds2.
     """
     
-    Ahat1 = nlds1._Ahat
-    Ahat2 = nlds2._Ahat
-    
     dx1 = len(nlds1._initX0)
     dx2 = len(nlds2._initX0)
     
     C1C2 = nldsIP(nlds1, nlds2)
-    C1C1 = np.eye(dx1)
-    C2C2 = np.eye(dx2)
-    
-    K = np.zeros((dx1+dx2, dx1+dx2))
-    L = np.zeros((dx1+dx2, dx1+dx2))
-    
-    # N summation terms
-    for i in range(N+1):
-        if i == 0:
-            O1O2 = C1C2
-            O1O1 = C1C1
-            O2O2 = C2C2
-            a1t = Ahat1
-            a2t = Ahat2
-        else:
-            O1O2 = O1O2 + a1t.T*C1C2*a2t
-            O1O1 = O1O1 + a1t.T*C1C1*a1t
-            O2O2 = O2O2 + a2t.T*C2C2*a2t
-            if i != N-1:
-                a1t = a1t*Ahat1
-                a2t = a2t*Ahat2
-                
-        # we are at the end
-        if i == N-1:
-            K[0:dx1,dx1:] = O1O2
-            K[dx1:,0:dx1] = O1O2.T
-            L[0:dx1,0:dx1] = O1O1
-            L[dx1:,dx1:] = O2O2
-            ev = np.flipud(np.sort(np.real(scipy.linalg.eigvals(K, L))))
-            if len(np.nonzero(ev)[0]) != len(ev):
-                return np.inf
-            else:
-                return -2*np.sum(np.log(ev[0:dx1]))
+    return _martinDistance(nlds1._Ahat, nlds2._Ahat, np.eye(dx1), C1C2, 
+                           np.eye(dx2), N)
                 
 
 def ldsMartinDistance(lds1, lds2, N=20):
@@ -214,6 +394,11 @@ def ldsMartinDistance(lds1, lds2, N=20):
     if not lds1.check() or not lds2.check():
         raise Exception("Models are incomplete!")
     
+    # models of a global observation basis (see dsbasis) have reduced 
+    # observation matrices, which are only comparable within the basis
+    if getattr(lds1, '_basisId', None) != getattr(lds2, '_basisId', None):
+        raise ErrorDS('models live in different observation bases!')
+    
     # get relevant params
     C1 = lds1._Chat
     C2 = lds2._Chat
@@ -224,42 +409,4 @@ def ldsMartinDistance(lds1, lds2, N=20):
     C2C2 = np.asmatrix(C2).T*C2
     C1C2 = np.asmatrix(C1).T*C2
     
-    dx1 = len(lds1._initM0)
-    dx2 = len(lds2._initM0)
-    
-    # matrices that are used for the GEP
-    K = np.zeros((dx1+dx2, dx1+dx2))
-    L = np.zeros((dx1+dx2, dx1+dx2))
-
-    # N summation terms
-    for i in range(N+1):
-        if i == 0:
-            O1O2 = C1C2
-            O1O1 = C1C1
-            O2O2 = C2C2
-            a1t = A1
-            a2t = A2
-        else:
-            O1O2 = O1O2 + a1t.T*C1C2*a2t
-            O1O1 = O1O1 + a1t.T*C1C1*a1t
-            O2O2 = O2O2 + a2t.T*C2C2*a2t
-            if i != N-1:
-                a1t = a1t*A1
-                a2t = a2t*A2
-                
-        # we are at the end
-        if i == N-1:
-            K[0:dx1,dx1:] = O1O2
-            K[dx1:,0:dx1] = O1O2.T
-            L[0:dx1,0:dx1] = O1O1
-            L[dx1:,dx1:] = O2O2
-            ev = np.flipud(np.sort(np.real(scipy.linalg.eigvals(K,L))))
-            if len(np.nonzero(ev)[0]) != len(ev):
-                return np.inf
-            else:
-                return -2*np.sum(np.log(ev[0:dx1]))
-            
-            
-            
-    
-    
\ No newline at end of file
+    return _martinDistance(A1, A2, C1C1, C1C2, C2C2, N)
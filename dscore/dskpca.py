@@ -34,8 +34,6 @@ __status__  = "Development"
 import sys
 import time
 import numpy as np
-from sklearn.decomposition import KernelPCA
-from sklearn.metrics.pairwise import euclidean_distances
 
 # import dsinfo module from dsinfo package
 import dsutil.dsinfo as dsinfo
@@ -45,10 +43,34 @@ from dscore.dsexcp import ErrorDS
 from dsutil.dsutil import Timer
 
 
-class RBFParam:
+class _SlotParam(object):
+    """Base class for (__slots__-based) parameter containers.
+    
+    Instances have no __dict__; pickling works via __getstate__/__setstate__,
+    which also accepts the (dict) state of pickles of the former, __dict__-
+    based parameter classes.
+    """
+    
+    __slots__ = ()
+    
+    def __getstate__(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__ 
+                    if hasattr(self, k))
+        
+    def __setstate__(self, state):
+        # slots state of protocol 2 pickles is (None, state)
+        if isinstance(state, tuple):
+            state = state[1]
+        for (k, v) in state.iteritems():
+            setattr(self, k, v)
+
+
+class RBFParam(_SlotParam):
     """Class for RBF kernel parametes.
     """
     
+    __slots__ = ('_kCen', '_kMat', '_sig2', '_trS0', '_trS1', '_teS0')
+    
     def __init__(self):
         self._kCen = None
         self._kMat = None
@@ -58,7 +80,7 @@ class RBFParam:
         self._teS0 = None
 
 
-class KPCAParam:
+class KPCAParam(_SlotParam):
     """Class for KPCA parameters.
     
     Member variables are:
@@ -67,7 +89,10 @@ class KPCAParam:
         _l : numpy.array, shape = (k, )  - Eigenvalues of kernel matrix
         _kPar : Kernel parameters (depends on kernel)
         _kFun : Kernel function (depends on kernel)
+        _data : numpy.array, shape = (N, D) - Training data
     """
+    
+    __slots__ = ('_A', '_l', '_kPar', '_kFun', '_data')
 
     def __init__(self):
         self._A = None
@@ -77,7 +102,71 @@ class KPCAParam:
         self._data = None
 
 
-def rbfK(X, Y, params):
+def sqEuclidean(X, Y):
+    """Pairwise squared Eucl. distances between the columns of X and Y.
+    
+    Parameters:
+    -----------
+    X : numpy.array, shape = (N, D)
+        Input data #1 (D samples).
+        
+    Y : numpy.array, shape = (N, M)
+        Input data #2 (M samples).
+        
+    Returns:
+    --------
+    dMat : numpy.array, shape = (D, M)
+        Squared distances (clipped at zero; zero diagonal if X is Y).
+    """
+    
+    XX = np.einsum('ij,ij->j', X, X)
+    if X is Y:
+        YY = XX
+    else:
+        YY = np.einsum('ij,ij->j', Y, Y)
+    
+    dMat = -2*np.dot(X.T, Y)
+    dMat += XX[:,np.newaxis]
+    dMat += YY[np.newaxis,:]
+    np.maximum(dMat, 0, out=dMat)
+    if X is Y:
+        np.fill_diagonal(dMat, 0)
+    return dMat
+    
+    
+def rbfKernel(X, Y, sig2, dMat=None):
+    """Uncentered RBF kernel K_ij = exp(-||x_i - y_j||^2/sigma2).
+    
+    Unlike rbfK, no parameters are updated (i.e., the function has no side
+    effects and can be called concurrently on shared data).
+    
+    Parameters:
+    -----------
+    X : numpy array, shape = (N, D)
+        D N-dimensional input vectors.
+
+    Y : numpy array, shape = (N, M)
+        M N-dimensional input vectors.
+        
+    sig2 : float
+        Kernel width.
+        
+    dMat : numpy array, shape = (D, M) (default : None)
+        Precomputed pairwise (squared) Eucl. distances between the columns
+        of X and Y.
+        
+    Returns:
+    --------
+    kMat : numpy array, shape = (D, M)
+        The kernel matrix.
+    """
+    
+    if dMat is None:
+        dMat = sqEuclidean(X, Y)
+    return np.exp(-1.0*dMat/sig2)
+    
+    
+def rbfK(X, Y, params, dMat=None):
     """RBF kernel.
     
     Compute a centered RBF kernel K_ij = exp(-||x_i - y_j||^2/sigma2), 
@@ -121,6 +210,11 @@ def rbfK(X, Y, params):
         If the field _sig2 is set, it will be used as the RBF kernel width;
         If it is not set (None), it will be computed (see above) and the 
         field will be updated.
+        
+    dMat : numpy array, shape = (D, D) (default : None)
+        Precomputed pairwise (squared) Eucl. distances between the columns
+        of X and Y, e.g., when the distances are shared among several
+        (overlapping) data matrices.
     """
     
     if params._kCen is None:
@@ -135,13 +229,14 @@ def rbfK(X, Y, params):
         isTrain = True
      
     # compute pairwise (squared) Eucl. distances   
-    dMat = euclidean_distances(X.T, Y.T, squared=True)
+    if dMat is None:
+        dMat = sqEuclidean(X, Y)
     
     if params._sig2 is None:
         params._sig2 = np.median(dMat.ravel())
 
     # computes RBF kernel
-    kMat = np.exp(-1.0*dMat/params._sig2)
+    kMat = rbfKernel(X, Y, params._sig2, dMat)
     
     # do we need centering?
     if params._kCen:
@@ -200,7 +295,69 @@ def normalize(A, l, tol=1e-6):
         A /= np.tile(np.sqrt(l), (n, 1))
     
     
-def kpca(Y, k, params):
+def refineEig(kMat, init, maxIter=20, tol=1e-5, minSize=100):
+    """Refine approximate top eigenvectors of a kernel matrix (LOBPCG).
+    
+    The kernel matrix is centered in feature space first (as in KernelPCA;
+    has no effect on centered kernels). The result is accepted only if the
+    relative residuals ||K*a_j - l_j*a_j||/l_0 are below tol; e.g., for 
+    tol=1e-5, the eigenvalues of shifted windows of data1.txt match the ones 
+    of the full eigendecomposition up to a relative error of ~1e-6. For 
+    problems smaller than minSize, the full eigendecomposition is faster, 
+    i.e., no refinement is attempted.
+    
+    Parameters:
+    -----------
+    kMat : numpy.array, shape = (D, D)
+        Kernel matrix.
+        
+    init : numpy.array, shape = (D, k)
+        Initial eigenvectors (e.g., the eigenvectors of an overlapping 
+        window).
+        
+    maxIter : int (default : 20)
+        Max. number of LOBPCG iterations.
+        
+    tol : float (default : 1e-5)
+        Residual tolerance (relative to the largest eigenvalue).
+        
+    minSize : int (default : 100)
+        Min. size (D) of the problem.
+        
+    Returns:
+    --------
+    (alphas, lambdas) : tuple of numpy.arrays, shape = (D, k) and (k, )
+        Unit eigenvectors and eigenvalues (descending), or None if LOBPCG 
+        did not converge (or the problem is too small).
+    """
+    
+    # LOBPCG is unreliable for small problems (dense solvers are faster)
+    if init.shape[0] < max(5*init.shape[1], minSize):
+        return None
+    
+    from scipy.sparse.linalg import lobpcg
+    
+    K = np.asarray(kMat, dtype=np.float64)
+    K = (K - np.mean(K, axis=0)[np.newaxis,:] - 
+         np.mean(K, axis=1)[:,np.newaxis] + np.mean(K))
+    
+    try:
+        (l, A) = lobpcg(K, np.asarray(init, dtype=np.float64), 
+                        largest=True, maxiter=maxIter, tol=tol)
+    except (np.linalg.LinAlgError, ValueError):
+        return None
+    
+    order = np.argsort(l)[::-1]
+    (l, A) = (l[order], A[:,order])
+    if l[0] <= 0:
+        return None
+    res = np.sqrt(np.sum((K.dot(A) - A*l)**2, axis=0))
+    if np.max(res) > tol*l[0]:
+        return None
+    return (A, l)
+    
+    
+def kpca(Y, k, params, dMat=None, init=None):
     """KPCA driver.
     
     Runs KPCA on the input data matrix and UPDATES the KPCA parameters given
@@ -220,6 +377,16 @@ def kpca(Y, k, params):
     k : int
         Compute k KPCA components.
     
+    dMat : numpy array, shape = (D, D) (default : None)
+        Precomputed pairwise (squared) Eucl. distances between the columns
+        of Y (passed on to the kernel function).
+        
+    init : numpy array, shape = (D, k) (default : None)
+        Approximate (unit) eigenvectors of the kernel matrix, e.g., those of 
+        an overlapping window. If given, they are refined iteratively (see
+        refineEig) instead of solving the full eigenproblem; in case the
+        refinement does not converge, the full eigenproblem is solved.
+    
     params : KPCAParam instance
         KPCA parameters. 
         
@@ -254,17 +421,30 @@ def kpca(Y, k, params):
     params._data = Y
     
     # calls kernel fun
-    params._kFun(Y, Y, params._kPar)
-    kpcaObj = KernelPCA(kernel="precomputed")
-    kpcaObj.fit(params._kPar._kMat)
+    if dMat is None:
+        params._kFun(Y, Y, params._kPar)
+    else:
+        params._kFun(Y, Y, params._kPar, dMat=dMat)
+    
+    res = None
+    if not init is None:
+        res = refineEig(params._kPar._kMat, init)
+        
+    if not res is None:
+        (params._A, params._l) = res
+    else:
+        from sklearn.decomposition import KernelPCA
+    
+        kpcaObj = KernelPCA(kernel="precomputed")
+        kpcaObj.fit(params._kPar._kMat)
 
-    params._A = kpcaObj.alphas_[:,0:k]
-    params._l = kpcaObj.lambdas_[0:k]
+        params._A = kpcaObj.alphas_[:,0:k]
+        params._l = kpcaObj.lambdas_[0:k]
 
-    if np.any(np.where(kpcaObj.lambdas_ <= 0)[0]):
-        dsinfo.warn("some unselected eigenvalues are negative!")
-    if np.any(np.where(params._l < 0)[0]):
-        dsinfo.warn("some eigenvalues are negative!")
+        if np.any(np.where(kpcaObj.lambdas_ <= 0)[0]):
+            dsinfo.warn("some unselected eigenvalues are negative!")
+        if np.any(np.where(params._l < 0)[0]):
+            dsinfo.warn("some eigenvalues are negative!")
 
     # normalize KPCA weight vectors
     normalize(params._A, params._l)   
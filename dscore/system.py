@@ -32,14 +32,11 @@ __email__   = "E-Mail: roland.kwitt@kitware.com"
 __status__  = "Development"
 
 
+import sys
 import copy
 import time
 import pickle
 import numpy as np
-from collections import deque
-from termcolor import colored
-from sklearn.utils.extmath import randomized_svd
-from scipy.linalg import eig
 
 # import pyds package contents
 import dsutil.dsinfo as dsinfo
@@ -48,9 +45,141 @@ import dsutil.dsutil as dsutil
 # import pyds classes
 from dsutil.dsutil import Timer
 from dscore.dsexcp import ErrorDS
-from dscore.dskpca import kpca, KPCAParam, rbfK, RBFParam
+from dscore.dskpca import kpca, KPCAParam, rbfK, RBFParam, sqEuclidean
+from dscore.dskpca import rbfKernel
 
 
+def _isMapped(arr):
+    """Check if an array (or the array it is a view of) is memory-mapped.
+    """
+    
+    while isinstance(arr, np.ndarray):
+        if isinstance(arr, np.memmap):
+            return True
+        arr = arr.base
+    return not arr is None and not isinstance(arr, (str, bytearray))
+
+
+def _compactArray(arr, dtype=None):
+    """Convert an array to dtype; views of (larger) in-memory arrays are 
+    copied, i.e., they no longer keep the viewed array alive.
+    """
+    
+    if dtype is None:
+        dtype = arr.dtype
+    if arr.flags.owndata or _isMapped(arr):
+        return arr.astype(dtype, copy=False)
+    return arr.astype(dtype)
+
+
+def footprint(obj, mapped=False):
+    """Approximate memory footprint of a model (in bytes).
+    
+    Counts the data of all (in-memory) arrays that are reachable from the 
+    object's attributes plus the size of the objects themselves; arrays are
+    counted once. The data of memory-mapped arrays is paged in on access 
+    (and shared between processes), i.e., it is not resident and is counted
+    separately.
+    
+    Parameters:
+    -----------
+    obj : object
+        LinearDS, NonLinearDS, KPCAParam instance, etc.
+        
+    mapped : boolean (default : False)
+        Return the size of the memory-mapped data instead.
+        
+    Returns:
+    --------
+    nBytes : int
+        Memory footprint (resident or memory-mapped).
+    """
+    
+    sizes = [0, 0]
+    _footprint(obj, set(), sizes)
+    return sizes[1] if mapped else sizes[0]
+
+
+def _footprint(obj, seen, sizes):
+    """Add the resident/memory-mapped bytes of obj to sizes (see footprint).
+    """
+    
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    
+    if isinstance(obj, np.ndarray):
+        # includes the data if the array owns its data
+        sizes[0] += sys.getsizeof(obj)
+        if _isMapped(obj):
+            sizes[1] += obj.nbytes
+            return
+        if obj.flags.owndata:
+            return
+        root = obj
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+        if not root is obj and id(root) in seen:
+            return
+        seen.add(id(root))
+        sizes[0] += root.nbytes
+        return
+    
+    sizes[0] += sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        sizes[0] += sys.getsizeof(obj.__dict__)
+        attrs = obj.__dict__.values()
+    elif hasattr(obj, '__slots__'):
+        attrs = [getattr(obj, k, None) for k in obj.__slots__]
+    else:
+        return
+    for val in attrs:
+        if isinstance(val, (np.ndarray, NonLinearDS, LinearDS, KPCAParam, 
+                            RBFParam)):
+            _footprint(val, seen, sizes)
+
+
+def _frozen(val):
+    """Read-only copy of a model attribute (see _snapshot).
+    """
+    
+    if isinstance(val, np.ndarray):
+        if not val.flags.writeable:
+            return val
+        val = val.copy()
+        val.flags.writeable = False
+        return val
+    if isinstance(val, (KPCAParam, RBFParam)):
+        val = copy.copy(val)
+        for key in val.__slots__:
+            if hasattr(val, key):
+                setattr(val, key, _frozen(getattr(val, key)))
+    return val
+    
+    
+def _snapshot(model, cls, skip=()):
+    """Create a read-only snapshot of a model.
+    
+    Parameters:
+    -----------
+    model : LinearDS or NonLinearDS instance (or subclass instance)
+        Source model.
+        
+    cls : class
+        Class of the snapshot (LinearDS or NonLinearDS).
+    
+    skip : list (default : ())
+        Attributes that are not part of the snapshot, e.g., the state of 
+        online DS's.
+    """
+    
+    snap = object.__new__(cls)
+    for (key, val) in model.__dict__.iteritems():
+        if not key in skip:
+            setattr(snap, key, _frozen(val))
+    return snap
+    
+    
 class NonLinearDS(object):
     """Non-linear dynamical system class.
     
@@ -67,7 +196,7 @@ class NonLinearDS(object):
         Textures", In: CVPR (2007)
     """
     
-    def __init__(self, nStates, kpcaParams, verbose=False):
+    def __init__(self, nStates, kpcaParams, verbose=False, compact=False):
         """Initialize nlds instance.
         
         
@@ -79,6 +208,9 @@ class NonLinearDS(object):
             
         verbose : boolean (default : False)
             Do we want verbose output ?
+            
+        compact : boolean (default : False)
+            Compact the NLDS after system identification (see compact).
         """
         
         self._Ahat = None
@@ -92,6 +224,7 @@ class NonLinearDS(object):
         self._kpcaParams = kpcaParams
         self._nStates = nStates
         self._verbose = verbose
+        self._compact = compact
 
         self._ready = False
 
@@ -140,7 +273,7 @@ class NonLinearDS(object):
         return True
 
     
-    def suboptimalSysID(self, Y):
+    def suboptimalSysID(self, Y, dMat=None, init=None):
         """System identification using KPCA.
     
         Updates the NLDS parameters.
@@ -149,6 +282,13 @@ class NonLinearDS(object):
         -----------
         Y : numpy array, shape = (N, D)
             Input data.
+            
+        dMat : numpy array, shape = (D, D) (default : None)
+            Precomputed pairwise (squared) Eucl. distances between the 
+            columns of Y.
+            
+        init : numpy array, shape = (D, nStates) (default : None)
+            Approximate KPCA eigenvectors to start from (see kpca).
         """
 
         nStates = self._nStates
@@ -156,9 +296,9 @@ class NonLinearDS(object):
         # call KPCA to get state estimate
         if self._verbose:
             with Timer('kpca'):
-                Xhat = kpca(Y, nStates, self._kpcaParams)
+                Xhat = kpca(Y, nStates, self._kpcaParams, dMat, init)
         else:
-            Xhat = kpca(Y, nStates, self._kpcaParams)
+            Xhat = kpca(Y, nStates, self._kpcaParams, dMat, init)
             
         # estimate rest of parameters
         _, tau = Y.shape
@@ -179,6 +319,198 @@ class NonLinearDS(object):
         self._initM0 = initM0
         self._initS0 = initS0
         
+        if getattr(self, '_compact', False):
+            self.compact()
+        
+        
+    def compact(self, dtype=None):
+        """Compact the NLDS (in place) for distance computation.
+        
+        Removes the state sequence and the state noise (i.e., _Xhat and 
+        _Vhat) and drops the (training) kernel matrix of the KPCA parameters.
+        The KPCA weights and data, which are needed for distance computation,
+        are kept (views are copied and optionally converted to dtype). A 
+        compacted NLDS can no longer be used for, e.g., naiveCompare.
+        
+        Parameters:
+        -----------
+        dtype : numpy dtype (default : None)
+            Convert the KPCA data and weight matrix to dtype, e.g., 
+            np.float32 to halve their memory footprint (changes distances 
+            slightly).
+            
+        Returns:
+        --------
+        self : NonLinearDS instance
+        """
+        
+        if hasattr(self, '_Xhat'):
+            self._nFrames = self._Xhat.shape[1]
+        for key in ['_Xhat', '_Vhat']:
+            if hasattr(self, key):
+                delattr(self, key)
+        
+        kpcaParams = self._kpcaParams
+        kpcaParams._kPar._kMat = None
+        if hasattr(kpcaParams._kPar, '_teS0'):
+            kpcaParams._kPar._teS0 = None
+        kpcaParams._data = _compactArray(kpcaParams._data, dtype)
+        kpcaParams._A = _compactArray(kpcaParams._A, dtype)
+        return self
+    
+    
+    def reduce(self, tol=1e-3, maxVecs=None):
+        """Reduced-set compression of the KPCA support data (in place).
+        
+        The KPCA basis vectors v_j = sum_i A_ij*phi(y_i) are approximated by
+        expansions over a subset of the data vectors y_i, selected by 
+        pivoted Cholesky decomposition of the (uncentered) kernel matrix. 
+        The weights of the reduced expansion are the least-squares solution
+        (i.e., the projection of v_j onto the span of the selected phi(y_i)).
+        Vectors are added until the relative errors err_j of all basis 
+        vectors are below tol; the inner products between the basis vectors
+        and any other NLDS's basis vector w (see dsdist.nldsIP) then change
+        by at most err_j*||v_j||*||w||.
+        
+        For a centered kernel, the basis vectors are those of the centered 
+        feature space (see dsdist._kpcaWeights); the reduced weights expand 
+        them directly, i.e., _kCen is reset.
+        
+        Since the cost of distance computation is proportional to the number
+        of data vectors, tol trades accuracy for speed. The (training) kernel
+        matrix and its column sums are dropped, i.e., a reduced NLDS can no
+        longer be used to compute testing kernels.
+        
+        Parameters:
+        -----------
+        tol : float (default : 1e-3)
+            Max. relative error ||v_j - Pv_j||/||v_j|| of the basis vectors.
+            
+        maxVecs : int (default : None)
+            Max. number of data vectors to keep (None: no limit).
+            
+        Returns:
+        --------
+        err : numpy.array, shape = (nStates, )
+            Relative errors of the basis vectors.
+        """
+        
+        kpcaParams = self._kpcaParams
+        kPar = kpcaParams._kPar
+        if not isinstance(kPar, RBFParam):
+            raise ErrorDS('only RBF kernels are supported!')
+        
+        Y = kpcaParams._data
+        A = np.asarray(kpcaParams._A, dtype=np.float64)
+        if kPar._kCen:
+            A = A - np.mean(A, axis=0)
+        D = Y.shape[1]
+        if maxVecs is None or maxVecs > D:
+            maxVecs = D
+        
+        # squared norms of the basis vectors (in feature space)
+        Y64 = np.asarray(Y, dtype=np.float64)
+        K = rbfKernel(Y64, Y64, kPar._sig2)
+        KA = K.dot(A)
+        vv = np.maximum(np.sum(A*KA, axis=0), np.spacing(1))
+        
+        # pivoted Cholesky, K ~ L^T*L; the squared norms of the projections
+        # of the basis vectors are the squared column norms of L*A
+        L = np.zeros((maxVecs, D))
+        LA = np.zeros((maxVecs, A.shape[1]))
+        d = np.diag(K).copy()
+        piv = []
+        err = np.ones(A.shape[1])
+        R = KA.copy()
+        while len(piv) < maxVecs and np.max(err) > tol:
+            r = len(piv)
+            # greedy: pivot with the largest reduction of the (relative) 
+            # squared errors of the basis vectors, i.e., 
+            # sum_j (L_r*A_j)^2/vv_j with L_r = (K_p - L_p^T*L)/sqrt(d_p)
+            valid = d > 1e-10
+            if not np.any(valid):
+                break
+            gain = np.zeros(D)
+            gain[valid] = np.sum(R[valid]**2/vv, axis=1)/d[valid]
+            p = np.argmax(gain)
+            L[r] = (K[p] - L[0:r,p].dot(L[0:r]))/np.sqrt(d[p])
+            d -= L[r]**2
+            d[p] = 0
+            piv.append(p)
+            LA[r] = L[r].dot(A)
+            R -= np.outer(L[r], LA[r])
+            err = np.sqrt(np.maximum(1 - np.sum(LA[0:r+1]**2, axis=0)/vv, 0))
+        
+        # least-squares weights of the reduced expansions
+        Kss = K[np.ix_(piv, piv)]
+        B = np.linalg.solve(Kss, KA[piv])
+        err = np.sqrt(np.maximum(1 - np.sum(B*Kss.dot(B), axis=0)/vv, 0))
+        
+        kpcaParams._data = Y[:,piv]
+        kpcaParams._A = B.astype(np.asarray(kpcaParams._A).dtype)
+        kPar._kMat = None
+        kPar._trS0 = None
+        kPar._kCen = False
+        return err
+        
+        
+    def numFrames(self):
+        """Number of frames the NLDS was estimated from.
+        """
+        
+        if hasattr(self, '_Xhat'):
+            return self._Xhat.shape[1]
+        return self._nFrames
+    
+    
+    def footprint(self, mapped=False):
+        """Memory footprint of the NLDS (in bytes, see footprint).
+        """
+        
+        return footprint(self, mapped)
+    
+    
+    def snapshot(self):
+        """Read-only snapshot of the NLDS.
+        
+        Parameter arrays (including the KPCA parameters) are copied and 
+        marked read-only (memory-mapped, read-only arrays are shared), i.e.,
+        the snapshot is not affected by later re-estimations and can be 
+        shared among threads, e.g., for distance computation.
+        
+        Returns:
+        --------
+        snap : NonLinearDS instance
+        """
+        
+        return _snapshot(self, NonLinearDS)
+        
+        
+    def gramSysID(self, Y, G, init=None):
+        """System identification using KPCA, given the Gram matrix of Y.
+        
+        Same as suboptimalSysID, but the pairwise distances (for the kernel)
+        are obtained from the Gram matrix, e.g., a block of a Gram matrix that
+        is shared among several (overlapping) windows.
+        
+        Parameters:
+        -----------
+        Y : numpy array, shape = (N, D)
+            Input data.
+            
+        G : numpy array, shape = (D, D)
+            Gram matrix Y^T*Y.
+            
+        init : numpy array, shape = (D, nStates) (default : None)
+            Approximate KPCA eigenvectors to start from (see kpca).
+        """
+        
+        g = np.diag(G)
+        dMat = g[:,np.newaxis] + g[np.newaxis,:] - 2*G
+        np.maximum(dMat, 0, dMat)
+        dMat.flat[::dMat.shape[0]+1] = 0
+        self.suboptimalSysID(Y, dMat, init)
+        
         
 class LinearDS(object):
     """Implements a linear dynamical system (LDS) of the form:
@@ -196,7 +528,7 @@ class LinearDS(object):
         C     : [N x k] - Observation matrix
     """
     
-    def __init__(self, nStates, approx=False, verbose=False):
+    def __init__(self, nStates, approx=False, verbose=False, compact=False):
         """Initialization.
         
         Parameters:
@@ -209,6 +541,9 @@ class LinearDS(object):
         
         verbose : boolean (default : False)
             Verbose output.
+            
+        compact : boolean (default : False)
+            Compact the LDS after system identification (see compact).
         """
     
         self._Ahat = None
@@ -223,6 +558,7 @@ class LinearDS(object):
         self._approx = approx
         self._verbose = verbose
         self._nStates = nStates
+        self._compact = compact
         
         if self._nStates < 0:
             raise ErrorDS("#states < 0!")
@@ -275,8 +611,18 @@ class LinearDS(object):
         if not A.shape[0] == A.shape[1]:
             raise ErrorDS("Input matrix not square!")
         
-        N = A.shape[1]
+        from scipy.linalg import eig
+        
         eVals, eVecs = eig(A)
+        return LinearDS._arrangeRJF(eVals, eVecs)
+        
+        
+    @staticmethod
+    def _arrangeRJF(eVals, eVecs):
+        """Arrange eigenvalues/-vectors in real Jordan form (see computeRJF).
+        """
+        
+        N = len(eVals)
         
         # sort by imaginary part
         idx = np.argsort(np.abs(np.imag(eVals)))
@@ -353,6 +699,20 @@ class LinearDS(object):
         
         A. Ravinchandran and R. Vidal., "Video Registration Using
         Dynamic Textures", PAMI 33(1), Jan. 2011
+        
+        Algorithmic strategy:
+        ---------------------
+        
+        P solves the Sylvester equation J*P = P*A (with J = Q*A*inv(Q) 
+        being the real Jordan form of A), subject to X^T*P = g^T*C. All 
+        solutions are of the form P = S*Q, where S commutes with J, i.e.,
+        S is block-diagonal with a scalar s for each real eigenvalue and a 
+        [[p, q], [-q, p]] block for each complex pair. The constraint then 
+        reads X^T*S = g^T*C*inv(Q) and determines S block-by-block, i.e., 
+        besides the eigendecomposition the cost is O(N^2) (instead of 
+        solving the N^2 x N^2 Kronecker system). In case the structured
+        solution is singular (e.g., for defective A), the least-squares 
+        solution of the Kronecker system is used.
         """
         
         if not A.shape[0] == A.shape[1]:
@@ -361,20 +721,63 @@ class LinearDS(object):
         if not A.shape[0] == C.shape[1]:
             raise ErrorDS("(A,C) not compatible!")
 
+        (J, Q, X) = LinearDS.computeRJF(A)
+        colSumC = np.asarray(np.sum(C, axis=0)).ravel()
+        
+        # X^T*S = g^T*C*inv(Q)
+        r = np.linalg.solve(np.asarray(Q).T, colSumC)
+        P = np.dot(LinearDS._commutingScale(r, X), Q)
+        
+        if not LinearDS._isRegular(P):
+            P = LinearDS._lsqJCFTransform(A, J, X, colSumC)
+        return np.asmatrix(P)
+    
+    
+    @staticmethod
+    def _commutingScale(r, X):
+        """Build S (commuting with the real Jordan form) s.t. X^T*S = r.
+        """
+        
+        N = len(r)
+        S = np.zeros((N, N))
+        cnt = 0
+        while cnt < N:
+            if cnt + 1 < N and X[cnt+1] == 0:
+                S[cnt:cnt+2,cnt:cnt+2] = [[+r[cnt], +r[cnt+1]],
+                                          [-r[cnt+1], +r[cnt]]]
+                cnt += 2
+            else:
+                S[cnt,cnt] = r[cnt]
+                cnt += 1
+        return S
+        
+        
+    @staticmethod
+    def _isRegular(P, tol=1e-12):
+        """Check if a transform is finite and well-conditioned.
+        """
+        
+        return np.all(np.isfinite(P)) and 1/np.linalg.cond(P) > tol
+    
+    
+    @staticmethod
+    def _lsqJCFTransform(A, J, X, colSumC):
+        """Least-squares solution of the (N^2 x N^2) Kronecker system for the
+        JCF transform (see computeJCFTransform).
+        """
+        
+        dsinfo.warn("singular JCF transform, using least-squares solution!")
+        
         N = A.shape[0]
         I = np.identity(N)
-        (J, Q, Cc) = LinearDS.computeRJF(A)
-        
-        M = np.kron(I, J) + np.kron(-A.T, I)
-        T = np.kron(I, Cc)
+        M = np.kron(I, J) + np.kron(-np.asarray(A).T, I)
+        T = np.kron(I, X)
         a = np.vstack((M, T))
         
-        colSumC = np.sum(C, axis=0)
-        x = np.zeros(N**2+len(colSumC),)
+        x = np.zeros(N**2+N,)
         x[-N:] = colSumC
-    
-        P = (np.linalg.pinv(a)*np.asmatrix(x).T).reshape((5,5),order='F')
-        return P
+        
+        return np.dot(np.linalg.pinv(a), x).reshape((N,N), order='F')
         
     
     def convertToJCF(self):
@@ -385,10 +788,12 @@ class LinearDS(object):
             raise ErrorDS("System not ready for conversion to JCF!")
         
         P = self.computeJCFTransform(self._Ahat, self._Chat)
+        Pinv = np.linalg.inv(P)
                 
-        self._ChatJCF = self._Chat*np.linalg.inv(P)
-        self._AhatJCF = P*self._Ahat*np.linalg.inv(P)
-        self._XhatJCF = P*self._Xhat
+        self._ChatJCF = self._Chat*Pinv
+        self._AhatJCF = P*self._Ahat*Pinv
+        if hasattr(self, '_Xhat'):
+            self._XhatJCF = P*self._Xhat
         self._initM0JCF = P*self._initM0
         
         #TODO: Transform the remaining parameters (required for synthesis)!
@@ -526,6 +931,7 @@ class LinearDS(object):
         Y = Y - Yavg[:,np.newaxis]
         
         if self._approx:
+            from sklearn.utils.extmath import randomized_svd
             if self._verbose:
                 with Timer('randomized_svd'):
                     (U, S, V) = randomized_svd(Y, nStates)
@@ -540,6 +946,75 @@ class LinearDS(object):
                 
         Chat = U[:,0:nStates]
         Xhat = (np.diag(S)[0:nStates,0:nStates] * np.asmatrix(V[0:nStates,:]))
+        
+        errorY = Y - Chat*Xhat
+        Rhat = np.var(errorY.ravel())
+        
+        self._estimateDynamics(Chat, Xhat, Yavg, Rhat)
+        
+        
+    def gramSysID(self, Y, G):
+        """Suboptimal system identification, given the Gram matrix of Y.
+        
+        Same as suboptimalSysID, but the SVD of the centered data is obtained
+        from an eigendecomposition of the (centered) Gram matrix, e.g., a 
+        block of a Gram matrix that is shared among several (overlapping) 
+        windows. This is cheaper than the SVD if D << N. Up to the signs of
+        the states, the estimates are equal.
+        
+        Parameters
+        ----------
+        Y : numpy array, shape = (N, D)
+            Input data with D observations as N-dimensional column vectors.
+            
+        G : numpy array, shape = (D, D)
+            Gram matrix Y^T*Y.
+        """
+        
+        nStates = self._nStates
+        (N, tau) = Y.shape
+        
+        Yavg = np.mean(Y, axis=1)
+        
+        # Gram matrix of the centered data, i.e., H*G*H with H = I - 1/D
+        gAvg = np.mean(G, axis=0)
+        Gc = G - gAvg[:,np.newaxis] - gAvg[np.newaxis,:] + np.mean(gAvg)
+        
+        # Gc = V*S^2*V^T (eigenvalues in ascending order)
+        (L, V) = np.linalg.eigh(Gc)
+        L = L[::-1][0:nStates]
+        V = V[:,::-1][:,0:nStates]
+        S = np.sqrt(np.maximum(L, np.spacing(1)))
+        
+        Chat = np.asarray((Y - Yavg[:,np.newaxis]).dot(V)/S)
+        Xhat = np.asmatrix(S[:,np.newaxis]*V.T)
+        
+        # residual has zero mean (rows of Xhat are orthogonal to 1)
+        Rhat = max(np.trace(Gc) - np.sum(L), 0)/(N*tau)
+        
+        self._estimateDynamics(Chat, Xhat, Yavg, Rhat)
+        
+        
+    def _estimateDynamics(self, Chat, Xhat, Yavg, Rhat):
+        """Estimate the remaining LDS parameters and update the LDS.
+        
+        Parameters
+        ----------
+        Chat : numpy array, shape = (N, nStates)
+            Observation matrix.
+            
+        Xhat : numpy matrix, shape = (nStates, D)
+            State sequence.
+            
+        Yavg : numpy array, shape = (N, )
+            Mean observation.
+            
+        Rhat : float
+            Observation noise variance.
+        """
+        
+        nStates = self._nStates
+        tau = Xhat.shape[1]
     
         initM0 = np.mean(Xhat[:,0], axis=1)
         initS0 = np.zeros((nStates, 1))
@@ -552,9 +1027,6 @@ class LinearDS(object):
         Ahat = phi2*np.linalg.pinv(phi1)
         Vhat = phi2-Ahat*phi1;
         Qhat = 1.0/Vhat.shape[1] * Vhat*Vhat.T 
-         
-        errorY = Y - Chat*Xhat
-        Rhat = np.var(errorY.ravel())
         
         # save parameters
         self._initS0 = initS0
@@ -568,6 +1040,64 @@ class LinearDS(object):
                 
         if self.check():
             self._ready = True
+        
+        if getattr(self, '_compact', False):
+            self.compact()
+            
+            
+    def compact(self, dtype=None):
+        """Compact the LDS (in place) for distance computation.
+        
+        Removes the state sequence (_Xhat, incl. its JCF version) and the 
+        mean observation (_Yavg), i.e., a compacted LDS can no longer be used
+        for synthesis or conversion to JCF. The observation matrix is copied
+        if it is a view (e.g., of the left singular vectors of the data).
+        
+        Parameters:
+        -----------
+        dtype : numpy dtype (default : None)
+            Convert the observation matrix to dtype, e.g., np.float32 to 
+            halve its memory footprint (changes distances slightly).
+            
+        Returns:
+        --------
+        self : LinearDS instance
+        """
+        
+        if hasattr(self, '_Xhat'):
+            self._nFrames = self._Xhat.shape[1]
+        for key in ['_Xhat', '_XhatJCF', '_Yavg']:
+            if hasattr(self, key):
+                delattr(self, key)
+        self._Chat = _compactArray(self._Chat, dtype)
+        return self
+        
+        
+    def numFrames(self):
+        """Number of frames the LDS was estimated from.
+        """
+        
+        if hasattr(self, '_Xhat'):
+            return self._Xhat.shape[1]
+        return self._nFrames
+        
+        
+    def footprint(self, mapped=False):
+        """Memory footprint of the LDS (in bytes, see footprint).
+        """
+        
+        return footprint(self, mapped)
+    
+    
+    def snapshot(self):
+        """Read-only snapshot of the LDS (see NonLinearDS.snapshot).
+        
+        Returns:
+        --------
+        snap : LinearDS instance
+        """
+        
+        return _snapshot(self, LinearDS)
  
  
     @staticmethod
@@ -618,75 +1148,662 @@ class LinearDS(object):
         err += np.sum(np.abs(lds2._initS0.ravel() - lds1._initS0.ravel()))                        
         err += np.sum(np.abs(lds2._Yavg.ravel() - lds1._Yavg.ravel()))                        
         return (lds, err)
-
-
-class OnlineNonLinearDS(NonLinearDS):
-    """Online version of non-linear DS (for real-time use).
-    """
-
-    def __init__(self, nStates, kpcaParam, bufLen, nShift=1, verbose=False):
-        """ Initialization.
+    
+    
+    @staticmethod
+    def _groupByStates(ldsList, batchSize):
+        """Split LDS's into batches of equal #states (indices into ldsList).
+        """
+        
+        groups = {}
+        for (i, lds) in enumerate(ldsList):
+            groups.setdefault(lds._Ahat.shape[0], []).append(i)
+        for idx in groups.itervalues():
+            for i in range(0, len(idx), batchSize):
+                yield idx[i:i+batchSize]
+    
+    
+    @staticmethod
+    def stateSpaceMapBatch(lds1, ldsList, batchSize=256):
+        """Batch version of stateSpaceMap, i.e., map the parameters of many 
+        LDS's into the space of lds1.
+        
+        LDS's with equal #states are stacked; the (pseudo-inverse) mappings 
+        are obtained from one product of the stacked observation matrices 
+        with lds1's observation matrix, using pinv(C) = pinv(C^T*C)*C^T.
         
         Parameters:
         -----------
-        nStates : int
-            Number of NLDS states.
+        lds1 : LinearDS instance
+            Target LDS.
             
-        kpcaParam: instance of KPCAParam
-            KPCA parameters.
-        
-        bufLen : int
-            Length of circular buffer to hold data vectors.
+        ldsList : list of LinearDS instances
+            Source LDS's.
             
-        nShift : int (default : 1)
-            Shift window by N vectors forward.
+        batchSize : int (default : 256)
+            Max. number of LDS's that are stacked.
             
-        verbose : boolean (default : False)
-            Verbose output.
-        """
-    
-        if nShift == 0:
-            raise ErrorDS('nShift == 0!')
-        NonLinearDS.__init__(self, nStates, kpcaParam, verbose)
-        
-        self._buf = deque(maxlen = bufLen)
-        [self._buf.append(None) for i in range(bufLen)]
+        Returns:
+        --------
+        ldsMapped : list of LinearDS instances
+            New instances of the source LDS's (with UPDATED parameters).
             
-        self._nShift = nShift
-        self._cnt = nShift - 1
-   
-   
-    def hasChanged(self):
-        """Did the DS change ?
+        err : numpy array, shape = (len(ldsList),)
+            Absolute differences between the vectorized parameter sets before
+            the state-space mapping (see stateSpaceMap).
         """
-        return self._cnt == self._nShift    
         
+        ldsMapped = [None]*len(ldsList)
+        err = np.zeros((len(ldsList),))
         
-    def update(self, x):
-        """Update NLDS model (i.e., re-estimate if required)
+        C1 = np.asarray(lds1._Chat)
+        A1 = np.asarray(lds1._Ahat)
+        Q1 = np.asarray(lds1._Qhat)
+        
+        for idx in LinearDS._groupByStates(ldsList, batchSize):
+            batch = [ldsList[i] for i in idx]
+            
+            C2 = np.array([np.asarray(l._Chat) for l in batch])
+            A2 = np.array([np.asarray(l._Ahat) for l in batch])
+            Q2 = np.array([np.asarray(l._Qhat) for l in batch])
+            m0 = np.array([np.asarray(l._initM0).reshape(-1,1) 
+                           for l in batch])
+            s0 = np.array([np.asarray(l._initS0).ravel() for l in batch])
+            
+            # F = pinv(C2^T*C2)*(C2^T*C1), with one product for all C2^T*C1
+            (M, D, n2) = C2.shape
+            C2tC1 = np.dot(C2.transpose(0,2,1).reshape(M*n2, D), C1)
+            C2tC1 = C2tC1.reshape(M, n2, C1.shape[1])
+            C2tC2 = np.matmul(C2.transpose(0,2,1), C2)
+            F = np.matmul(np.linalg.pinv(C2tC2), C2tC1)
+            Ft = F.transpose(0,2,1)
+            
+            Chat = np.matmul(C2, F)
+            Ahat = np.matmul(np.matmul(Ft, A2), F)
+            Qhat = np.matmul(np.matmul(Ft, Q2), F)
+            initM0 = np.matmul(Ft, m0)
+            initS0 = np.einsum('mji,mj->mi', F**2, s0)
+            
+            # errors of the parameter sets before the mapping
+            e = (np.sum(np.abs(C2 - C1), axis=(1,2)) +
+                 np.sum(np.abs(A2 - A1), axis=(1,2)) +
+                 np.sum(np.abs(Q2 - Q1), axis=(1,2)))
+            
+            for (j, i) in enumerate(idx):
+                lds2 = ldsList[i]
+                lds = copy.copy(lds2)
+                lds._Chat = np.asmatrix(Chat[j])
+                lds._Ahat = np.asmatrix(Ahat[j])
+                lds._Qhat = np.asmatrix(Qhat[j])
+                lds._initM0 = np.asmatrix(initM0[j])
+                lds._initS0 = initS0[j]
+                ldsMapped[i] = lds
+                
+                err[i] = e[j]
+                err[i] += np.sum(np.abs(np.ravel(lds2._Rhat) - 
+                                        np.ravel(lds1._Rhat)))
+                err[i] += np.sum(np.abs(np.ravel(lds2._initM0) - 
+                                        np.ravel(lds1._initM0)))
+                err[i] += np.sum(np.abs(np.ravel(lds2._initS0) - 
+                                        np.ravel(lds1._initS0)))
+                if hasattr(lds1, '_Yavg') and hasattr(lds2, '_Yavg'):
+                    err[i] += np.sum(np.abs(np.ravel(lds2._Yavg) - 
+                                            np.ravel(lds1._Yavg)))
+        return (ldsMapped, err)
+    
+    
+    @staticmethod
+    def convertToJCFBatch(ldsList, batchSize=256):
+        """Batch version of convertToJCF, i.e., convert many LDS's to JCF.
+        
+        LDS's with equal #states are stacked; eigendecompositions, the 
+        solutions for the JCF transforms and the transformed parameters are
+        computed for all LDS's of a stack at once (see computeJCFTransform).
+        The LDS's are UPDATED (as with convertToJCF).
         
         Parameters:
         -----------
-        x : numpy.array, shape = (N, )
-            New data vector.
-        """
-        
-        self._buf.append(x)
+        ldsList : list of LinearDS instances
+            LDS's to convert.
             
-        if self._buf.count(None) > 0:
-            return
-        self._cnt -= 1
+        batchSize : int (default : 256)
+            Max. number of LDS's that are stacked.
+        """
         
-        if self._cnt == 0 or self._nShift == 1:
-            self.suboptimalSysID(np.asarray(self._buf).T)
-            self._cnt = self._nShift
+        for lds in ldsList:
+            if not lds.check():
+                raise ErrorDS("System not ready for conversion to JCF!")
+        
+        for idx in LinearDS._groupByStates(ldsList, batchSize):
+            batch = [ldsList[i] for i in idx]
+            
+            A = np.array([np.asarray(l._Ahat) for l in batch])
+            C = np.array([np.asarray(l._Chat) for l in batch])
+            colSumC = np.sum(C, axis=1)
+            
+            # eigendecompositions of all A's at once
+            (eVals, eVecs) = np.linalg.eig(A)
+            rjf = [LinearDS._arrangeRJF(eVals[j], eVecs[j]) 
+                   for j in range(len(batch))]
+            Q = np.array([Qj for (_, Qj, _) in rjf])
+            
+            # X^T*S = g^T*C*inv(Q) for all LDS's
+            r = np.linalg.solve(Q.transpose(0,2,1), colSumC[:,:,np.newaxis])
+            S = np.array([LinearDS._commutingScale(r[j,:,0], rjf[j][2])
+                          for j in range(len(batch))])
+            P = np.matmul(S, Q)
+            
+            for j in range(len(batch)):
+                if not LinearDS._isRegular(P[j]):
+                    (Jj, _, Xj) = rjf[j]
+                    P[j] = LinearDS._lsqJCFTransform(A[j], Jj, Xj, 
+                                                     colSumC[j])
+            Pinv = np.linalg.inv(P)
+            
+            ChatJCF = np.matmul(C, Pinv)
+            AhatJCF = np.matmul(np.matmul(P, A), Pinv)
+            
+            for (j, lds) in enumerate(batch):
+                Pj = np.asmatrix(P[j])
+                lds._ChatJCF = np.asmatrix(ChatJCF[j])
+                lds._AhatJCF = np.asmatrix(AhatJCF[j])
+                if hasattr(lds, '_Xhat'):
+                    lds._XhatJCF = Pj*lds._Xhat
+                lds._initM0JCF = Pj*lds._initM0
+
+
+class ChangeSchedule(object):
+    """Adaptive re-estimation schedule for the online DS's.
+    
+    The online DS's feed a (cheap) per-frame change measure into the schedule, 
+    i.e., the excess of the new frame's model residual over the average in-
+    window residual (0 means: the frame is explained as well as the frames 
+    the model was estimated from). Change is accumulated since the last 
+    estimation and the schedule decides whether to
+    
+        - skip a regularly scheduled (i.e., every nShift frames) re-estimation
+          in case the accumulated change is below loTh (but never more than
+          maxSkip times in a row), or to
+        - force an early re-estimation in case the accumulated change exceeds
+          hiTh.
+    
+    With the default settings (loTh = 0, hiTh = inf), the schedule is not 
+    adaptive, i.e., the DS is re-estimated every nShift frames.
+    """
+    
+    def __init__(self, loTh=0.0, hiTh=np.inf, maxSkip=np.inf):
+        """Initialization.
+        
+        Parameters:
+        -----------
+        loTh : float (default : 0)
+            Skip re-estimation if accumulated change < loTh.
+            
+        hiTh : float (default : inf)
+            Force re-estimation if accumulated change >= hiTh.
+        
+        maxSkip : int (default : inf)
+            Max. number of consecutively skipped re-estimations.
+        """
+        
+        if loTh > hiTh:
+            raise ErrorDS('loTh > hiTh!')
+        
+        self._loTh = loTh
+        self._hiTh = hiTh
+        self._maxSkip = maxSkip
+        self._acc = 0.0
+        self._nSkip = 0
+        self._stats = { "executed" : 0, "skipped" : 0, "forced" : 0 }
+        
+        
+    def isAdaptive(self):
+        """Does the schedule need the change measure ?
+        """
+        return self._loTh > 0 or self._hiTh < np.inf
+        
+        
+    def observe(self, change):
+        """Accumulate the change measure of a new frame.
+        """
+        self._acc += change
+        
+        
+    def decide(self, due):
+        """Decide whether to re-estimate.
+        
+        Parameters:
+        -----------
+        due : boolean
+            Is a re-estimation regularly scheduled ?
+            
+        Returns:
+        --------
+        estimate : boolean
+            True if the DS needs to be re-estimated.
+        """
+        
+        stats = self._stats
+        if stats["executed"] > 0:
+            if self._acc >= self._hiTh:
+                stats["forced"] += 1
+            elif not due:
+                return False
+            elif self._acc < self._loTh and self._nSkip < self._maxSkip:
+                stats["skipped"] += 1
+                self._nSkip += 1
+                return False
+        elif not due:
+            return False
+            
+        stats["executed"] += 1
+        self._nSkip = 0
+        self._acc = 0.0
+        return True
+        
+        
+class RingBuffer(object):
+    """Preallocated ring buffer of data vectors (frames).
+    
+    Frames are stored as rows of a (2*bufLen) x N array; each frame is 
+    written twice (at position i and i+bufLen), s.t. the last L frames are
+    always contiguous, i.e., windows are available as views (no copies) 
+    in temporal order. Instead of placeholders, the buffer records its fill
+    level. Storage is allocated on the first append (dtype of the first 
+    frame, unless given).
+    """
+    
+    def __init__(self, bufLen, dtype=None):
+        """Initialization.
+        
+        Parameters:
+        -----------
+        bufLen : int
+            Number of frames.
+            
+        dtype : numpy dtype (default : None)
+            Data type of the storage (None: dtype of the first frame).
+        """
+        
+        if bufLen <= 0:
+            raise ErrorDS('bufLen <= 0!')
+        
+        self._bufLen = bufLen
+        self._dtype = dtype
+        self._data = None
+        self._pos = 0
+        self._n = 0
+        self._total = 0
+        
+        
+    def __len__(self):
+        """Number of buffered frames (fill level).
+        """
+        return self._n
+        
+        
+    def full(self):
+        """Is the buffer filled ?
+        """
+        return self._n == self._bufLen
+        
+        
+    def append(self, x):
+        """Append a new data vector (copied into the buffer).
+        
+        Parameters:
+        -----------
+        x : numpy.array, shape = (N, )
+            New data vector.
+        """
+        
+        if self._data is None:
+            dtype = x.dtype if self._dtype is None else self._dtype
+            self._data = np.empty((2*self._bufLen, len(x)), dtype=dtype)
+        
+        L = self._bufLen
+        self._data[self._pos] = x
+        self._data[self._pos+L] = x
+        self._pos = (self._pos + 1) % L
+        self._n = min(self._n + 1, L)
+        self._total += 1
+        
+        
+    def extend(self, X):
+        """Append several data vectors at once.
+        
+        Parameters:
+        -----------
+        X : numpy.array, shape = (N, k)
+            New data vectors (as columns, oldest first).
+        """
+        
+        (N, k) = X.shape
+        if k == 0:
+            return
+        if self._data is None:
+            dtype = X.dtype if self._dtype is None else self._dtype
+            self._data = np.empty((2*self._bufLen, N), dtype=dtype)
+        
+        # only the last bufLen vectors are kept
+        L = self._bufLen
+        self._total += k
+        if k > L:
+            self._pos = (self._pos + k - L) % L
+            self._n = L
+            X = X[:,k-L:]
+            k = L
+            
+        idx = (self._pos + np.arange(k)) % L
+        self._data[idx] = X.T
+        self._data[idx+L] = X.T
+        self._pos = (self._pos + k) % L
+        self._n = min(self._n + k, L)
+        
+        
+    def window(self, L=None):
+        """Get the last L frames (view of the buffer, oldest frame first).
+        
+        The view is only valid until the next append, i.e., copy it if the 
+        data needs to be kept.
+        
+        Parameters:
+        -----------
+        L : int (default : None)
+            Window length (<= fill level; None: fill level).
+            
+        Returns:
+        --------
+        Y : numpy.array, shape = (N, L)
+            Data matrix (read-only view).
+        """
+        
+        if L is None:
+            L = self._n
+        if L > self._n:
+            raise ErrorDS('window exceeds buffered data!')
+        
+        end = self._pos + self._bufLen
+        Y = self._data[end-L:end].T
+        Y.flags.writeable = False
+        return Y
+        
+        
+def _updateMany(ds, frames, callback=None, gram=False):
+    """Bulk update of an online DS (see OnlineLinearDS.updateMany).
+    """
+    
+    buf = ds._buf
+    sched = ds._schedule
+    L = buf._bufLen
+    n = frames.shape[1]
+    
+    changed = []
+    ds._changed = False
+    
+    # with gram=True, frames are processed in chunks of L frames; all windows
+    # that end in a chunk are blocks of the Gram matrix of the chunk and the
+    # frames buffered before the chunk (i.e., overlaps are computed once)
+    chunkLen = L if gram else max(n, 1)
+    for c0 in range(0, n, chunkLen):
+        chunk = frames[:,c0:c0+chunkLen]
+        m = chunk.shape[1]
+        
+        (Z, G) = (None, None)
+        if gram:
+            b = len(buf)
+            Z = chunk if b == 0 else np.hstack((buf.window(), chunk))
+        
+        t = 0
+        while t < m:
+            # rampup time ... just buffer the frames (the frame that fills
+            # the buffer is the first to be scheduled)
+            if len(buf) < L - 1:
+                k = min(m - t, L - 1 - len(buf))
+                buf.extend(chunk[:,t:t+k])
+                t += k
+                continue
+            
+            # frames up to the next regularly scheduled re-estimation; the
+            # model does not change before, i.e., change measures of these
+            # frames can be computed at once
+            cnt = ds._cnt
+            k = 1 if ds._nShift == 1 else (cnt if cnt > 0 else m - t)
+            seg = chunk[:,t:t+k]
+            
+            measure = sched.isAdaptive() and sched._stats["executed"] > 0
+            if measure:
+                change = np.atleast_1d(ds.changeMeasure(seg))
+            
+            for j in range(seg.shape[1]):
+                if measure:
+                    sched.observe(change[j])
+                due = cnt - (j+1) == 0 or ds._nShift == 1
+                estimate = sched.decide(due)
+                if estimate or due:
+                    break
+            
+            buf.extend(seg[:,0:j+1])
+            ds._cnt = cnt - (j+1)
+            t += j+1
+            ds._changed = estimate
+            
+            if estimate:
+                if gram:
+                    if G is None:
+                        Z64 = Z.astype(np.float64)
+                        G = Z64.T.dot(Z64)
+                    end = b + t
+                    ds._reestimate(Z[:,end-L:end], G[end-L:end,end-L:end])
+                else:
+                    ds._reestimate(buf.window())
+                changed.append(c0 + t - 1)
+                if not callback is None:
+                    callback(c0 + t - 1)
+            
+            if due or estimate:
+                ds._cnt = ds._nShift
+    return changed
+    
+    
+class OnlineNonLinearDS(NonLinearDS):
+    """Online version of non-linear DS (for real-time use).
+    """
+    
+    # snapshot class and the (online) attributes that are not part of it
+    _SNAPSHOT_CLASS = NonLinearDS
+    _ONLINE_STATE = ('_buf', '_nShift', '_cnt', '_changed', '_schedule', 
+                     '_kS1', '_warmStart', '_lastEst', '_prof')
+
+    def __init__(self, nStates, kpcaParam, bufLen, nShift=1, verbose=False,
+                 schedule=None, warmStart=False):
+        """ Initialization.
+        
+        Parameters:
+        -----------
+        nStates : int
+            Number of NLDS states.
+            
+        kpcaParam: instance of KPCAParam
+            KPCA parameters.
+        
+        bufLen : int
+            Length of circular buffer to hold data vectors.
+            
+        nShift : int (default : 1)
+            Shift window by N vectors forward.
+            
+        verbose : boolean (default : False)
+            Verbose output.
+            
+        schedule : ChangeSchedule instance (default : None)
+            Adaptive re-estimation schedule (None: every nShift frames).
+            
+        warmStart : boolean (default : False)
+            Start KPCA from the eigenvectors of the previous window (shifted
+            by the number of new frames, see kpca), i.e., only a few LOBPCG
+            iterations are run instead of a full eigendecomposition. Only
+            used for windows of >= 100 frames (see refineEig).
+        """
+    
+        if nShift == 0:
+            raise ErrorDS('nShift == 0!')
+        NonLinearDS.__init__(self, nStates, kpcaParam, verbose)
+        
+        self._buf = RingBuffer(bufLen)
+            
+        self._nShift = nShift
+        self._cnt = nShift - 1
+        self._changed = False
+        
+        if schedule is None:
+            schedule = ChangeSchedule()
+        self._schedule = schedule
+        
+        # mean of the (uncentered) training kernel of the current window
+        self._kS1 = 0.0
+        
+        # frame count (see RingBuffer) at the last re-estimation
+        self._warmStart = warmStart
+        self._lastEst = 0
+   
+   
+    def hasChanged(self):
+        """Did the DS change ?
+        """
+        return self._changed
+        
+        
+    def stats(self):
+        """Get #executed/#skipped/#forced re-estimations.
+        """
+        return dict(self._schedule._stats)
+        
+        
+    def setProfiler(self, prof):
+        """Time re-estimations (as stage 'sysid') with a dsprof.Profiler.
+        """
+        self._prof = prof
+        
+        
+    def snapshot(self):
+        """Read-only snapshot of the current model (w/o the online state).
+        """
+        return _snapshot(self, self._SNAPSHOT_CLASS, self._ONLINE_STATE)
+        
+        
+    def changeMeasure(self, x):
+        """Change measure of a new frame w.r.t. the current window.
+        
+        Computes the squared (RBF) kernel space distance between x and the 
+        mean of the window data in feature space, relative to the average 
+        in-window distance.
+        
+        Parameters:
+        -----------
+        x : numpy.array, shape = (N, ) or (N, k)
+            New data vector (or k new data vectors).
+            
+        Returns:
+        --------
+        change : float (or numpy.array, shape = (k, ))
+            Excess distance (>= 0).
+        """
+        
+        Y = self._kpcaParams._data
+        kPar = self._kpcaParams._kPar
+        
+        if x.ndim == 1:
+            d = np.sum((Y - x[:,np.newaxis])**2, axis=0)
+        else:
+            d = sqEuclidean(Y, x)
+        m = 1 - 2*np.mean(np.exp(-d/kPar._sig2), axis=0) + self._kS1
+        return np.maximum(m/max(1 - self._kS1, np.spacing(1)) - 1, 0)
+        
+        
+    def update(self, x):
+        """Update NLDS model (i.e., re-estimate if required)
+        
+        Parameters:
+        -----------
+        x : numpy.array, shape = (N, )
+            New data vector.
+        """
+        
+        self._buf.append(x)
+        self._changed = False
+            
+        if not self._buf.full():
+            return
+        self._cnt -= 1
+        
+        if (self._schedule.isAdaptive() and
+            self._schedule._stats["executed"] > 0):
+            self._schedule.observe(self.changeMeasure(x))
+        
+        due = self._cnt == 0 or self._nShift == 1
+        if self._schedule.decide(due):
+            self._reestimate(self._buf.window())
+            
+        if due or self._changed:
+            self._cnt = self._nShift
+            
+            
+    def updateMany(self, frames, callback=None, gram=False):
+        """Update NLDS model with a block of frames (see 
+        OnlineLinearDS.updateMany).
+        """
+        
+        return _updateMany(self, frames, callback, gram)
+        
+        
+    def _reestimate(self, Y, G=None):
+        """Re-estimate the NLDS from a window (and its Gram matrix).
+        """
+        
+        tStart = time.time()
+        
+        # KPCA keeps the data, i.e., the window needs to be copied
+        Y = Y.copy(order='F')
+        
+        # previous eigenvectors, w/o the frames that left the window and 
+        # zero for the frames that entered
+        init = None
+        shift = self._buf._total - self._lastEst
+        kpcaParams = self._kpcaParams
+        if (self._warmStart and not kpcaParams._A is None and 
+            shift < Y.shape[1]):
+            A = np.asarray(kpcaParams._A)*np.sqrt(np.abs(kpcaParams._l))
+            init = np.zeros(A.shape)
+            init[0:A.shape[0]-shift] = A[shift:]
+        
+        if G is None:
+            self.suboptimalSysID(Y, None, init)
+        else:
+            self.gramSysID(Y, G, init)
+        self._changed = True
+        self._lastEst = self._buf._total
+        
+        kPar = self._kpcaParams._kPar
+        if kPar._kCen:
+            self._kS1 = kPar._trS1
+        else:
+            self._kS1 = np.mean(kPar._kMat)
+        if hasattr(self, '_prof'):
+            self._prof.add('sysid', time.time() - tStart)
         
 
 class OnlineLinearDS(LinearDS):
     """Online version of a linear DS (for real-time use).
     """
     
-    def __init__(self, nStates, bufLen, nShift=1, approx=False, verbose=False):
+    # snapshot class and the (online) attributes that are not part of it
+    _SNAPSHOT_CLASS = LinearDS
+    _ONLINE_STATE = ('_buf', '_nShift', '_cnt', '_changed', '_schedule',
+                     '_basis', '_prof')
+    
+    def __init__(self, nStates, bufLen, nShift=1, approx=False, verbose=False,
+                 schedule=None, basis=None):
         """ Initialization.
         
         Parameters:
@@ -705,6 +1822,13 @@ class OnlineLinearDS(LinearDS):
             
         verbose : boolean (default : False)
             Verbose output.
+            
+        schedule : ChangeSchedule instance (default : None)
+            Adaptive re-estimation schedule (None: every nShift frames).
+            
+        basis : dsbasis.ObservationBasis instance (default : None)
+            Global observation basis; frames are projected into the basis,
+            i.e., the LDS is estimated on (and lives in) the basis.
         """
             
         if nShift == 0:
@@ -713,18 +1837,71 @@ class OnlineLinearDS(LinearDS):
         # call base class init
         LinearDS.__init__(self, nStates, approx, verbose)
             
-        # initialize buffer and fill with None's
-        self._buf = deque(maxlen = bufLen)
-        [self._buf.append(None) for i in range(bufLen)]
+        self._buf = RingBuffer(bufLen)
             
         self._nShift = nShift
         self._cnt = nShift - 1
+        self._changed = False
+        
+        if schedule is None:
+            schedule = ChangeSchedule()
+        self._schedule = schedule
+        
+        if not basis is None:
+            self._basis = basis
+            self._basisId = basis.id()
        
        
     def hasChanged(self):
         """Did the DS change ?
         """
-        return self._cnt == self._nShift     
+        return self._changed
+        
+        
+    def stats(self):
+        """Get #executed/#skipped/#forced re-estimations.
+        """
+        return dict(self._schedule._stats)
+        
+        
+    def setProfiler(self, prof):
+        """Time re-estimations (as stage 'sysid') with a dsprof.Profiler.
+        """
+        self._prof = prof
+        
+        
+    def snapshot(self):
+        """Read-only snapshot of the current model (w/o the online state).
+        """
+        return _snapshot(self, self._SNAPSHOT_CLASS, self._ONLINE_STATE)
+        
+        
+    def changeMeasure(self, x):
+        """Change measure of a new frame w.r.t. the current window.
+        
+        Computes the residual of projecting the (mean-subtracted) frame onto 
+        the current observation matrix, relative to the average in-window 
+        residual (i.e., the observation noise variance).
+        
+        Parameters:
+        -----------
+        x : numpy.array, shape = (N, ) or (N, k)
+            New data vector (or k new data vectors).
+            
+        Returns:
+        --------
+        change : float (or numpy.array, shape = (k, ))
+            Excess residual (>= 0).
+        """
+        
+        C = np.asarray(self._Chat)
+        if x.ndim == 1:
+            y = x - self._Yavg
+        else:
+            y = x - self._Yavg[:,np.newaxis]
+        e = y - C.dot(C.T.dot(y))
+        return np.maximum(np.mean(e**2, axis=0)/max(self._Rhat, np.spacing(1))
+                          - 1, 0)
 
             
     def update(self, x):
@@ -735,15 +1912,289 @@ class OnlineLinearDS(LinearDS):
         x : numpy.array, shape = (N, )
             New data vector.
         """
-            
+        
+        if hasattr(self, '_basis'):
+            x = self._basis.project(x)
         self._buf.append(x)
+        self._changed = False
             
         # rampup time ... do nothin
-        if self._buf.count(None) > 0:
+        if not self._buf.full():
+            return
+        
+        self._cnt -= 1
+        
+        if (self._schedule.isAdaptive() and
+            self._schedule._stats["executed"] > 0):
+            self._schedule.observe(self.changeMeasure(x))
+        
+        due = self._cnt == 0 or self._nShift == 1
+        if self._schedule.decide(due):
+            self._reestimate(self._buf.window())
+            
+        if due or self._changed:
+            self._cnt = self._nShift
+            
+            
+    def updateMany(self, frames, callback=None, gram=False):
+        """Update LDS model with a block of frames.
+        
+        Same as calling update() for each frame (re-estimations happen at 
+        the same frames), but frames are buffered and change measures are
+        computed block-wise.
+        
+        Parameters:
+        -----------
+        frames : numpy.array, shape = (N, n)
+            New data vectors (as columns, oldest first).
+            
+        callback : function (default : None)
+            Called as callback(i) after each re-estimation, i.e., while the
+            model is that of the window ending with frame i.
+            
+        gram : boolean (default : False)
+            Estimate the LDS's from the Gram matrix of the frames (see 
+            gramSysID), which is computed once for all overlapping windows
+            of a block (up to the signs of the states, the estimates are 
+            equal).
+            
+        Returns:
+        --------
+        changed : list
+            Indices of the frames after which the LDS was re-estimated.
+        """
+        
+        if hasattr(self, '_basis'):
+            frames = self._basis.project(frames)
+        return _updateMany(self, frames, callback, gram)
+        
+        
+    def _reestimate(self, Y, G=None):
+        """Re-estimate the LDS from a window (and its Gram matrix).
+        """
+        
+        tStart = time.time()
+        if G is None:
+            self.suboptimalSysID(Y)
+        else:
+            self.gramSysID(Y, G)
+        self._changed = True
+        if hasattr(self, '_prof'):
+            self._prof.add('sysid', time.time() - tStart)
+
+
+class SharedWindowBuffer(object):
+    """Frame buffer (incl. Gram matrix) shared by windows of several lengths.
+    
+    Holds the last bufLen frames together with their Gram matrix, which is 
+    updated incrementally (one N x bufLen product per frame). The data and
+    Gram matrix of the last L <= bufLen frames are then available without
+    any further computation. Frames are stored as float64, i.e., the Gram
+    update needs no (per-frame) converted copy of the buffer.
+    """
+    
+    def __init__(self, bufLen):
+        """Initialization.
+        
+        Parameters:
+        -----------
+        bufLen : int
+            Length of circular buffer to hold data vectors.
+        """
+        
+        self._buf = RingBuffer(bufLen, np.float64)
+        self._gram = np.zeros((bufLen, bufLen))
+        self._bufLen = bufLen
+        self._n = 0
+        
+        
+    def append(self, x):
+        """Append a new data vector.
+        
+        Parameters:
+        -----------
+        x : numpy.array, shape = (N, )
+            New data vector.
+        """
+        
+        L = self._bufLen
+        G = self._gram
+        
+        # shift Gram matrix, s.t. the newest frame is the last row/column
+        G[0:L-1,0:L-1] = G[1:L,1:L]
+        self._buf.append(x)
+        self._n = min(self._n + 1, L)
+        
+        n = self._n
+        W = self._buf.window()
+        g = W.T.dot(W[:,n-1])
+        G[L-n:,L-1] = g
+        G[L-1,L-n:] = g
+        
+        
+    def window(self, L):
+        """Get the data and the Gram matrix of the last L frames.
+        
+        Parameters:
+        -----------
+        L : int
+            Window length (<= number of buffered frames).
+            
+        Returns:
+        --------
+        Y : numpy.array, shape = (N, L)
+            Data matrix (read-only view, see RingBuffer.window).
+        
+        G : numpy.array, shape = (L, L)
+            Gram matrix Y^T*Y.
+        """
+        
+        if L > self._n:
+            raise ErrorDS('window exceeds buffered data!')
+        
+        return (self._buf.window(L), 
+                self._gram[self._bufLen-L:,self._bufLen-L:].copy())
+        
+        
+class OnlineMultiDS(object):
+    """Online DS's of several window lengths (for real-time use).
+    
+    All DS's share one frame buffer and the Gram matrix of the buffered 
+    frames (see SharedWindowBuffer), from which the DS's are estimated via
+    gramSysID(). All DS's are re-estimated at the same time (every nShift 
+    frames) as soon as their window is filled, i.e., there is no adaptive
+    schedule (and no warm start of KPCA).
+    """
+    
+    def __init__(self, models, nShift=1, basis=None):
+        """Initialization.
+        
+        Parameters:
+        -----------
+        models : dict
+            Window length -> (LinearDS or NonLinearDS instance) mapping.
+            
+        nShift : int (default : 1)
+            Shift windows by N vectors forward.
+            
+        basis : dsbasis.ObservationBasis instance (default : None)
+            Global observation basis (LinearDS's only, see OnlineLinearDS).
+        """
+        
+        if nShift == 0:
+            raise ErrorDS('nShift == 0!')
+        
+        if not basis is None:
+            for model in models.values():
+                if not isinstance(model, LinearDS):
+                    raise ErrorDS('observation bases require LDS models!')
+                model._basisId = basis.id()
+            self._basis = basis
+        
+        self._models = models
+        self._lens = sorted(models)
+        self._buf = SharedWindowBuffer(self._lens[-1])
+        self._nShift = nShift
+        self._cnt = nShift - 1
+        self._changed = []
+        self._executed = 0
+        
+        
+    def lengths(self):
+        """Get the window lengths (in ascending order).
+        """
+        return list(self._lens)
+        
+        
+    def model(self, L):
+        """Get the DS of window length L.
+        """
+        return self._models[L]
+        
+        
+    def changed(self):
+        """Get the window lengths of the DS's that changed in the last update.
+        """
+        return list(self._changed)
+        
+        
+    def hasChanged(self):
+        """Did any DS change ?
+        """
+        return len(self._changed) > 0
+        
+        
+    def check(self):
+        """Check validity of the changed DS's.
+        """
+        
+        for L in self._changed:
+            if not self._models[L].check():
+                return False
+        return True
+        
+        
+    def stats(self):
+        """Get #executed/#skipped/#forced re-estimations.
+        """
+        return { "executed" : self._executed, "skipped" : 0, "forced" : 0 }
+        
+        
+    def setProfiler(self, prof):
+        """Time re-estimations (of all DS's) (as stage 'sysid') with a dsprof.Profiler.
+        """
+        self._prof = prof
+        
+        
+        
+        
+    def update(self, x):
+        """Update DS models (i.e., re-estimate if required)
+        
+        Parameters:
+        -----------
+        x : numpy.array, shape = (N, )
+            New data vector.
+        """
+        
+        if hasattr(self, '_basis'):
+            x = self._basis.project(x)
+        self._buf.append(x)
+        self._changed = []
+        
+        # rampup time (of the shortest window) ... do nothin
+        if self._buf._n < self._lens[0]:
             return
         
         self._cnt -= 1
         
         if self._cnt == 0 or self._nShift == 1:
-            self.suboptimalSysID(np.asarray(self._buf).T)
+            tStart = time.time()
+            for L in self._lens:
+                if L > self._buf._n:
+                    break
+                (Y, G) = self._buf.window(L)
+                # KPCA keeps the data, i.e., the window needs to be copied
+                if isinstance(self._models[L], NonLinearDS):
+                    Y = Y.copy(order='F')
+                self._models[L].gramSysID(Y, G)
+                self._changed.append(L)
+                self._executed += 1
             self._cnt = self._nShift
+            if hasattr(self, '_prof') and len(self._changed) > 0:
+                self._prof.add('sysid', time.time() - tStart)
+            
+            
+    def updateMany(self, frames, callback=None):
+        """Update DS models with a block of frames (see 
+        OnlineLinearDS.updateMany).
+        """
+        
+        changed = []
+        for (i, x) in enumerate(frames.T):
+            self.update(x)
+            if len(self._changed) > 0:
+                changed.append(i)
+                if not callback is None:
+                    callback(i)
+        return changed
@@ -0,0 +1,233 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""pydstk's batch (many-vs-many) distance computation between models and
+batch alignment of model databases.
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import os
+import glob
+import numpy as np
+from multiprocessing import Pool
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+from dsio import loadModel, saveModel, isModelFile
+from dscore.system import LinearDS
+
+
+# reference models of a worker process (see _initWorker)
+_refModels = None
+
+
+def listModels(arg):
+    """List model files.
+
+    Parameters:
+    -----------
+    arg : string
+        A model file (*.pkl or *.npz), a directory (all model files in it;
+        other .npz files, e.g., the observation basis written by gendb.py,
+        are skipped) or a list file (one model file per line; relative paths are relative
+        to the list file's directory).
+
+    Returns:
+    --------
+    modelFiles : list
+        Model file names.
+    """
+
+    if os.path.isdir(arg):
+        modelFiles = sorted(glob.glob(os.path.join(arg, '*.pkl')) +
+                            [f for f in glob.glob(os.path.join(arg, '*.npz'))
+                             if isModelFile(f)])
+    elif arg.endswith('.pkl') or arg.endswith('.npz'):
+        modelFiles = [arg]
+    else:
+        baseDir = os.path.dirname(arg)
+        with open(arg) as fid:
+            modelFiles = [os.path.join(baseDir, l.strip()) for l in fid
+                          if l.strip()]
+    if len(modelFiles) == 0:
+        raise ErrorDS("no models found in %s!" % arg)
+    return modelFiles
+
+
+def _initWorker(refFiles):
+    """Load the reference models (once per worker process).
+    """
+
+    global _refModels
+    _refModels = [loadModel(f) for f in refFiles]
+
+
+def _distRow(args):
+    """Compute distances between a source model and all reference models.
+    """
+
+    (srcFile, distFun, numIter) = args
+    src = loadModel(srcFile)
+    return np.array([distFun(src, ref, numIter) for ref in _refModels])
+
+
+def batchDistances(srcFiles, refFiles, distFun, numIter, sink=None,
+                   nProcs=1, callback=None):
+    """Compute the distance matrix between source and reference models.
+
+    Every model is loaded once (per process); rows (i.e., the distances of
+    one source model to all reference models) are handed to the sink as
+    soon as they are computed (in order of the source models).
+
+    Parameters:
+    -----------
+    srcFiles : list
+        Source model files (rows).
+
+    refFiles : list
+        Reference model files (columns).
+
+    distFun : function
+        Distance function, called as distFun(src, ref, numIter), e.g.,
+        dsdist.ldsMartinDistance (needs to be a module-level function).
+
+    numIter : int
+        Iterations for solving the Lyapunov eq.
+
+    sink : dssink.RowSink instance (default : None)
+        Sink for the rows (row index = index of the source model).
+
+    nProcs : int (default : 1)
+        Number of processes.
+
+    callback : function (default : None)
+        Called as callback(i, row) for each row.
+
+    Returns:
+    --------
+    nRows : int
+        Number of computed rows.
+    """
+
+    jobs = [(srcFile, distFun, numIter) for srcFile in srcFiles]
+    pool = None
+    if nProcs > 1 and len(srcFiles) > 1:
+        pool = Pool(min(nProcs, len(srcFiles)), _initWorker, (refFiles,))
+        rows = pool.imap(_distRow, jobs)
+    else:
+        _initWorker(refFiles)
+        rows = (_distRow(job) for job in jobs)
+
+    nRows = 0
+    try:
+        for (i, row) in enumerate(rows):
+            if not sink is None:
+                sink.write(i, row)
+            if not callback is None:
+                callback(i, row)
+            nRows += 1
+    finally:
+        if not pool is None:
+            pool.close()
+            pool.join()
+    return nRows
+
+
+def alignModels(refFile, srcFiles, outDir, mode='ssm', batchSize=256,
+                profile='full', callback=None):
+    """Align LDS models to a reference (or convert them to JCF) and write
+    them to a model directory.
+
+    Models are loaded, converted (see LinearDS.stateSpaceMapBatch and
+    LinearDS.convertToJCFBatch) and written batch-by-batch, i.e., only
+    batchSize models are in memory at a time.
+
+    Parameters:
+    -----------
+    refFile : string
+        Reference model file (only used for mode 'ssm').
+
+    srcFiles : list
+        Model files to align/convert.
+
+    outDir : string
+        Output directory (model file names are kept).
+
+    mode : string (default : 'ssm')
+        'ssm' (map into the state-space of the reference) or 'jcf'
+        (convert to JCF).
+
+    batchSize : int (default : 256)
+        Number of models per batch.
+
+    profile : string (default : 'full')
+        Profile of the written models (see dsio.saveModel).
+
+    callback : function (default : None)
+        Called as callback(i, outFile, err) for each written model; err is
+        the parameter difference before the mapping (mode 'ssm') or None.
+
+    Returns:
+    --------
+    err : numpy array, shape = (len(srcFiles),)
+        Parameter differences before the mapping (NaN for mode 'jcf').
+    """
+
+    if not mode in ['ssm', 'jcf']:
+        raise ErrorDS("unknown alignment mode %s!" % mode)
+
+    if not os.path.exists(outDir):
+        os.makedirs(outDir)
+
+    ref = None
+    if mode == 'ssm':
+        ref = loadModel(refFile)
+
+    err = np.empty((len(srcFiles),))
+    err.fill(np.nan)
+    for b in range(0, len(srcFiles), batchSize):
+        batchFiles = srcFiles[b:b+batchSize]
+        models = [loadModel(f) for f in batchFiles]
+        for (f, model) in zip(batchFiles, models):
+            if not isinstance(model, LinearDS):
+                raise ErrorDS("%s is not a LDS model!" % f)
+
+        if mode == 'ssm':
+            (models, err[b:b+len(models)]) = LinearDS.stateSpaceMapBatch(
+                ref, models, batchSize)
+        else:
+            LinearDS.convertToJCFBatch(models, batchSize)
+
+        for (i, (f, model)) in enumerate(zip(batchFiles, models)):
+            outFile = os.path.join(outDir, os.path.basename(f))
+            saveModel(model, outFile, profile)
+            if not callback is None:
+                callback(b + i, outFile, None if mode == 'jcf' else err[b+i])
+    return err
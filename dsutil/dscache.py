@@ -0,0 +1,520 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""pydstk's caches for decoded videos and system identification results.
+
+Decoded (i.e., grayscale, cropped and resized) videos are stored as .npy
+files (frames as rows) in a cache directory. Entries are keyed by the video
+file (absolute path, modification time and size) and the video reader
+options (size, roi, stride and maxFrames), i.e., an entry becomes invalid
+once the video changes. Cache hits are memory-mapped (read-only). The cache
+size is bounded; the least recently used entries are evicted first.
+
+    cache = FrameCache('/tmp/pydstk-cache')
+    (dataMat, dataSiz) = cache.loadDataFromVideoFile('video.avi')
+
+Estimated models (LinearDS, NonLinearDS) are memoized by SysIDCache, keyed
+by a hash of the data matrix and the estimation parameters (e.g., number of
+states, approx, kernel settings). Entries are kept in memory (LRU) and, 
+optionally, as model files in a cache directory (see dsio).
+
+    cache = SysIDCache('/tmp/pydstk-sysid')
+    lds = cache.suboptimalSysID(LinearDS(5), dataMat)
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import os
+import copy
+import json
+import glob
+import hashlib
+import zipfile
+import collections
+import numpy as np
+
+import dsio
+import dsutil
+import dssink
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+
+
+# defaults of the video reader options (see dsutil.iterVideoBlocks)
+_VIDEO_DEFAULTS = { "size" : (64,64),
+                    "roi" : None,
+                    "stride" : 1,
+                    "maxFrames" : None }
+
+
+def _evictLRU(dataFiles, maxBytes, keepFile=None, suffixes=()):
+    """Remove the least recently used (mtime) data files (and their files 
+    with the given suffixes) until their total size is within maxBytes.
+    
+    Returns:
+    --------
+    nEvicted : int
+        Number of evicted entries.
+    """
+
+    entries = []
+    for dataFile in dataFiles:
+        try:
+            st = os.stat(dataFile)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, dataFile))
+    entries.sort()
+
+    nEvicted = 0
+    total = sum([e[1] for e in entries])
+    for (_, size, dataFile) in entries:
+        if total <= maxBytes:
+            break
+        if dataFile == keepFile:
+            continue
+        base = os.path.splitext(dataFile)[0]
+        for f in [base + s for s in suffixes] + [dataFile]:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+        total -= size
+        nEvicted += 1
+    return nEvicted
+
+
+class FrameCache(object):
+    """Size-bounded (LRU) on-disk cache for decoded videos.
+    """
+
+    def __init__(self, cacheDir, maxMB=4096):
+        """Initialization.
+
+        Parameters:
+        -----------
+        cacheDir : string
+            Cache directory (created if it does not exist).
+
+        maxMB : float (default : 4096)
+            Max. size of the cache (in MB).
+        """
+
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+        self._cacheDir = cacheDir
+        self._maxBytes = int(maxMB*1024*1024)
+        self._stats = { "hits" : 0, "misses" : 0, "evictions" : 0 }
+
+
+    def key(self, inFile, opts=None):
+        """Compute the cache key of a video and its reader options.
+        """
+
+        vidOpts = dict(_VIDEO_DEFAULTS)
+        if not opts is None:
+            vidOpts.update(opts)
+        st = os.stat(inFile)
+        desc = json.dumps([os.path.abspath(inFile), st.st_mtime, st.st_size,
+                           sorted(vidOpts.items())])
+        return hashlib.sha1(desc).hexdigest()
+
+
+    def _files(self, key):
+        """Get the names of the data and info file of an entry.
+        """
+
+        base = os.path.join(self._cacheDir, key)
+        return (base + '.npy', base + '.json')
+
+
+    def lookup(self, inFile, opts=None):
+        """Look up a decoded video.
+
+        Parameters:
+        -----------
+        inFile : string
+            Name of the AVI video file.
+
+        opts : dict (default : None)
+            Video reader options (see dsutil.iterVideoBlocks).
+
+        Returns:
+        --------
+        (dataMat, dataSiz) as returned by dsutil.loadDataFromVideoFile
+        (dataMat is a read-only, memory-mapped array), or None (cache miss).
+        """
+
+        (dataFile, infoFile) = self._files(self.key(inFile, opts))
+        try:
+            with open(infoFile) as fid:
+                info = json.load(fid)
+            data = np.load(dataFile, mmap_mode='r')
+        except (IOError, ValueError):
+            self._stats["misses"] += 1
+            return None
+
+        # mark entry as recently used
+        os.utime(dataFile, None)
+        self._stats["hits"] += 1
+        return (data.T, tuple(info["dataSiz"]))
+
+
+    def store(self, inFile, opts, dataMat, dataSiz):
+        """Add a decoded video to the cache.
+
+        Parameters:
+        -----------
+        inFile : string
+            Name of the AVI video file.
+
+        opts : dict
+            Video reader options (see dsutil.iterVideoBlocks).
+
+        dataMat : numpy array, shape = (N, D)
+            Data matrix (see dsutil.loadDataFromVideoFile).
+
+        dataSiz : tuple of (height, width, D)
+            The video dimensions.
+        """
+
+        writer = self.writer(inFile, opts)
+        writer.append(dataMat)
+        writer.commit(dataSiz)
+
+
+    def writer(self, inFile, opts=None):
+        """Get a writer that adds a video to the cache block-by-block.
+
+        Returns:
+        --------
+        writer : _CacheWriter instance
+            Call append(block) for each block of frames and commit(dataSiz)
+            once all frames are written (see iterVideoBlocks).
+        """
+
+        key = self.key(inFile, opts)
+        return _CacheWriter(self, key, self._files(key))
+
+
+    def iterVideoBlocks(self, inFile, blockSize=64, **opts):
+        """Cached version of dsutil.iterVideoBlocks.
+
+        On a cache hit, blocks are views of the memory-mapped data; on a
+        miss, the video is decoded and added to the cache once all blocks
+        have been read.
+        """
+
+        res = self.lookup(inFile, opts)
+        if not res is None:
+            (data, dataSiz) = res
+            for i in range(0, data.shape[1], blockSize):
+                yield (data[:,i:i+blockSize], dataSiz[0:2])
+            return
+
+        writer = self.writer(inFile, opts)
+        try:
+            cnt = 0
+            for (block, frmSiz) in dsutil.iterVideoBlocks(inFile, blockSize,
+                                                          **opts):
+                writer.append(block)
+                cnt += block.shape[1]
+                yield (block, frmSiz)
+            writer.commit((frmSiz[0], frmSiz[1], cnt))
+        finally:
+            writer.abort()
+
+
+    def loadDataFromVideoFile(self, inFile, nProcs=1, **opts):
+        """Cached version of dsutil.loadDataFromVideoFile (or, if nProcs > 1,
+        dsutil.loadDataFromVideoFileMP).
+        """
+
+        res = self.lookup(inFile, opts)
+        if not res is None:
+            return res
+
+        if nProcs > 1:
+            (dataMat, dataSiz) = dsutil.loadDataFromVideoFileMP(inFile,
+                nProcs, **opts)
+        else:
+            (dataMat, dataSiz) = dsutil.loadDataFromVideoFile(inFile, **opts)
+        self.store(inFile, opts, dataMat, dataSiz)
+        return (dataMat, dataSiz)
+
+
+    def size(self):
+        """Get the current size of the cache (in bytes).
+        """
+
+        return sum([os.path.getsize(f) for f in self._entries()])
+
+
+    def _entries(self):
+        """Get the data files of all entries.
+        """
+
+        return glob.glob(os.path.join(self._cacheDir, '*.npy'))
+
+
+    def evict(self, keepFile=None):
+        """Evict least recently used entries until the cache size is within
+        bounds (the entry 'keepFile' is never evicted).
+        """
+
+        self._stats["evictions"] += _evictLRU(self._entries(), 
+            self._maxBytes, keepFile, ['.json'])
+
+
+    def stats(self):
+        """Get cache statistics (hits, misses and evictions).
+        """
+
+        return dict(self._stats)
+
+
+class _CacheWriter(object):
+    """Writes a cache entry block-by-block (see FrameCache.writer).
+
+    Data is written to temporary files which are renamed on commit, i.e.,
+    incomplete entries are never visible.
+    """
+
+    def __init__(self, cache, key, files):
+        self._cache = cache
+        self._files = files
+        self._tmpFiles = [f + '.%d.tmp' % os.getpid() for f in files]
+        self._npy = None
+
+
+    def append(self, block):
+        """Append a block of frames (shape = (N, n), see iterVideoBlocks).
+        """
+
+        if self._npy is None:
+            self._npy = dssink.NpyFile(self._tmpFiles[0], block.shape[0],
+                                       np.float32)
+        for x in block.T:
+            self._npy.append(x)
+
+
+    def commit(self, dataSiz):
+        """Commit the entry.
+        """
+
+        if self._npy is None:
+            return
+        self._npy.close()
+        self._npy = None
+        with open(self._tmpFiles[1], 'w') as fid:
+            json.dump({ "dataSiz" : list(dataSiz) }, fid)
+        os.rename(self._tmpFiles[1], self._files[1])
+        os.rename(self._tmpFiles[0], self._files[0])
+        self._cache.evict(self._files[0])
+
+
+    def abort(self):
+        """Discard the entry (if not committed).
+        """
+
+        if self._npy is None:
+            return
+        self._npy.close()
+        self._npy = None
+        for f in self._tmpFiles:
+            if os.path.exists(f):
+                os.remove(f)
+
+
+def _hashArray(sha1, X, blockBytes=1<<24):
+    """Update a hash with the content (and shape and type) of an array.
+    
+    The array is hashed in blocks of rows, i.e., (non-contiguous) arrays
+    are never copied as a whole and the hash does not depend on the memory
+    layout.
+    """
+    
+    X = np.asarray(X)
+    sha1.update(json.dumps([X.dtype.str, X.shape]))
+    X = X.reshape((X.shape[0], -1)) if X.ndim > 0 else X.reshape((1, 1))
+    nRows = max(1, blockBytes // max(1, X.shape[1]*X.itemsize))
+    for i in range(0, X.shape[0], nRows):
+        sha1.update(np.ascontiguousarray(X[i:i+nRows]).tostring())
+
+
+class SysIDCache(object):
+    """Two-tier (memory and disk) LRU cache of system identification 
+    results.
+    """
+
+    def __init__(self, cacheDir=None, maxEntries=32, maxMB=1024):
+        """Initialization.
+
+        Parameters:
+        -----------
+        cacheDir : string (default : None)
+            Cache directory (created if it does not exist); None keeps the
+            models in memory only.
+            
+        maxEntries : int (default : 32)
+            Max. number of models kept in memory.
+
+        maxMB : float (default : 1024)
+            Max. size of the cache directory (in MB).
+        """
+
+        if not cacheDir is None and not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+        self._cacheDir = cacheDir
+        self._maxEntries = maxEntries
+        self._maxBytes = int(maxMB*1024*1024)
+        self._models = collections.OrderedDict()
+        self._stats = { "hits" : 0, "diskHits" : 0, "misses" : 0, 
+                        "evictions" : 0 }
+
+
+    def key(self, model, Y):
+        """Compute the cache key of an (unfitted) model and a data matrix.
+        
+        The key covers all (estimation) parameters of the model, e.g., the
+        number of states, approx or the kernel settings, except the 
+        verbosity.
+        """
+
+        arrays = {}
+        meta = dsio._flatten(model, '', arrays, 'full')
+        meta["attrs"].pop("_verbose", None)
+        sha1 = hashlib.sha1(json.dumps([dsio.VERSION, meta], sort_keys=True))
+        for name in sorted(arrays):
+            _hashArray(sha1, arrays[name])
+        _hashArray(sha1, Y)
+        return sha1.hexdigest()
+
+
+    def _file(self, key):
+        """Get the model file of an entry.
+        """
+
+        return os.path.join(self._cacheDir, key + '.npz')
+
+
+    def lookup(self, key):
+        """Look up a model.
+
+        Returns:
+        --------
+        model : LinearDS or NonLinearDS instance or None (cache miss)
+            Copy of the cached model.
+        """
+
+        if key in self._models:
+            self._models[key] = self._models.pop(key)
+            self._stats["hits"] += 1
+            return copy.deepcopy(self._models[key])
+
+        if not self._cacheDir is None:
+            modelFile = self._file(key)
+            try:
+                model = dsio.loadModel(modelFile, mmap=False)
+            except (IOError, ValueError, KeyError, ErrorDS, 
+                    zipfile.BadZipfile):
+                model = None
+            if not model is None:
+                # mark entry as recently used
+                os.utime(modelFile, None)
+                self._stats["diskHits"] += 1
+                self._remember(key, model)
+                return copy.deepcopy(model)
+
+        self._stats["misses"] += 1
+        return None
+
+
+    def _remember(self, key, model):
+        """Add a model to the memory tier (evicting the LRU entries).
+        """
+
+        self._models[key] = model
+        while len(self._models) > self._maxEntries:
+            self._models.popitem(last=False)
+            self._stats["evictions"] += 1
+
+
+    def store(self, key, model):
+        """Add a (fitted) model to the cache.
+        """
+
+        self._remember(key, copy.deepcopy(model))
+        if self._cacheDir is None:
+            return
+
+        # write to a temporary file first, i.e., entries are never incomplete
+        modelFile = self._file(key)
+        tmpFile = modelFile + '.%d.tmp' % os.getpid()
+        dsio.saveModel(model, tmpFile)
+        os.rename(tmpFile, modelFile)
+        self._stats["evictions"] += _evictLRU(
+            glob.glob(os.path.join(self._cacheDir, '*.npz')),
+            self._maxBytes, modelFile)
+
+
+    def suboptimalSysID(self, model, Y):
+        """Memoized version of LinearDS/NonLinearDS.suboptimalSysID.
+
+        Parameters:
+        -----------
+        model : LinearDS or NonLinearDS instance
+            Model to estimate (fitted in place on a cache miss).
+
+        Y : numpy array, shape = (N, D)
+            Input data.
+
+        Returns:
+        --------
+        model : LinearDS or NonLinearDS instance
+            The estimated model, i.e., a copy of the cached model on a cache
+            hit (use the returned model, not the argument).
+        """
+
+        key = self.key(model, Y)
+        cached = self.lookup(key)
+        if not cached is None:
+            return cached
+        model.suboptimalSysID(Y)
+        self.store(key, model)
+        return model
+
+
+    def stats(self):
+        """Get cache statistics (memory hits, disk hits, misses and 
+        evictions).
+        """
+
+        return dict(self._stats)
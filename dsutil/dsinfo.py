@@ -31,7 +31,11 @@ __email__   = "E-Mail: roland.kwitt@kitware.com"
 __status__  = "Development"
 
 
-from termcolor import colored
+def colored(msg, color):
+    """Colorize message (termcolor is imported on first use).
+    """
+    from termcolor import colored
+    return colored(msg, color)
 
 
 def time(msg):
@@ -0,0 +1,292 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""pydstk's versioned on-disk model format.
+
+Models (LinearDS, NonLinearDS) are stored as uncompressed .npz files, i.e.,
+zip archives with one .npy member per parameter array and a JSON member
+('meta.json') with the schema version, the profile and all non-array
+attributes. Since members are stored uncompressed, arrays can be memory-
+mapped straight from the archive, i.e., they are only read when used.
+
+Profiles:
+
+    'full'     -- All model parameters.
+    'distance' -- Only parameters needed for (Martin) distance computation;
+                  e.g., the state sequence, the mean observation of an LDS
+                  and the (training) kernel matrix of a KDT are omitted 
+                  (the length of the state sequence is kept, as with
+                  compact()). Such models cannot be used for, e.g., 
+                  synthesis.
+
+Files with .pkl extension are (still) read/written with pickle, see
+loadModel() and saveModel().
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import os
+import json
+import types
+import pickle
+import struct
+import zipfile
+import StringIO
+import importlib
+import numpy as np
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+from dscore.system import LinearDS, NonLinearDS
+from dscore.dskpca import KPCAParam, RBFParam
+
+
+# current schema version
+VERSION = 1
+
+# serializable classes
+_CLASSES = dict((cls.__name__, cls) for cls in
+                [LinearDS, NonLinearDS, KPCAParam, RBFParam])
+
+# attributes omitted in the 'distance' profile (per class); for LinearDS and
+# NonLinearDS omitted attributes are removed from the loaded model, for all
+# others they are set to None. If the state sequence (_Xhat) is omitted, its
+# length is stored as _nFrames (see numFrames).
+_OMIT = { "distance" : { "LinearDS" : ["_Yavg", "_Xhat", "_XhatJCF"],
+                         "NonLinearDS" : ["_Vhat", "_Xhat"],
+                         "RBFParam" : ["_kMat", "_teS0"] },
+          "full" : {} }
+
+
+def _newInstance(cls):
+    """Create an instance w/o calling __init__ (old- and new-style classes).
+    """
+
+    if isinstance(cls, type):
+        return object.__new__(cls)
+    return types.InstanceType(cls)
+
+
+def _attributes(obj):
+    """Get the attributes of an object (as (name, value) pairs).
+    """
+    
+    if hasattr(obj, '__dict__'):
+        return obj.__dict__.items()
+    return [(k, getattr(obj, k)) for k in obj.__slots__ if hasattr(obj, k)]
+
+
+def _flatten(obj, prefix, arrays, profile):
+    """Build the meta information of an object and collect its arrays.
+    """
+
+    clsName = obj.__class__.__name__
+    if not clsName in _CLASSES:
+        raise ErrorDS("cannot serialize objects of type %s!" % clsName)
+
+    omit = _OMIT[profile].get(clsName, [])
+    attrs = {}
+    for (key, val) in _attributes(obj):
+        if key in omit:
+            continue
+        if isinstance(val, np.ndarray):
+            arrays[prefix + key] = val
+            attrs[key] = { "array" : prefix + key,
+                           "matrix" : isinstance(val, np.matrix) }
+        elif isinstance(val, np.generic):
+            attrs[key] = { "scalar" : val.item(), "dtype" : val.dtype.str }
+        elif isinstance(val, types.FunctionType):
+            attrs[key] = { "function" : "%s.%s" % (val.__module__,
+                                                   val.__name__) }
+        elif val is None or isinstance(val, (bool, int, long, float, str)):
+            attrs[key] = { "value" : val }
+        else:
+            attrs[key] = { "object" : _flatten(val, prefix + key + '.',
+                                               arrays, profile) }
+    if "_Xhat" in omit and isinstance(getattr(obj, "_Xhat", None), 
+                                      np.ndarray):
+        attrs["_nFrames"] = { "value" : obj._Xhat.shape[1] }
+    return { "class" : clsName, "omit" : omit, "attrs" : attrs }
+
+
+def saveModel(model, fileName, profile='full'):
+    """Save a model.
+
+    Parameters:
+    -----------
+    model : LinearDS or NonLinearDS instance
+        Model to save.
+
+    fileName : string
+        Output file (pickle is used for .pkl files).
+
+    profile : string (default : 'full')
+        'full' or 'distance' (see module documentation).
+    """
+
+    if fileName.endswith('.pkl'):
+        if profile != 'full':
+            raise ErrorDS("profile %s not supported for pickled models!" %
+                          profile)
+        with open(fileName, 'w') as fid:
+            pickle.dump(model, fid)
+        return
+
+    if not profile in _OMIT:
+        raise ErrorDS("unknown profile %s!" % profile)
+
+    arrays = {}
+    meta = { "format" : "pydstk-model",
+             "version" : VERSION,
+             "profile" : profile,
+             "model" : _flatten(model, '', arrays, profile) }
+
+    tmpFile = fileName + '.tmp'
+    with zipfile.ZipFile(tmpFile, 'w', zipfile.ZIP_STORED, True) as zf:
+        zf.writestr('meta.json', json.dumps(meta, indent=2, sort_keys=True))
+        for (name, arr) in sorted(arrays.items()):
+            buf = StringIO.StringIO()
+            np.lib.format.write_array(buf, np.asarray(arr))
+            zf.writestr(name + '.npy', buf.getvalue())
+    os.rename(tmpFile, fileName)
+
+
+def _memmapMember(fileName, fid, info):
+    """Memory-map a (stored) .npy member of a zip archive.
+    """
+
+    # skip the local file header (name and extra field lengths at 26/28)
+    fid.seek(info.header_offset)
+    header = fid.read(30)
+    (nName, nExtra) = struct.unpack('<HH', header[26:30])
+    fid.seek(info.header_offset + 30 + nName + nExtra)
+
+    version = np.lib.format.read_magic(fid)
+    if version == (1, 0):
+        (shape, fortran, dtype) = np.lib.format.read_array_header_1_0(fid)
+    else:
+        (shape, fortran, dtype) = np.lib.format.read_array_header_2_0(fid)
+
+    if np.prod(shape) == 0 or dtype.hasobject:
+        raise ErrorDS("cannot memory-map %s!" % info.filename)
+    return np.memmap(fileName, dtype=dtype, mode='r', offset=fid.tell(),
+                     shape=shape, order='F' if fortran else 'C')
+
+
+def _unflatten(meta, arrays):
+    """Re-create an object from its meta information.
+    """
+
+    if not meta["class"] in _CLASSES:
+        raise ErrorDS("unknown class %s!" % meta["class"])
+    obj = _newInstance(_CLASSES[meta["class"]])
+
+    # e.g., RBFParam instances are initialized to defaults (None)
+    if not isinstance(obj, (LinearDS, NonLinearDS)):
+        obj.__init__()
+
+    for (key, val) in meta["attrs"].iteritems():
+        if "array" in val:
+            arr = arrays(val["array"])
+            setattr(obj, key, np.asmatrix(arr) if val["matrix"] else arr)
+        elif "scalar" in val:
+            setattr(obj, key, np.dtype(str(val["dtype"])).type(val["scalar"]))
+        elif "function" in val:
+            (module, name) = str(val["function"]).rsplit('.', 1)
+            setattr(obj, key, getattr(importlib.import_module(module), name))
+        elif "object" in val:
+            setattr(obj, key, _unflatten(val["object"], arrays))
+        else:
+            val = val["value"]
+            setattr(obj, key, str(val) if isinstance(val, unicode) else val)
+    return obj
+
+
+def isModelFile(fileName):
+    """Check if a file is in the versioned model format (i.e., a zip archive
+    with meta information; other .npz files, e.g., observation bases, are
+    not).
+    """
+
+    if not zipfile.is_zipfile(fileName):
+        return False
+    with zipfile.ZipFile(fileName, 'r') as zf:
+        return 'meta.json' in zf.namelist()
+
+
+def loadModel(fileName, mmap=True):
+    """Load a model.
+
+    Parameters:
+    -----------
+    fileName : string
+        Model file (versioned format or pickle).
+
+    mmap : boolean (default : True)
+        Memory-map the parameter arrays (read-only) instead of reading them.
+
+    Returns:
+    --------
+    model : LinearDS or NonLinearDS instance
+        The loaded model.
+    """
+
+    if not zipfile.is_zipfile(fileName):
+        with open(fileName, 'r') as fid:
+            return pickle.load(fid)
+
+    with zipfile.ZipFile(fileName, 'r') as zf, open(fileName, 'rb') as fid:
+        if not 'meta.json' in zf.namelist():
+            raise ErrorDS("%s is not a model file!" % fileName)
+        meta = json.loads(zf.read('meta.json'))
+        if meta.get("format") != "pydstk-model":
+            raise ErrorDS("%s is not a model file!" % fileName)
+        if meta["version"] > VERSION:
+            raise ErrorDS("model version %d of %s is not supported!" %
+                          (meta["version"], fileName))
+
+        def getArray(name):
+            info = zf.getinfo(name + '.npy')
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                try:
+                    return _memmapMember(fileName, fid, info)
+                except ErrorDS:
+                    pass
+            return np.lib.format.read_array(StringIO.StringIO(
+                zf.read(info)))
+
+        return _unflatten(meta["model"], getArray)
+
+
+def modelInfo(fileName):
+    """Get the meta information of a model file (versioned format only).
+    """
+
+    with zipfile.ZipFile(fileName, 'r') as zf:
+        return json.loads(zf.read('meta.json'))
@@ -0,0 +1,188 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""pydstk's message framing for the detection service.
+
+All messages are framed as a 4-byte (little-endian, unsigned) length, followed
+by the payload. A zero-length message marks the end of a stream. The protocol
+between client and server is:
+
+    server -> client : JSON hello, e.g., {"labels": [...], "videos": [...]}
+    client -> server : JSON stream header, i.e., {"dim": N}
+    client -> server : frame as raw float32 (N values), repeated
+    client -> server : end-of-stream (zero-length message)
+    server -> client : per-window result (int32 frame index, followed by
+                       float64 distances to all templates), repeated
+    server -> client : end-of-stream (zero-length message)
+
+If processing fails, the server sends an error (int32 frame index -1, 
+followed by the message) instead of the end-of-stream; remaining frames of
+the client are discarded.
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import json
+import struct
+import socket
+import numpy as np
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+
+
+_LEN = struct.Struct('<I')
+_IDX = struct.Struct('<i')
+
+# frame index of error messages
+_ERR = -1
+
+
+def recvAll(sock, n):
+    """Receive exactly n bytes from a socket.
+
+    Parameters
+    ----------
+    sock : socket.socket instance
+        Connected socket.
+
+    n : int
+        Number of bytes to receive.
+
+    Returns
+    -------
+    data : string
+        Received bytes.
+    """
+
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(n)
+        if not chunk:
+            raise ErrorDS("connection closed unexpectedly!")
+        chunks.append(chunk)
+        n -= len(chunk)
+    return ''.join(chunks)
+
+
+def sendMsg(sock, payload):
+    """Send a length-prefixed message.
+    """
+    sock.sendall(_LEN.pack(len(payload)) + payload)
+
+
+def recvMsg(sock):
+    """Receive a length-prefixed message.
+
+    Returns
+    -------
+    payload : string
+        Message payload (empty string at the end of a stream).
+    """
+
+    (n,) = _LEN.unpack(recvAll(sock, _LEN.size))
+    if n == 0:
+        return ''
+    return recvAll(sock, n)
+
+
+def sendJSON(sock, obj):
+    """Send a JSON-encoded message.
+    """
+    sendMsg(sock, json.dumps(obj))
+
+
+def recvJSON(sock):
+    """Receive a JSON-encoded message.
+    """
+    return json.loads(recvMsg(sock))
+
+
+def sendFrame(sock, x):
+    """Send a frame (as float32).
+    """
+    sendMsg(sock, np.asarray(x, dtype=np.float32).tostring())
+
+
+def recvFrame(sock, dim):
+    """Receive a frame (as float32), None at the end of a stream.
+    """
+
+    payload = recvMsg(sock)
+    if not payload:
+        return None
+    x = np.fromstring(payload, dtype=np.float32)
+    if len(x) != dim:
+        raise ErrorDS("frame size mismatch (%d != %d)!" % (len(x), dim))
+    return x
+
+
+def sendResult(sock, f, dists):
+    """Send the distances of a window that ends at frame f.
+    """
+    sendMsg(sock, _IDX.pack(f) + np.asarray(dists, dtype=np.float64).tostring())
+
+
+def recvResult(sock):
+    """Receive a (frame index, distance vector) tuple, None at the end.
+
+
+    Raises
+    ------
+    ErrorDS, if the server reports an error (see sendError).
+    """
+
+    payload = recvMsg(sock)
+    if not payload:
+        return None
+    (f,) = _IDX.unpack(payload[0:_IDX.size])
+    if f == _ERR:
+        raise ErrorDS(payload[_IDX.size:])
+    return (f, np.fromstring(payload[_IDX.size:], dtype=np.float64))
+
+
+def sendError(sock, message):
+    """Report an error (instead of the end of a stream).
+    """
+    sendMsg(sock, _IDX.pack(_ERR) + str(message))
+
+
+def sendEnd(sock):
+    """Mark the end of a stream.
+    """
+    sendMsg(sock, '')
+
+
+def connect(sockFile):
+    """Connect to a detection service listening on a Unix socket.
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(sockFile)
+    return sock
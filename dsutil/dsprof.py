@@ -0,0 +1,246 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""pydstk's latency and throughput instrumentation.
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import os
+import time
+import json
+import atexit
+import numpy as np
+
+
+class Histogram(object):
+    """Latency histogram with logarithmically spaced bins.
+
+    Bins cover [1e-6, 1e+3] seconds with 'nBins' bins per decade, i.e., the
+    memory footprint is constant and percentiles are accurate up to the
+    bin width (~6% for the default of 40 bins per decade).
+    """
+
+    def __init__(self, nBins=40):
+        self._nBins = nBins
+        self._lo = -6.0
+        self._counts = np.zeros(9*nBins+2, dtype=np.int64)
+        self._n = 0
+        self._sum = 0.0
+        self._max = 0.0
+
+
+    def add(self, t):
+        """Add a latency sample (in seconds).
+        """
+
+        if t > 0:
+            b = int((np.log10(t) - self._lo)*self._nBins) + 1
+            b = min(max(b, 0), len(self._counts)-1)
+        else:
+            b = 0
+        self._counts[b] += 1
+        self._n += 1
+        self._sum += t
+        if t > self._max:
+            self._max = t
+
+
+    def percentile(self, p):
+        """Get the p-th percentile (upper bin edge, in seconds).
+        """
+
+        if self._n == 0:
+            return 0.0
+        b = np.searchsorted(np.cumsum(self._counts), np.ceil(p/100.0*self._n))
+        if b == 0:
+            return 0.0
+        return min(10**(self._lo + float(b)/self._nBins), self._max)
+
+
+    def report(self):
+        """Summarize the histogram.
+
+        Returns
+        -------
+        rep : dict
+            Count, total/mean/max latency and the p50/p95/p99 percentiles.
+        """
+
+        return { "count" : self._n,
+                 "total" : self._sum,
+                 "mean"  : self._sum/max(self._n, 1),
+                 "max"   : self._max,
+                 "p50"   : self.percentile(50),
+                 "p95"   : self.percentile(95),
+                 "p99"   : self.percentile(99) }
+
+
+class _Stage(object):
+    """Context manager to time a stage (see Profiler.stage).
+    """
+
+    def __init__(self, prof, name):
+        self._prof = prof
+        self._name = name
+
+    def __enter__(self):
+        self._tstart = time.time()
+
+    def __exit__(self, type, value, traceback):
+        self._prof.add(self._name, time.time() - self._tstart)
+
+
+class Profiler(object):
+    """Per-stage latency and throughput instrumentation.
+
+    Typical use in a processing loop:
+
+        prof = Profiler('report.json', interval=60)
+        with prof.stage('decode'):
+            ...
+        prof.count('frames')
+        prof.tick()
+
+    The JSON report is written at exit and, if 'interval' is set,
+    periodically (every 'interval' seconds) from within tick().
+    """
+
+    def __init__(self, reportFile=None, interval=None):
+        """Initialization.
+
+        Parameters:
+        -----------
+        reportFile : string (default : None)
+            Write the JSON report to this file (no report if None).
+
+        interval : float (default : None)
+            Write the report every 'interval' seconds during tick().
+        """
+
+        self._reportFile = reportFile
+        self._interval = interval
+        self._stages = {}
+        self._counters = {}
+        self._templates = []
+        self._evals = np.zeros((0,), dtype=np.int64)
+        self._tstart = time.time()
+        self._tlast = self._tstart
+
+        if not reportFile is None:
+            atexit.register(self.write)
+
+
+    def stage(self, name):
+        """Context manager that times a stage.
+        """
+        return _Stage(self, name)
+
+
+    def add(self, name, t):
+        """Add a latency sample (in seconds) for stage 'name'.
+        """
+
+        if not name in self._stages:
+            self._stages[name] = Histogram()
+        self._stages[name].add(t)
+
+
+    def count(self, name, n=1):
+        """Increment counter 'name' by n.
+        """
+        self._counters[name] = self._counters.get(name, 0) + n
+
+
+    def setTemplates(self, names):
+        """Set the template names for counting distance evaluations.
+        """
+
+        self._templates = list(names)
+        self._evals = np.zeros((len(names),), dtype=np.int64)
+
+
+    def countEvals(self, idx=None):
+        """Count distance evaluations (for all templates if idx is None).
+        """
+
+        if idx is None:
+            self._evals += 1
+        else:
+            self._evals[idx] += 1
+
+
+    def tick(self):
+        """Write the report if the reporting interval has passed.
+        """
+
+        if self._interval is None or self._reportFile is None:
+            return
+        if time.time() - self._tlast >= self._interval:
+            self.write()
+
+
+    def report(self):
+        """Build the report.
+
+        Returns
+        -------
+        rep : dict
+            Elapsed time, counters, rates (counters per second), per-stage
+            latency statistics and per-template distance evaluations.
+        """
+
+        elapsed = time.time() - self._tstart
+        rates = {}
+        for name in self._counters:
+            rates[name] = self._counters[name]/max(elapsed, 1e-9)
+
+        return { "elapsed"   : elapsed,
+                 "counters"  : dict(self._counters),
+                 "rates"     : rates,
+                 "stages"    : dict((k, v.report())
+                                    for k, v in self._stages.iteritems()),
+                 "templates" : dict(zip(self._templates,
+                                        self._evals.tolist())) }
+
+
+    def write(self, reportFile=None):
+        """Write the JSON report (atomically) to file.
+        """
+
+        if reportFile is None:
+            reportFile = self._reportFile
+        if reportFile is None:
+            return
+
+        tmpFile = reportFile + '.tmp'
+        with open(tmpFile, 'w') as fid:
+            json.dump(self.report(), fid, indent=2, sort_keys=True)
+        os.rename(tmpFile, reportFile)
+        self._tlast = time.time()
@@ -0,0 +1,480 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""pydstk's incremental writers (sinks) for distance matrices.
+
+A sink appends one row (e.g., the distances of one window to all templates)
+at a time, as soon as the row is computed. Besides the matrix itself, every
+sink (of any type) writes an index, i.e., the frame index of each row and 
+the template labels (columns). For a matrix file 'dist.npy' (or 'dist.txt'),
+the index is stored as
+
+    dist.frames.npy -- frame indices (int64, one per row)
+    dist.json       -- column labels (and, e.g., template video names)
+
+The matrix files themselves only contain the matrix, i.e., ASCII files are
+exactly what numpy.savetxt writes.
+
+Available sinks are:
+
+    'npy'  -- Growable .npy file (rows are appended; the header is updated
+              regularly, i.e., the file is readable by numpy.load at any
+              time and contains all rows up to the last flush).
+    'mmap' -- .npy file, written through a memory-mapped array that grows
+              in chunks of rows.
+    'txt'  -- ASCII file (one row per line, as with numpy.savetxt).
+
+Matrices (binary or ASCII) are loaded together with their index using 
+loadRows(); binary files can be converted to ASCII offline using 
+exportText() (which writes the index of the ASCII file as well).
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import os
+import json
+import numpy as np
+
+# import ErrorDS class from dsexcp module in dscore package
+from dscore.dsexcp import ErrorDS
+
+
+# total size of .npy headers written by the sinks (fixed, s.t. the header can
+# be rewritten in place when the number of rows changes)
+_HEADER_LEN = 128
+
+
+def _writeNpyHeader(fid, dtype, shape):
+    """Write a fixed-size .npy (v1.0) header at the current position.
+    """
+
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+        np.dtype(dtype).str, tuple(shape))
+    header = header.ljust(_HEADER_LEN - 10 - 1) + '\n'
+    if len(header) != _HEADER_LEN - 10:
+        raise ErrorDS("npy header too long!")
+    fid.write('\x93NUMPY\x01\x00' + chr(len(header) % 256) +
+              chr(len(header) // 256) + header)
+
+
+def _indexFiles(fileName):
+    """Get the names of the index files for a matrix file.
+    """
+
+    base = os.path.splitext(fileName)[0]
+    return (base + '.frames.npy', base + '.json')
+
+
+class NpyFile(object):
+    """Growable .npy file, i.e., rows are appended to the file.
+    
+    The header is rewritten on flush(), s.t. the file is readable by
+    numpy.load at any time and contains all rows up to the last flush.
+    """
+    
+    def __init__(self, fileName, nCols=None, dtype=np.float64):
+        """Initialization.
+        
+        Parameters:
+        -----------
+        fileName : string
+            Output file name.
+            
+        nCols : int (default : None)
+            Number of columns (if None, a 1-D array is written).
+            
+        dtype : numpy.dtype (default : numpy.float64)
+            Data type.
+        """
+        
+        self._nCols = nCols
+        self._nRows = 0
+        self._dtype = np.dtype(dtype)
+        self._fid = open(fileName, 'w+b')
+        self.flush()
+        
+        
+    def append(self, row):
+        """Append a row (or a value, for 1-D arrays).
+        """
+        
+        self._fid.write(np.asarray(row, dtype=self._dtype).tostring())
+        self._nRows += 1
+        
+        
+    def flush(self):
+        """Rewrite the header and flush to disk.
+        """
+        
+        if self._nCols is None:
+            shape = (self._nRows,)
+        else:
+            shape = (self._nRows, self._nCols)
+        self._fid.seek(0)
+        _writeNpyHeader(self._fid, self._dtype, shape)
+        self._fid.seek(0, os.SEEK_END)
+        self._fid.flush()
+        
+        
+    def close(self):
+        """Flush and close the file.
+        """
+        
+        if self._fid.closed:
+            return
+        self.flush()
+        self._fid.close()
+        
+
+class RowSink(object):
+    """Base class of all sinks.
+
+    Subclasses implement _writeRow(), _flush() and _close().
+    """
+
+    def __init__(self, fileName, nCols, labels=None, info=None, flushEvery=16):
+        """Initialization.
+
+        Parameters:
+        -----------
+        fileName : string
+            Output file name.
+
+        nCols : int
+            Number of columns (e.g., number of templates).
+
+        labels : list (default : None)
+            Column labels (stored in the index).
+
+        info : dict (default : None)
+            Additional information (stored in the index).
+
+        flushEvery : int (default : 16)
+            Flush to disk every 'flushEvery' rows.
+        """
+
+        self._fileName = fileName
+        self._nCols = nCols
+        self._nRows = 0
+        self._flushEvery = flushEvery
+
+        (framesFile, indexFile) = _indexFiles(fileName)
+        index = { "labels" : [] if labels is None else list(labels),
+                  "rows" : os.path.basename(framesFile) }
+        if not info is None:
+            index.update(info)
+        with open(indexFile, 'w') as fid:
+            json.dump(index, fid, indent=2)
+        self._frames = NpyFile(framesFile, None, np.int64)
+
+
+    def write(self, f, row):
+        """Append a row.
+
+        Parameters:
+        -----------
+        f : int
+            Frame index (e.g., the last frame of the window).
+
+        row : numpy.array, shape = (nCols, )
+            Row data.
+        """
+
+        if len(row) != self._nCols:
+            raise ErrorDS("row size mismatch (%d != %d)!" %
+                          (len(row), self._nCols))
+        self._writeRow(row)
+        self._frames.append(f)
+        self._nRows += 1
+        if self._nRows % self._flushEvery == 0:
+            self.flush()
+
+
+    def flush(self):
+        """Flush data to disk.
+        """
+
+        self._flush()
+        self._frames.flush()
+
+
+    def close(self):
+        """Flush data to disk and close the sink.
+        """
+
+        self._close()
+        self._frames.close()
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class NpySink(RowSink):
+    """Sink writing a growable .npy file.
+    """
+
+    def __init__(self, fileName, nCols, labels=None, info=None, flushEvery=16,
+                 dtype=np.float64):
+        """Initialization.
+
+        See RowSink; in addition,
+
+        dtype : numpy.dtype (default : numpy.float64)
+            Data type of the matrix.
+        """
+
+        RowSink.__init__(self, fileName, nCols, labels, info, flushEvery)
+        self._npy = NpyFile(fileName, nCols, dtype)
+
+
+    def _writeRow(self, row):
+        self._npy.append(row)
+
+
+    def _flush(self):
+        self._npy.flush()
+
+
+    def _close(self):
+        self._npy.close()
+
+
+class MemmapSink(RowSink):
+    """Sink writing a .npy file through a memory-mapped array.
+
+    The file (and the memory map) grows in chunks of 'chunkRows' rows.
+    """
+
+    def __init__(self, fileName, nCols, labels=None, info=None, flushEvery=16,
+                 dtype=np.float64, chunkRows=1024):
+        """Initialization.
+
+        See RowSink; in addition,
+
+        dtype : numpy.dtype (default : numpy.float64)
+            Data type of the matrix.
+
+        chunkRows : int (default : 1024)
+            Grow the memory-mapped array by 'chunkRows' rows.
+        """
+
+        RowSink.__init__(self, fileName, nCols, labels, info, flushEvery)
+        self._dtype = np.dtype(dtype)
+        self._chunkRows = chunkRows
+        self._mm = None
+        self._cap = 0
+        with open(fileName, 'wb') as fid:
+            _writeNpyHeader(fid, self._dtype, (0, nCols))
+        self._grow()
+
+
+    def _grow(self):
+        """Grow the file (and re-map it) by one chunk of rows.
+        """
+
+        if not self._mm is None:
+            self._mm.flush()
+            self._mm = None
+
+        self._cap += self._chunkRows
+        with open(self._fileName, 'r+b') as fid:
+            fid.truncate(_HEADER_LEN +
+                         self._cap*self._nCols*self._dtype.itemsize)
+        self._mm = np.memmap(self._fileName, dtype=self._dtype, mode='r+',
+                             offset=_HEADER_LEN, shape=(self._cap, self._nCols))
+
+
+    def _writeRow(self, row):
+        if self._nRows == self._cap:
+            self._grow()
+        self._mm[self._nRows,:] = row
+
+
+    def _flush(self):
+        self._mm.flush()
+        with open(self._fileName, 'r+b') as fid:
+            _writeNpyHeader(fid, self._dtype, (self._nRows, self._nCols))
+
+
+    def _close(self):
+        if self._mm is None:
+            return
+        self._flush()
+        self._mm = None
+        with open(self._fileName, 'r+b') as fid:
+            fid.truncate(_HEADER_LEN +
+                         self._nRows*self._nCols*self._dtype.itemsize)
+
+
+class TextSink(RowSink):
+    """Sink writing an ASCII file (one row per line).
+    """
+
+    def __init__(self, fileName, nCols, labels=None, info=None, flushEvery=16,
+                 fmt='%.5f'):
+        """Initialization.
+
+        See RowSink; in addition,
+
+        fmt : string (default : '%.5f')
+            Number format (see numpy.savetxt).
+        """
+
+        RowSink.__init__(self, fileName, nCols, labels, info, flushEvery)
+        self._fid = open(fileName, 'w')
+        self._fmt = fmt
+
+
+    def _writeRow(self, row):
+        np.savetxt(self._fid, np.asarray(row)[np.newaxis,:], fmt=self._fmt,
+                   delimiter=' ')
+
+
+    def _flush(self):
+        self._fid.flush()
+
+
+    def _close(self):
+        self._fid.close()
+
+
+def openSink(fileName, nCols, labels=None, info=None, kind=None):
+    """Open a sink.
+
+    Parameters:
+    -----------
+    fileName : string
+        Output file name.
+
+    nCols : int
+        Number of columns (e.g., number of templates).
+
+    labels : list (default : None)
+        Column labels.
+
+    info : dict (default : None)
+        Additional information to store in the index.
+
+    kind : string (default : None)
+        One of 'npy', 'mmap' or 'txt'; if None, 'npy' is used for files
+        with extension .npy, 'txt' otherwise. For all kinds, the index is 
+        written to two additional files (see the module documentation).
+
+    Returns:
+    --------
+    sink : RowSink instance
+        The opened sink.
+    """
+
+    if kind is None:
+        kind = 'npy' if fileName.endswith('.npy') else 'txt'
+
+    if kind == 'npy':
+        return NpySink(fileName, nCols, labels, info)
+    elif kind == 'mmap':
+        return MemmapSink(fileName, nCols, labels, info)
+    elif kind == 'txt':
+        return TextSink(fileName, nCols, labels, info)
+    raise ErrorDS("sink type %s not supported!" % kind)
+
+
+def loadRows(fileName, mmap=True):
+    """Load a distance matrix together with its index.
+
+    Parameters:
+    -----------
+    fileName : string
+        Matrix file written by a sink (.npy files are loaded as binary
+        files, all other files as ASCII files).
+
+    mmap : boolean (default : True)
+        Memory-map the matrix (instead of reading it; binary files only).
+
+    Returns:
+    --------
+    mat : numpy.array, shape = (#rows, #columns)
+        Distance matrix.
+
+    frames : numpy.array, shape = (#rows, )
+        Frame index of each row.
+
+    index : dict
+        Index information (e.g., column labels).
+    """
+
+    (framesFile, indexFile) = _indexFiles(fileName)
+    frames = np.load(framesFile)
+    with open(indexFile) as fid:
+        index = json.load(fid)
+    if fileName.endswith('.npy'):
+        mat = np.load(fileName, mmap_mode='r' if mmap else None)
+    elif os.path.getsize(fileName) == 0:
+        mat = np.zeros((0, len(index["labels"])))
+    else:
+        mat = np.loadtxt(fileName, ndmin=2)
+
+    # rows might have been written after the last index flush (or vice versa)
+    n = min(mat.shape[0], len(frames))
+    return (mat[0:n], frames[0:n], index)
+
+
+def exportText(inFile, outFile, fmt='%.5f'):
+    """Convert a binary distance matrix to ASCII (as written by numpy.savetxt).
+
+    The index is written for the ASCII file as well, i.e., the result is
+    the same as written by a 'txt' sink.
+
+    Parameters:
+    -----------
+    inFile : string
+        Matrix file (.npy) written by a 'npy' or 'mmap' sink.
+
+    outFile : string
+        Output ASCII file.
+
+    fmt : string (default : '%.5f')
+        Number format.
+    """
+
+    (mat, frames, index) = loadRows(inFile)
+    with open(outFile, 'w') as fid:
+        for i in range(0, mat.shape[0], 4096):
+            np.savetxt(fid, mat[i:i+4096], fmt=fmt, delimiter=' ')
+
+    # (input and output share the index if only the extension differs)
+    (framesFile, indexFile) = _indexFiles(outFile)
+    if framesFile != _indexFiles(inFile)[0]:
+        np.save(framesFile, frames)
+        index["rows"] = os.path.basename(framesFile)
+        with open(indexFile, 'w') as fid:
+            json.dump(index, fid, indent=2)
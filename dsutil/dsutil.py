@@ -32,9 +32,10 @@ __email__   = "E-Mail: roland.kwitt@kitware.com"
 __status__  = "Development"
 
 
+import os
 import time
-import cv2
-import cv2.cv as cv
+import tempfile
+import multiprocessing
 import numpy as np
 
 # import pyinfo module
@@ -128,6 +129,8 @@ def showMovie(frames, movSz, fps=20, transpose=False):
     transpose : boolean (defaukt : False)
         Transpose each frame.
     """
+    
+    import cv2
 
     if fps < 0:
         raise Exception("FPS < 0")
@@ -147,7 +150,172 @@ def showMovie(frames, movSz, fps=20, transpose=False):
             break
     
     
-def loadDataFromVideoFile(inFile):
+def _capProp(name):
+    """Get OpenCV video capture property by name, e.g., 'FRAME_COUNT'.
+    
+    (cv2.CAP_PROP_* in OpenCV >= 3, cv2.cv.CV_CAP_PROP_* in OpenCV 2.4)
+    """
+    
+    import cv2
+    
+    if hasattr(cv2, 'CAP_PROP_' + name):
+        return getattr(cv2, 'CAP_PROP_' + name)
+    import cv2.cv as cv
+    return getattr(cv, 'CV_CAP_PROP_' + name)
+    
+    
+def videoOptions(size=None, roi=None, stride=None, maxFrames=None):
+    """Parse (string) video reader options, e.g., from the command line.
+    
+    Parameters
+    ----------
+    size : string (default : None)
+        Target frame size as WIDTHxHEIGHT (e.g., '64x64'), or 'native'.
+        
+    roi : string (default : None)
+        ROI as X,Y,WIDTH,HEIGHT (e.g., '10,10,100,100').
+        
+    stride : string or int (default : None)
+        Keep every stride-th frame.
+        
+    maxFrames : string or int (default : None)
+        Read at most maxFrames frames.
+    
+    Returns
+    -------
+    opts : dict
+        Keyword arguments for iterVideoBlocks/loadDataFromVideoFile (only 
+        for the options that are set).
+        
+    Raises
+    ------
+    ErrorDS, if stride or maxFrames is < 1.
+    """
+    
+    opts = {}
+    if not size is None:
+        if size == 'native':
+            opts["size"] = None
+        else:
+            opts["size"] = tuple([int(v) for v in size.split('x')])
+    if not roi is None:
+        opts["roi"] = tuple([int(v) for v in roi.split(',')])
+    if not stride is None:
+        opts["stride"] = int(stride)
+        if opts["stride"] < 1:
+            raise ErrorDS("video frame stride needs to be >= 1!")
+    if not maxFrames is None:
+        opts["maxFrames"] = int(maxFrames)
+        if opts["maxFrames"] < 1:
+            raise ErrorDS("max. number of video frames needs to be >= 1!")
+    return opts
+    
+    
+def _prepFrame(frame, size, roi, gray=None):
+    """Convert a frame to grayscale, crop and resize it.
+    
+    Returns the preprocessed frame and the grayscale buffer (to be passed
+    as 'gray' for the next frame).
+    """
+    
+    import cv2
+    
+    if len(frame.shape) == 3:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, gray)
+    else:
+        gray = frame
+    img = gray
+    if not roi is None:
+        (x, y, w, h) = roi
+        img = img[y:y+h,x:x+w]
+    if not size is None:
+        img = cv2.resize(img, size)
+    return (img, gray)
+
+
+def iterVideoBlocks(inFile, blockSize=64, size=(64,64), roi=None, stride=1,
+                    maxFrames=None):
+    """Read an AVI video in blocks of frames.
+    
+    Frames are converted to grayscale, cropped and resized, and then written
+    straight into a preallocated block buffer. The buffer is REUSED for all 
+    blocks, i.e., the yielded blocks are views that are only valid until 
+    the next block is read (copy, if needed).
+    
+    Parameters
+    ----------
+    inFile : string
+        Name of the AVI input video file (might be color - if so, it will be 
+        converted to grayscale).
+        
+    blockSize : int (default : 64)
+        Number of frames per block (the last block might be shorter).
+        
+    size : tuple of (width, height) (default : (64,64))
+        Target frame size (None keeps the size of the (cropped) frames).
+        
+    roi : tuple of (x, y, width, height) (default : None)
+        Crop frames to ROI before resizing.
+        
+    stride : int (default : 1)
+        Keep every stride-th frame.
+        
+    maxFrames : int (default : None)
+        Read at most maxFrames frames (after striding).
+        
+    Returns
+    -------
+    Generator yielding tuples of
+    
+        block : numpy array, shape = (N, n), dtype = float32
+            Block of n <= blockSize frames as N-dimensional column vectors.
+            
+        frmSiz : tuple of (height, width)    
+            The frame dimensions.
+    """
+    
+    import cv2
+    
+    if stride < 1:
+        raise ErrorDS("stride < 1!")
+    if not maxFrames is None and maxFrames < 1:
+        raise ErrorDS("maxFrames < 1!")
+    
+    capture = cv2.VideoCapture(inFile)
+    flag, frame = capture.read()
+    if flag == 0:
+        raise ErrorDS("Could not read %s!" % inFile)
+    
+    # frames (rows of buf) are contiguous, blocks are transposed views
+    buf = None
+    gray = None
+    
+    cnt = 0
+    while maxFrames is None or cnt < maxFrames:
+        (img, gray) = _prepFrame(frame, size, roi, gray)
+        
+        if buf is None:
+            frmSiz = img.shape
+            buf = np.empty((blockSize, np.prod(frmSiz)), dtype=np.float32)
+        
+        buf[cnt % blockSize,:] = img.reshape(-1)
+        cnt += 1
+        if cnt % blockSize == 0:
+            yield (buf.T, frmSiz)
+        
+        # skip (i.e., only grab) frames in between
+        for i in range(stride-1):
+            capture.grab()
+        flag, frame = capture.read(frame)
+        if flag == 0:
+            break
+    
+    if cnt % blockSize > 0:
+        yield (buf[0:cnt % blockSize].T, frmSiz)
+    
+    
+def loadDataFromVideoFile(inFile, size=(64,64), roi=None, stride=1, 
+                          maxFrames=None):
     """Read an AVI video into a data matrix.
     
     Parameters
@@ -156,6 +324,9 @@ def loadDataFromVideoFile(inFile):
         Name of the AVI input video file (might be color - if so, it will be 
         converted to grayscale).
         
+    size, roi, stride, maxFrames : 
+        Video reader options (see iterVideoBlocks).
+        
     Returns
     -------
     dataMat : numpy array, shape = (N, D)
@@ -165,42 +336,292 @@ def loadDataFromVideoFile(inFile):
     dataSiz : tuple of (height, width, D)    
         The video dimensions.
     """
+    
+    # the frame count is only used as a hint (it's often wrong)
+    D = max(_numFrames(inFile, stride, maxFrames), 1)
+    
+    data = None
+    cnt = 0
+    for (block, frmSiz) in iterVideoBlocks(inFile, 64, size, roi, stride, 
+                                           maxFrames):
+        n = block.shape[1]
+        if data is None:
+            data = np.empty((D, block.shape[0]), dtype=np.float32)
+        if cnt + n > data.shape[0]:
+            tmp = np.empty((max(2*data.shape[0], cnt + n), data.shape[1]),
+                           dtype=np.float32)
+            tmp[0:cnt] = data[0:cnt]
+            data = tmp
+        data[cnt:cnt+n] = block.T
+        cnt += n
+    
+    return (data[0:cnt].T, (frmSiz[0], frmSiz[1], cnt))
+    
 
+def _numFrames(inFile, stride=1, maxFrames=None):
+    """Get the number of frames (after striding) a video claims to have.
+    """
+    
+    import cv2
+    
     capture = cv2.VideoCapture(inFile)
+    D = int(capture.get(_capProp('FRAME_COUNT')))
+    capture.release()
+    D = max((D + stride - 1) // stride, 0)
+    if not maxFrames is None:
+        D = min(D, maxFrames)
+    return D
+    
 
-    flag, frame = capture.read()
-    if flag == 0:
-        raise ErrorDS("Could not read %s!" % inFile)
+def _isSeekable(inFile, pos):
+    """Check if we can seek to frame 'pos' of a video (quick check of the
+    reported position only; the decoded frames are verified after decoding,
+    see _seeksMatch).
+    """
     
-    if len(frame.shape) == 3:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    import cv2
+    
+    capture = cv2.VideoCapture(inFile)
+    ok = (capture.set(_capProp('POS_FRAMES'), pos) and 
+          int(capture.get(_capProp('POS_FRAMES'))) == pos and
+          capture.grab() and
+          int(capture.get(_capProp('POS_FRAMES'))) == pos + 1)
+    capture.release()
+    return ok
     
-    N = np.prod(frame.shape)
-    D = int(capture.get(cv.CV_CAP_PROP_FRAME_COUNT))
-    (height, width) = frame.shape
 
-    #dataMat = np.zeros((N, D), dtype=np.float32)
-    dataMat = np.zeros((64*64,D), dtype=np.float32)
-    newF = cv2.resize(frame, (64,64))
+def _decodeSegment(args):
+    """Decode frames [k0, k1) (after striding) of a video into rows of a 
+    memory-mapped data matrix (worker of loadDataFromVideoFileMP).
     
-    dataMat[:,0] = newF.reshape(-1) #frame.reshape(-1)
+    If k1 is None, frames are decoded until the end of the video; frames 
+    beyond the (claimed) size of the data matrix are appended to its file.
+    Otherwise, frame k1 is decoded as well (but not written), s.t. the 
+    start of the next segment can be verified.
+    
+    Returns the number of decoded frames and frame k1 (None if k1 is None
+    or the video ends before).
+    """
+    
+    import cv2
+    
+    (inFile, outFile, shape, k0, k1, size, roi, stride) = args
+    
+    capture = cv2.VideoCapture(inFile)
+    if k0 > 0:
+        pos = k0*stride
+        capture.set(_capProp('POS_FRAMES'), pos)
+        if int(capture.get(_capProp('POS_FRAMES'))) != pos:
+            raise ErrorDS("Could not seek to frame %d in %s!" % (pos, inFile))
+    
+    data = np.memmap(outFile, dtype=np.float32, mode='r+', shape=shape)
+    tail = None
+    gray = None
+    nextFrame = None
+    k = k0
+    try:
+        while k1 is None or k < k1:
+            flag, frame = capture.read()
+            if flag == 0:
+                break
+            (img, gray) = _prepFrame(frame, size, roi, gray)
+            if k < shape[0]:
+                data[k,:] = img.reshape(-1)
+            else:
+                if tail is None:
+                    tail = open(outFile, 'ab')
+                tail.write(np.asarray(img, dtype=np.float32).tostring())
+            k += 1
+            for i in range(stride-1):
+                capture.grab()
+        
+        if not k1 is None and k == k1:
+            flag, frame = capture.read()
+            if flag != 0:
+                (img, gray) = _prepFrame(frame, size, roi, gray)
+                nextFrame = np.asarray(img, dtype=np.float32).reshape(-1)
+    finally:
+        capture.release()
+        if not tail is None:
+            tail.close()
+    data.flush()
+    del data
+    return (k - k0, nextFrame)
+    
+    
+def _seeksMatch(outFile, shape, bounds, res):
+    """Check that each segment (decoded after seeking) starts with the frame
+    that follows the previous segment (see _decodeSegment).
+    """
+    
+    data = np.memmap(outFile, dtype=np.float32, mode='r', shape=shape)
+    try:
+        for i in range(1, len(bounds)-1):
+            nextFrame = res[i-1][1]
+            if nextFrame is None or not np.array_equal(nextFrame, 
+                                                       data[bounds[i]]):
+                return False
+        return True
+    finally:
+        del data
+    
+    
+def loadDataFromVideoFileMP(inFile, nProcs=None, outFile=None, size=(64,64),
+                            roi=None, stride=1, maxFrames=None, 
+                            minSegment=64):
+    """Read an AVI video into a (memory-mapped) data matrix, using multiple
+    processes.
+    
+    The video is split into segments of consecutive frames which are 
+    decoded in parallel (each process seeks to the start of its segment) and 
+    written into one memory-mapped data matrix; the last segment is decoded
+    until the end of the video, i.e., a too low frame count is harmless. 
+    Seeking is verified: the first frame of each segment needs to be equal 
+    to the frame that follows the previous segment (decoded without 
+    seeking). In case the video is not (frame-accurately) seekable (or the
+    frame count is unknown or too high), the video is decoded sequentially.
+    
+    Parameters
+    ----------
+    inFile : string
+        Name of the AVI input video file (might be color - if so, it will be 
+        converted to grayscale).
+        
+    nProcs : int (default : None)
+        Number of processes (None uses all CPUs).
+        
+    outFile : string (default : None)
+        File backing the data matrix (raw float32 data, frames as rows). If 
+        None, a temporary file is used (and removed once mapped).
+        
+    size, roi, stride, maxFrames : 
+        Video reader options (see iterVideoBlocks).
+        
+    minSegment : int (default : 64)
+        Min. number of frames per segment.
+        
+    Returns
+    -------
+    dataMat : numpy array, shape = (N, D)
+        Output data matrix, where N is the number of pixel in each of the D
+        frames (transposed view of a memory-mapped array).
+        
+    dataSiz : tuple of (height, width, D)    
+        The video dimensions.
+    """
+    
+    if nProcs is None:
+        nProcs = multiprocessing.cpu_count()
+    
+    D = _numFrames(inFile, stride, maxFrames)
+    nSeg = min(nProcs, D // minSegment)
+    
+    # get the frame dimensions from the first frame
+    (block, frmSiz) = next(iterVideoBlocks(inFile, 1, size, roi))
+    N = block.shape[0]
+    
+    isTmp = outFile is None
+    if isTmp:
+        (fd, outFile) = tempfile.mkstemp(suffix='.dat')
+        os.close(fd)
+    
+    try:
+        cnt = 0
+        if nSeg > 1 and _isSeekable(inFile, (D // 2)*stride):
+            data = np.memmap(outFile, dtype=np.float32, mode='w+', shape=(D,N))
+            del data
+            
+            # the last segment is decoded until the end of the video (or
+            # maxFrames), i.e., frames beyond the frame count are not lost
+            bounds = np.linspace(0, D, nSeg+1).astype(int)
+            jobs = [(inFile, outFile, (D, N), bounds[i], 
+                     bounds[i+1] if i < nSeg-1 else maxFrames, size, roi,
+                     stride) for i in range(nSeg)]
+            pool = multiprocessing.Pool(nSeg)
+            try:
+                res = pool.map(_decodeSegment, jobs)
+            except ErrorDS as e:
+                dsinfo.warn("%s (decoding sequentially)" % e)
+                res = None
+            finally:
+                pool.close()
+                pool.join()
+            
+            # all segments, except the last one, need to be complete
+            if not res is None:
+                counts = [r[0] for r in res]
+                if not all([counts[i] == bounds[i+1]-bounds[i] 
+                            for i in range(nSeg-1)]):
+                    dsinfo.warn("Frame count of %s is wrong "
+                                "(decoding sequentially)" % inFile)
+                elif not _seeksMatch(outFile, (D, N), bounds, res):
+                    dsinfo.warn("Seeking in %s is not frame-accurate "
+                                "(decoding sequentially)" % inFile)
+                else:
+                    cnt = bounds[-2] + counts[-1]
+        
+        if cnt == 0:
+            (dataMat, dataSiz) = loadDataFromVideoFile(inFile, size, roi, 
+                                                       stride, maxFrames)
+            cnt = dataSiz[2]
+            data = np.memmap(outFile, dtype=np.float32, mode='w+', 
+                             shape=(cnt,N))
+            data[:] = dataMat.T
+            del data, dataMat
+        
+        with open(outFile, 'r+b') as fid:
+            fid.truncate(cnt*N*np.dtype(np.float32).itemsize)
+        data = np.memmap(outFile, dtype=np.float32, mode='r+', shape=(cnt,N))
+    finally:
+        if isTmp:
+            os.remove(outFile)
+    
+    return (data.T, (frmSiz[0], frmSiz[1], cnt))
     
-    cnt = 1
-    while True:
-        flag, frame = capture.read()
-        if flag == 0:
-            break
-        if len(frame.shape) == 3:
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        newF = cv2.resize(frame, (64,64))
-        dataMat[:,cnt] = newF.reshape(-1) #frame.reshape(-1)
-        cnt += 1  
+# magic string of pydstk's binary data files
+_BINARY_MAGIC = 'PYDSTKB1'
 
-    return (dataMat, (64,64,D))
-    #return (dataMat, (height, width, D))
+# size of the binary data file header (magic + HEIGHT, WIDTH, FRAMES as int32)
+_BINARY_HEADER_LEN = len(_BINARY_MAGIC) + 3*4
+
+
+def _readASCIIHeader(fid, inFile):
+    """Read (HEIGHT WIDTH FRAMES) header of an ASCII data file.
+    """
+    
+    try:
+        dataSiz = tuple([int(x) for x in fid.readline().split()])
+    except ValueError:
+        dataSiz = ()
+    if len(dataSiz) != 3:
+        raise ErrorDS("invalid header when reading %s!" % inFile)
+    return dataSiz
     
 
+def _iterASCIIChunks(fid, chunkSize=1<<24):
+    """Parse whitespace-separated numbers from file in chunks (of chunkSize 
+    bytes) and yield them as 1D float32 arrays.
+    """
+    
+    rest = ''
+    while True:
+        chunk = fid.read(chunkSize)
+        if not chunk:
+            break
+        chunk = rest + chunk
+        
+        # do not split numbers at chunk boundaries
+        pos = max(chunk.rfind(' '), chunk.rfind('\n'), chunk.rfind('\t'))
+        if pos < 0:
+            rest = chunk
+            continue
+        rest = chunk[pos+1:]
+        yield np.fromstring(chunk[0:pos+1], dtype=np.float32, sep=' ')
+    if rest.strip():
+        yield np.fromstring(rest, dtype=np.float32, sep=' ')
+        
+        
 def loadDataFromASCIIFile(inFile):
     """Read an ASCII file into a data matrix.
     
@@ -231,17 +652,167 @@ def loadDataFromASCIIFile(inFile):
     """
 
     with open(inFile) as fid:
-        header = fid.readline()
+        dataSiz = _readASCIIHeader(fid, inFile)
+        (N, D) = (dataSiz[0]*dataSiz[1], dataSiz[2])
+        
+        # parse chunks straight into the (preallocated) data matrix
+        dataMat = np.empty((N*D,), dtype=np.float32)
+        cnt = 0
+        for values in _iterASCIIChunks(fid):
+            if cnt + len(values) > N*D:
+                raise ErrorDS("too many values in %s!" % inFile)
+            dataMat[cnt:cnt+len(values)] = values
+            cnt += len(values)
+        
+    if cnt != N*D:
+        raise ErrorDS("expected %d values in %s, got %d!" % (N*D, inFile, cnt))
+    return (dataMat.reshape((N, D)), dataSiz)
     
-    dataSiz = [int(x) for x in header.split(' ')]
-    if len(dataSiz) != 3:
-        raise ErrorDS("invalid header when reading %s!" % inFile)
     
-    dataMat = np.genfromtxt(inFile, dtype=np.float32, skip_header=1)    
+def loadDataFromBinaryFile(inFile, mmap=True):
+    """Read a binary data file into a data matrix.
+    
+    The binary format consists of a header (magic string 'PYDSTKB1', followed
+    by HEIGHT, WIDTH and FRAMES as little-endian int32), followed by the 
+    (N, D) data matrix as raw float32 values in row-major order (see also
+    saveDataToBinaryFile and convertASCIIToBinary).
+    
+    Parameters
+    ----------
+    inFile : string
+        Input file name.
+        
+    mmap : boolean (default : True)
+        Memory-map the data matrix (read-only) instead of reading it.
+    
+    Returns
+    -------
+    dataMat : numpy array, shape = (N, D)
+        Output data matrix, where N = (width x height)
+        
+    dataSiz : tuple of (height, width, D)    
+        The video dimensions.
+    """
+    
+    with open(inFile, 'rb') as fid:
+        header = fid.read(_BINARY_HEADER_LEN)
+        if (len(header) != _BINARY_HEADER_LEN or 
+            not header.startswith(_BINARY_MAGIC)):
+            raise ErrorDS("invalid header when reading %s!" % inFile)
+        dataSiz = tuple(np.frombuffer(header[len(_BINARY_MAGIC):], 
+                                      dtype='<i4').tolist())
+        (N, D) = (dataSiz[0]*dataSiz[1], dataSiz[2])
+        
+        if os.fstat(fid.fileno()).st_size != _BINARY_HEADER_LEN + N*D*4:
+            raise ErrorDS("size mismatch when reading %s!" % inFile)
+        
+        if mmap:
+            dataMat = np.memmap(inFile, dtype='<f4', mode='r', 
+                                offset=_BINARY_HEADER_LEN, shape=(N, D))
+        else:
+            dataMat = np.fromfile(fid, dtype='<f4').reshape((N, D))
     return (dataMat, dataSiz)
     
     
-def loadDataFromIListFile(inFile):
+def _writeBinaryHeader(fid, dataSiz):
+    """Write header of a binary data file.
+    """
+    
+    fid.write(_BINARY_MAGIC)
+    fid.write(np.asarray(dataSiz, dtype='<i4').tostring())
+    
+    
+def saveDataToBinaryFile(outFile, dataMat, dataSiz):
+    """Write a data matrix to a binary data file.
+    
+    Parameters
+    ----------
+    outFile : string
+        Output file name.
+        
+    dataMat : numpy array, shape = (N, D)
+        Data matrix, where N = (width x height)
+        
+    dataSiz : tuple of (height, width, D)    
+        The video dimensions.
+    """
+    
+    if dataMat.shape != (dataSiz[0]*dataSiz[1], dataSiz[2]):
+        raise ErrorDS("data matrix does not match video dimensions!")
+    
+    with open(outFile, 'wb') as fid:
+        _writeBinaryHeader(fid, dataSiz)
+        for i in range(0, dataMat.shape[0], 4096):
+            fid.write(np.ascontiguousarray(dataMat[i:i+4096], 
+                                           dtype='<f4').tostring())
+        
+
+def convertASCIIToBinary(inFile, outFile):
+    """Convert an ASCII data file to a binary data file.
+    
+    The ASCII file is parsed chunk-wise and written to the binary file
+    on-the-fly (i.e., the data matrix is never held in memory).
+    
+    Parameters
+    ----------
+    inFile : string
+        Input (ASCII) file name (see loadDataFromASCIIFile).
+        
+    outFile : string
+        Output (binary) file name (see loadDataFromBinaryFile).
+        
+    Returns
+    -------
+    dataSiz : tuple of (height, width, D)    
+        The video dimensions.
+    """
+    
+    with open(inFile) as fid, open(outFile, 'wb') as out:
+        dataSiz = _readASCIIHeader(fid, inFile)
+        _writeBinaryHeader(out, dataSiz)
+        
+        cnt = 0
+        for values in _iterASCIIChunks(fid):
+            out.write(values.astype('<f4').tostring())
+            cnt += len(values)
+    
+    if cnt != dataSiz[0]*dataSiz[1]*dataSiz[2]:
+        os.remove(outFile)
+        raise ErrorDS("expected %d values in %s, got %d!" % 
+                      (dataSiz[0]*dataSiz[1]*dataSiz[2], inFile, cnt))
+    return dataSiz
+    
+    
+def _readImage(imFile):
+    """Read a (grayscale) image as numpy array.
+    
+    Images are read via OpenCV; formats not supported by OpenCV (e.g., 
+    MetaImage or NRRD) are read via SimpleITK.
+    """
+    
+    import cv2
+    
+    img = cv2.imread(imFile, cv2.IMREAD_UNCHANGED)
+    if img is None:
+        import SimpleITK as sitk
+        img = sitk.GetArrayFromImage(sitk.ReadImage(imFile))
+    if len(img.shape) > 2:
+        raise ErrorDS("Only grayscale images are supported (%s)!" % imFile)
+    return img
+    
+
+def infoProgress(nDone, nTotal, elapsed):
+    """Progress hook (see loadDataFromIListFile) that prints progress in 
+    steps of 10%.
+    """
+    
+    step = max(nTotal // 10, 1)
+    if nDone % step == 0 or nDone == nTotal:
+        dsinfo.info("%d/%d images loaded (%.2f [sec])" % 
+                    (nDone, nTotal, elapsed))
+    
+    
+def loadDataFromIListFile(inFile, size=None, nThreads=None, progress=None):
     """Read list of image files into a data matrix.
     
     Reads a file with absolute image filenames, e.g.,
@@ -250,13 +821,25 @@ def loadDataFromIListFile(inFile):
     /tmp/im1.png
     ...
     
-    into a data matrix with images as column vectors. 
+    into a data matrix with images as column vectors. The first image 
+    determines the image size; all remaining images are decoded by a pool 
+    of threads directly into the (preallocated) data matrix.
     
     Parameters
     ----------
     inFile : string
         Input file name.
         
+    size : tuple of (width, height) (default : None)
+        Resize images to size (None keeps the original size).
+        
+    nThreads : int (default : None)
+        Number of decoding threads (None uses #CPUs).
+        
+    progress : callable (default : None)
+        Called as progress(nDone, nTotal, elapsed) after each image, e.g., 
+        infoProgress.
+        
     Returns
     -------
     dataMat : numpy array, shape = (N, #images)
@@ -265,26 +848,50 @@ def loadDataFromIListFile(inFile):
     dataSiz : tuple of (height, width, #images)    
         The video dimensions.
     """
-    import SimpleITK as sitk
     
-    with open(inFile) as fid:
-        fileNames = fid.readlines()
-    
-    dataMat = None
-    for i, imFile in enumerate(fileNames):
-        img = sitk.ReadImage(imFile.rstrip())        
-        mat = sitk.GetArrayFromImage(img)
-        
-        if len(mat.shape) > 2:
-            raise ErrorDS("Only grayscale images are supported!")
-        
-        if dataMat is None:
-            dataMat = np.zeros((np.prod(mat.shape),len(fileNames)))
-        dataMat[:,i] = dat.reshape(-1)
+    import cv2
+    from multiprocessing.pool import ThreadPool
     
-    return (dataMat, (mat.shape[0], mat.shapep[1], len(fileNames)))    
-        
-        
-        
-        
-        
+    with open(inFile) as fid:
+        fileNames = [l.strip() for l in fid if l.strip()]
+    if len(fileNames) == 0:
+        raise ErrorDS("no images listed in %s!" % inFile)
+    
+    tStart = time.time()
+    
+    # first image determines the size of the data matrix
+    img = _readImage(fileNames[0])
+    imgShape = img.shape
+    if not size is None:
+        img = cv2.resize(img, size)
+    
+    # images are rows of data (i.e., columns of the returned matrix)
+    data = np.empty((len(fileNames), img.size), dtype=np.float32)
+    data[0,:] = img.reshape(-1)
+    
+    def readInto(i):
+        img = _readImage(fileNames[i])
+        if img.shape != imgShape:
+            raise ErrorDS("size of %s (%s) differs from %s (%s)!" % 
+                (fileNames[i], img.shape, fileNames[0], imgShape))
+        if not size is None:
+            img = cv2.resize(img, size)
+        data[i,:] = img.reshape(-1)
+        return i
+    
+    if not progress is None:
+        progress(1, len(fileNames), time.time() - tStart)
+    
+    if nThreads is None:
+        nThreads = multiprocessing.cpu_count()
+    pool = ThreadPool(nThreads)
+    try:
+        for (nDone, _) in enumerate(pool.imap_unordered(readInto, 
+                                    range(1, len(fileNames)), 16), 2):
+            if not progress is None:
+                progress(nDone, len(fileNames), time.time() - tStart)
+    finally:
+        pool.terminate()
+        pool.join()
+    
+    return (data.T, (img.shape[0], img.shape[1], len(fileNames)))
@@ -34,17 +34,18 @@ __status__  = "Development"
 
 import os
 import sys
-import pickle
 from optparse import OptionParser
 
 # import classes from modules in dsutil/dscore package
 from dsutil.dsutil import Timer
+from dsutil.dscache import FrameCache, SysIDCache
 from dscore.system import LinearDS
 from dscore.dsexcp import ErrorDS
 
 # import modules from dsutil package
 import dsutil.dsutil as dsutil
 import dsutil.dsinfo as dsinfo
+import dsutil.dsio as dsio
 
 
 def usage():
@@ -63,10 +64,21 @@ OPTIONS (Overview):
     
         'vFile' - AVI video file
         'aFile' - ASCII data file
+        'bFile' - Binary data file (see ascii2bin.py)
         'lFile' - Image list file 
         
+    [-z ARG] -- Video frame (image) size, WxH or 'native' (default: 64x64
+                for videos, 'native' for images)
+    [-c ARG] -- Crop video frames to ROI X,Y,W,H before resizing
+    [-k ARG] -- Use every ARG-th video frame (default: 1)
+    [-l ARG] -- Use at most ARG video frames
+    [-j ARG] -- Decode video using ARG processes (default: 1)
+    [-C ARG] -- Cache decoded videos in directory ARG
+    [-E ARG] -- Cache estimated models in directory ARG
     [-n ARG] -- LDS states (default: 5)
-    [-o ARG] -- Save DT parameters -> ARG 
+    [-o ARG] -- Save DT parameters -> ARG (*.npz or *.pkl)
+    [-d] -- Save distance-only DT parameters (*.npz only)
+    [-r] -- Compact DT after estimation (no synthesis possible)
     [-p ARG] -- Load DT parameters <- ARG
     [-m ARG] -- FPS for synthesis movie (default: 20)
     [-e] -- Run estimation (default: False)
@@ -88,8 +100,18 @@ def main(argv=None):
     parser.add_option("-p", dest="pFile")
     parser.add_option("-i", dest="iFile") 
     parser.add_option("-t", dest="iType")
+    parser.add_option("-z", dest="vSize")
+    parser.add_option("-c", dest="vROI")
+    parser.add_option("-k", dest="vStride")
+    parser.add_option("-l", dest="vMaxFr")
+    parser.add_option("-j", dest="vProcs", type="int", default=1)
+    parser.add_option("-C", dest="vCache")
+    parser.add_option("-E", dest="sCache")
     parser.add_option("-o", dest="oFile")
+    parser.add_option("-d", dest="profile", action="store_const", 
+                      const="distance", default="full")
     parser.add_option("-n", dest="nStates", type="int", default=+5)
+    parser.add_option("-r", dest="compact", action="store_true", default=False)
     parser.add_option("-m", dest="doMovie", type="int", default=-1)
     parser.add_option("-a", dest="svdRand", action="store_true", default=False)
     parser.add_option("-e", dest="doEstim", action="store_true", default=False)
@@ -105,13 +127,32 @@ def main(argv=None):
     dataSiz = None
     try:
         if opt.iType == 'vFile':
-            (dataMat, dataSiz) = dsutil.loadDataFromVideoFile(opt.iFile)
+            vidOpts = dsutil.videoOptions(opt.vSize, opt.vROI, opt.vStride,
+                                          opt.vMaxFr)
+            if not opt.vCache is None:
+                cache = FrameCache(opt.vCache)
+                (dataMat, dataSiz) = cache.loadDataFromVideoFile(opt.iFile,
+                    opt.vProcs, **vidOpts)
+                if opt.verbose:
+                    dsinfo.info("Cache: %(hits)d hits, %(misses)d misses, "
+                                "%(evictions)d evictions" % cache.stats())
+            elif opt.vProcs > 1:
+                (dataMat, dataSiz) = dsutil.loadDataFromVideoFileMP(opt.iFile,
+                    opt.vProcs, **vidOpts)
+            else:
+                (dataMat, dataSiz) = dsutil.loadDataFromVideoFile(opt.iFile,
+                                                                  **vidOpts)
         elif opt.iType == 'aFile':
             (dataMat, dataSiz) = dsutil.loadDataFromASCIIFile(opt.iFile)
+        elif opt.iType == 'bFile':
+            (dataMat, dataSiz) = dsutil.loadDataFromBinaryFile(opt.iFile)
         elif opt.iType == 'lFile':
-            (dataMat, dataSiz) = dsutil.loadDataFromIListFile(opt.iFile)
+            imgOpts = dsutil.videoOptions(opt.vSize)
+            progress = dsutil.infoProgress if opt.verbose else None
+            (dataMat, dataSiz) = dsutil.loadDataFromIListFile(opt.iFile,
+                imgOpts.get("size"), None, progress)
         else:
-            msg.fail("Unsupported file type : %s", opt.iType)    
+            dsinfo.fail("Unsupported file type : %s" % opt.iType)
             return -1
     except Exception as e:
         dsinfo.fail(e)
@@ -120,17 +161,30 @@ def main(argv=None):
     try:
         # try loading the DT model
         if not opt.pFile is None:
-            with open(opt.pFile) as fid:
-                dsinfo.info('trying to load model %s' % opt.pFile)
-                dt = pickle.load(fid)
+            dsinfo.info('trying to load model %s' % opt.pFile)
+            dt = dsio.loadModel(opt.pFile)
 
         # run estimation
         if opt.doEstim:
             if not opt.pFile is None:
                 dsinfo.fail('re-estimation attempt detected!')
                 return -1
-            dt = LinearDS(opt.nStates, approx=opt.svdRand, verbose=opt.verbose)
-            dt.suboptimalSysID(dataMat)
+            if opt.compact and opt.doSynth:
+                dsinfo.fail('cannot synthesize from compacted model!')
+                return -1
+            dt = LinearDS(opt.nStates, approx=opt.svdRand, verbose=opt.verbose,
+                          compact=opt.compact)
+            if not opt.sCache is None:
+                cache = SysIDCache(opt.sCache)
+                dt = cache.suboptimalSysID(dt, dataMat)
+                if opt.verbose:
+                    dsinfo.info("SysID cache: %(hits)d hits, %(diskHits)d "
+                                "disk hits, %(misses)d misses" % cache.stats())
+            else:
+                dt.suboptimalSysID(dataMat)
+            if opt.verbose:
+                dsinfo.info('model footprint: %.1f [KB] (%.1f [KB] mapped)' %
+                            (dt.footprint()/1024., dt.footprint(True)/1024.))
 
         # synthesize output
         if opt.doSynth:
@@ -144,8 +198,7 @@ def main(argv=None):
         # write DT model to file
         if not opt.oFile is None:
             dsinfo.info('writing model to %s' % opt.oFile)
-            with open(opt.oFile, 'w') as fid:
-                pickle.dump(dt, fid)
+            dsio.saveModel(dt, opt.oFile, opt.profile)
      
     # catch pyds exceptions
     except ErrorDS as e:
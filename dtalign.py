@@ -0,0 +1,124 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Batch alignment (state-space mapping or JCF conversion) of DT models.
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+# generic imports
+import sys
+import time
+from optparse import OptionParser
+
+# import pyds package content
+import dsutil.dsinfo as dsinfo
+import dsutil.dsbatch as dsbatch
+
+# import classes from dscore package
+from dscore.dsexcp import ErrorDS
+
+
+def usage():
+    """Print usage information"""
+    print("""
+Batch alignment of Dynamic Texture (DT) models.
+
+Maps DT models into the state-space of a reference DT model (mode 'ssm')
+or converts them to Jordan Canonical Form (mode 'jcf') and writes them to
+an output directory.
+
+USAGE:
+    {0} [OPTIONS]
+    {0} -h
+
+OPTIONS (Overview):
+
+    -s ARG -- DT models to align
+    
+        Model file (*.npz/*.pkl), directory (all model files) or list file (one
+        model file per line)
+    
+    -o ARG -- Output directory
+    [-r ARG] -- Reference DT model (required for mode 'ssm')
+    [-m ARG] -- Mode ('ssm' or 'jcf', default: ssm)
+    [-b ARG] -- Number of models per batch (default: 256)
+    [-d] -- Save distance-only DT parameters (*.npz only)
+    [-v] -- Verbose output (default: False)
+        
+AUTHOR: Roland Kwitt, Kitware Inc., 2013
+        roland.kwitt@kitware.com
+""".format(sys.argv[0]))
+    sys.exit(-1)
+
+
+def main(argv=None):
+    if argv is None: 
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-s", dest="srcModels")
+    parser.add_option("-r", dest="refModel") 
+    parser.add_option("-o", dest="outDir")
+    parser.add_option("-m", dest="mode", default='ssm')
+    parser.add_option("-b", dest="batchSize", type="int", default=256)
+    parser.add_option("-d", dest="profile", action="store_const", 
+                      const="distance", default="full")
+    parser.add_option("-h", dest="shoHelp", action="store_true", default=False)
+    parser.add_option("-v", dest="verbose", action="store_true", default=False) 
+    opt, args = parser.parse_args()
+    
+    if opt.shoHelp: 
+        usage()
+    
+    if (opt.srcModels is None or opt.outDir is None or 
+        (opt.mode == 'ssm' and opt.refModel is None)):
+        dsinfo.warn('Options missing!')
+        usage()
+    
+    def report(i, outFile, err):
+        if err is None:
+            dsinfo.info('%s' % outFile)
+        else:
+            dsinfo.info('%s (err = %.4f)' % (outFile, err))
+    
+    try:
+        srcFiles = dsbatch.listModels(opt.srcModels)
+        tStart = time.time()
+        dsbatch.alignModels(opt.refModel, srcFiles, opt.outDir, opt.mode,
+            opt.batchSize, opt.profile, report if opt.verbose else None)
+        dsinfo.info('aligned %d models in %.3f [sec]' % 
+                    (len(srcFiles), time.time() - tStart))
+    except (ErrorDS, IOError) as e:
+        dsinfo.fail(e)
+        return -1
+        
+            
+if __name__ == '__main__':
+    sys.exit(main())
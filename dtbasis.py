@@ -0,0 +1,145 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Learn a global observation basis (PCA) for DT models.
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+# generic imports
+import sys
+import time
+from optparse import OptionParser
+
+# import pyds package content
+import dsutil.dsutil as dsutil
+import dsutil.dsinfo as dsinfo
+
+# import classes from dscore package
+from dscore.dsexcp import ErrorDS
+from dscore.dsbasis import ObservationBasis
+
+from gendb import findVideos
+
+
+def usage():
+    """Print usage information"""
+    print("""
+Learn a global observation basis for Dynamic Texture (DT) models.
+
+The frames of all (template) videos are read block-by-block, randomly 
+subsampled and used to update a truncated SVD, i.e., the videos are never
+entirely in memory. The basis is written to a .npz file (see gendb.py -b).
+
+USAGE:
+    {0} [OPTIONS]
+    {0} -h
+
+OPTIONS (Overview):
+
+    -v ARG -- Base directory of videos (searched recursively)
+    -o ARG -- Output basis file (*.npz)
+    [-d ARG] -- Dimensionality of the basis (default: 64)
+    [-r ARG] -- Fraction of frames to use (default: 1.0)
+    [-s ARG] -- Seed of the frame sampling (default: 0)
+    [-g ARG] -- Video file pattern (default: ks*.avi)
+    [-z ARG] -- Video frame size, WxH or 'native' (default: 64x64)
+    [-c ARG] -- Crop video frames to ROI X,Y,W,H before resizing
+    [-k ARG] -- Use every ARG-th video frame (default: 1)
+    [-l ARG] -- Use at most ARG video frames (per video)
+    [-x] -- Verbose output
+
+    Video options need to match those of the DT models (see gendb.py).
+        
+AUTHOR: Roland Kwitt, Kitware Inc., 2013
+        roland.kwitt@kitware.com
+""".format(sys.argv[0]))
+    sys.exit(-1)
+
+
+def main(argv=None):
+    if argv is None: 
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-v", dest="videos")
+    parser.add_option("-o", dest="outFile")
+    parser.add_option("-d", dest="dims", type="int", default=64)
+    parser.add_option("-r", dest="rate", type="float", default=1.0)
+    parser.add_option("-s", dest="seed", type="int", default=0)
+    parser.add_option("-g", dest="pattern", default='ks*.avi')
+    parser.add_option("-z", dest="vSize")
+    parser.add_option("-c", dest="vROI")
+    parser.add_option("-k", dest="vStride")
+    parser.add_option("-l", dest="vMaxFr")
+    parser.add_option("-h", dest="shoHelp", action="store_true", default=False)
+    parser.add_option("-x", dest="verbose", action="store_true", default=False)
+    opt, args = parser.parse_args()
+    
+    if opt.shoHelp: 
+        usage()
+    
+    if opt.videos is None or opt.outFile is None:
+        dsinfo.warn('Options missing!')
+        usage()
+    
+    if opt.rate <= 0 or opt.rate > 1:
+        dsinfo.fail('Sampling rate needs to be in (0,1]!')
+        return -1
+    
+    try:
+        vidOpts = dsutil.videoOptions(opt.vSize, opt.vROI, opt.vStride, 
+                                      opt.vMaxFr)
+    except ErrorDS as e:
+        dsinfo.fail(e)
+        return -1
+    videos = findVideos(opt.videos, opt.pattern)
+    
+    def blocks():
+        for videoFile in videos:
+            if opt.verbose:
+                dsinfo.info('reading %s' % videoFile)
+            for (block, frmSiz) in dsutil.iterVideoBlocks(videoFile, 
+                                                          **vidOpts):
+                yield block
+    
+    try:
+        tStart = time.time()
+        basis = ObservationBasis.fit(blocks(), opt.dims, opt.rate, opt.seed)
+        basis.save(opt.outFile)
+        dsinfo.info('learned %d-dim. basis %s from %d videos in %.3f [sec]' %
+                    (basis.dim(), basis.id(), len(videos), 
+                     time.time() - tStart))
+    except (ErrorDS, IOError) as e:
+        dsinfo.fail(e)
+        return -1
+        
+            
+if __name__ == '__main__':
+    sys.exit(main())
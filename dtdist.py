@@ -34,20 +34,17 @@ __status__  = "Development"
 
 # generic imports
 import os
-import cv2
 import sys
-import time
-import pickle
-import numpy as np
-import cv2.cv as cv
 from optparse import OptionParser
 
 # import pyds package content
 import dscore.dsdist as dsdist
-import dsutil.dsutil as dsutil
 import dsutil.dsinfo as dsinfo
+import dsutil.dssink as dssink
+import dsutil.dsbatch as dsbatch
 
-# import LinearDS class from dscore package
+# import classes from dscore package
+from dscore.dsexcp import ErrorDS
 from dscore.system import LinearDS
 
 
@@ -62,9 +59,19 @@ USAGE:
 
 OPTIONS (Overview):
 
-    -s ARG -- DT1 model file
-    -r ARG -- DT2 model file
-    -n ARG -- Iterations
+    -s ARG -- Source DT model(s)
+    -r ARG -- Reference DT model(s)
+    
+        Model file (*.npz/*.pkl), directory (all model files) or list file (one
+        model file per line)
+        
+    [-n ARG] -- Iterations for solving Lyapunov eq. (default: 20)
+    [-o ARG] -- Write distance matrix (sources x references) to file
+    [-f ARG] -- Distance matrix format (default: 'npy' for *.npy, else 'txt';
+                the row index and labels are written to ARG.frames.npy and 
+                ARG.json, see dsutil/dssink.py)
+    [-p ARG] -- Number of processes (default: 1)
+    [-v] -- Verbose output (default: False)
         
 AUTHOR: Roland Kwitt, Kitware Inc., 2013
         roland.kwitt@kitware.com
@@ -80,6 +87,9 @@ def main(argv=None):
     parser.add_option("-s", dest="model1File")
     parser.add_option("-r", dest="model2File") 
     parser.add_option("-n", dest="iterations", type="int", default=20)
+    parser.add_option("-o", dest="mdFile")
+    parser.add_option("-f", dest="mdType")
+    parser.add_option("-p", dest="nProcs", type="int", default=1)
     parser.add_option("-h", dest="shoHelp", action="store_true", default=False)
     parser.add_option("-v", dest="verbose", action="store_true", default=False) 
     opt, args = parser.parse_args()
@@ -87,13 +97,37 @@ def main(argv=None):
     if opt.shoHelp: 
         usage()
     
-    with open(opt.model1File, 'r') as fid:
-        dt1 = pickle.load(fid)
-    with open(opt.model2File, 'r') as fid:
-        dt2 = pickle.load(fid)
-
-    martinD = dsdist.ldsMartinDistance(dt1, dt2, opt.iterations)
-    dsinfo.info('D(%s,%s) = %.4f' % (opt.model1File, opt.model2File, martinD))
+    if opt.model1File is None or opt.model2File is None:
+        dsinfo.warn('Options missing!')
+        usage()
+    
+    try:
+        srcFiles = dsbatch.listModels(opt.model1File)
+        refFiles = dsbatch.listModels(opt.model2File)
+    except (ErrorDS, IOError) as e:
+        dsinfo.fail(e)
+        return -1
+    
+    sink = None
+    if not opt.mdFile is None:
+        sink = dssink.openSink(opt.mdFile, len(refFiles), 
+            [os.path.basename(f) for f in refFiles], 
+            { "sources" : srcFiles, "references" : refFiles }, opt.mdType)
+    
+    def report(i, row):
+        for j, martinD in enumerate(row):
+            dsinfo.info('D(%s,%s) = %.4f' % (srcFiles[i], refFiles[j], 
+                                              martinD))
+    
+    # w/o output file, distances are printed
+    callback = report if sink is None or opt.verbose else None
+    
+    try:
+        dsbatch.batchDistances(srcFiles, refFiles, dsdist.ldsMartinDistance,
+            opt.iterations, sink, opt.nProcs, callback)
+    finally:
+        if not sink is None:
+            sink.close()
         
             
 if __name__ == '__main__':
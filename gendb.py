@@ -0,0 +1,400 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Build (or update) a template model database (DT or KDT models).
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import hashlib
+import traceback
+from optparse import OptionParser
+from multiprocessing import Pool, cpu_count
+
+import dsutil.dsutil as dsutil
+import dsutil.dsinfo as dsinfo
+import dsutil.dsio as dsio
+
+from dscore.system import LinearDS, NonLinearDS
+from dscore.dsexcp import ErrorDS
+from dscore.dskpca import KPCAParam, rbfK, RBFParam
+from dscore.dsbasis import ObservationBasis, BASIS_FILE
+
+
+# name of the manifest file (in the model directory)
+MANIFEST = 'manifest.json'
+
+
+def usage():
+    """Print usage information"""
+    print("""
+Build (or update) a template model database.
+
+Fits a DT or KDT model for each template video (ks*.avi) and writes it to
+the model directory. Models are named after the video's path relative to
+the video directory, with directory separators replaced by '_' (e.g., 
+sub/ks01.avi -> sub_ks01.npz). Models whose video and settings did not
+change since the last build (see the manifest in the model directory) are
+skipped; models (and manifest entries) of videos that no longer exist are
+removed.
+
+USAGE:
+    {0} [OPTIONS]
+    {0} -h
+
+OPTIONS (Overview):
+
+    -v ARG -- Base directory of template videos (searched recursively)
+    -m ARG -- Base directory of template models
+    -t ARG -- Model type ('dt' or 'kdt')
+    [-n ARG] -- Number of states (default: 5)
+    [-g ARG] -- Template video file pattern (default: ks*.avi)
+    [-z ARG] -- Video frame size, WxH or 'native' (default: 64x64)
+    [-c ARG] -- Crop video frames to ROI X,Y,W,H before resizing
+    [-k ARG] -- Use every ARG-th video frame (default: 1)
+    [-l ARG] -- Use at most ARG video frames
+    [-a] -- Use randomized SVD for estimation (DT only)
+    [-e ARG] -- Model file format ('npz' or 'pkl', default: npz)
+    [-d] -- Save distance-only models (npz only)
+    [-r] -- Compact models after estimation (see LinearDS.compact)
+    [-q ARG] -- Reduce KDT support data to rel. error ARG (see 
+                NonLinearDS.reduce)
+    [-b ARG] -- Fit DT models in the observation basis ARG (see dtbasis.py)
+    [-p ARG] -- Number of processes (default: #CPUs)
+    [-f] -- Rebuild all models
+    [-x] -- Verbose output
+
+AUTHOR: Roland Kwitt, Kitware Inc., 2013
+        roland.kwitt@kitware.com
+""".format(sys.argv[0]))
+    sys.exit(-1)
+
+
+def findVideos(videoDir, pattern):
+    """Find all template videos (recursively).
+    """
+
+    videos = []
+    for (root, dirs, files) in os.walk(videoDir):
+        for f in fnmatch.filter(files, pattern):
+            videos.append(os.path.join(root, f))
+    return sorted(videos)
+
+
+def modelName(videoFile, videoDir, ext):
+    """Name of a template video's model (path relative to the video 
+    directory, directory separators replaced by '_').
+    """
+
+    rel = os.path.splitext(os.path.relpath(videoFile, videoDir))[0]
+    return rel.replace(os.sep, '_') + '.' + ext
+
+
+def hashFile(fileName, blockSize=1<<20):
+    """Compute SHA1 hash of a file's content.
+    """
+
+    sha1 = hashlib.sha1()
+    with open(fileName, 'rb') as fid:
+        while True:
+            block = fid.read(blockSize)
+            if not block:
+                break
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def videoInfo(videoFile, videoDir, entry=None):
+    """Get the hash of a video (re-using the hash of the manifest entry if
+    the video's mtime and size are unchanged).
+    """
+
+    st = os.stat(videoFile)
+    if (not entry is None and entry["mtime"] == st.st_mtime and
+        entry["size"] == st.st_size):
+        sha1 = entry["sha1"]
+    else:
+        sha1 = hashFile(videoFile)
+    return { "sha1" : sha1, "mtime" : st.st_mtime, "size" : st.st_size,
+             "video" : os.path.relpath(videoFile, videoDir) }
+
+
+def loadManifest(modelDir):
+    """Load the manifest of a model directory (empty if there is none).
+    """
+
+    manifestFile = os.path.join(modelDir, MANIFEST)
+    if not os.path.exists(manifestFile):
+        return {}
+    with open(manifestFile) as fid:
+        return json.load(fid)
+
+
+def saveManifest(modelDir, manifest):
+    """Write the manifest (atomically) to the model directory.
+    """
+
+    manifestFile = os.path.join(modelDir, MANIFEST)
+    with open(manifestFile + '.tmp', 'w') as fid:
+        json.dump(manifest, fid, indent=2, sort_keys=True)
+    os.rename(manifestFile + '.tmp', manifestFile)
+
+
+def fitModel(args):
+    """Fit the model of a template video and write it to the model store.
+
+    Returns
+    -------
+    res : tuple of (name, fitTime, error)
+        error is None on success.
+    """
+
+    (videoFile, modelFile, settings) = args
+    name = os.path.basename(modelFile)
+    try:
+        tStart = time.time()
+        (dataMat, dataSiz) = dsutil.loadDataFromVideoFile(videoFile,
+            **settings["video"])
+
+        # DT models are fitted to the coordinates of the frames in the 
+        # observation basis (copied to the model directory)
+        basis = None
+        if "basis" in settings:
+            basis = ObservationBasis.load(os.path.join(
+                os.path.dirname(modelFile), BASIS_FILE))
+            dataMat = basis.project(dataMat)
+
+        if settings["type"] == 'dt':
+            model = LinearDS(settings["nStates"], approx=settings["svdRand"],
+                             compact=settings["compact"])
+        else:
+            kpcaP = KPCAParam()
+            kpcaP._kPar = RBFParam()
+            kpcaP._kPar._kCen = True
+            kpcaP._kFun = rbfK
+            model = NonLinearDS(settings["nStates"], kpcaP,
+                                compact=settings["compact"])
+        model.suboptimalSysID(dataMat)
+        if "reduce" in settings:
+            model.reduce(settings["reduce"])
+        if not basis is None:
+            basis.assign(model)
+
+        if not model.check():
+            return (name, time.time() - tStart, 'invalid model')
+
+        # write to a temporary file first, i.e., models are never incomplete
+        (base, ext) = os.path.splitext(modelFile)
+        dsio.saveModel(model, base + '.tmp' + ext, settings["profile"])
+        os.rename(base + '.tmp' + ext, modelFile)
+        return (name, time.time() - tStart, None)
+    except Exception as e:
+        return (name, 0, ''.join(traceback.format_exception_only(type(e), e)))
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-v", dest="videos")
+    parser.add_option("-m", dest="models")
+    parser.add_option("-t", dest="dsType")
+    parser.add_option("-n", dest="nStates", type="int", default=5)
+    parser.add_option("-g", dest="pattern", default='ks*.avi')
+    parser.add_option("-z", dest="vSize")
+    parser.add_option("-c", dest="vROI")
+    parser.add_option("-k", dest="vStride")
+    parser.add_option("-l", dest="vMaxFr")
+    parser.add_option("-a", dest="svdRand", action="store_true", default=False)
+    parser.add_option("-e", dest="format", default='npz')
+    parser.add_option("-d", dest="profile", action="store_const",
+                      const="distance", default="full")
+    parser.add_option("-r", dest="compact", action="store_true", default=False)
+    parser.add_option("-q", dest="reduce", type="float")
+    parser.add_option("-b", dest="basis")
+    parser.add_option("-p", dest="nProcs", type="int", default=cpu_count())
+    parser.add_option("-f", dest="doForce", action="store_true", default=False)
+    parser.add_option("-h", dest="doUsage", action="store_true", default=False)
+    parser.add_option("-x", dest="verbose", action="store_true", default=False)
+    opt, args = parser.parse_args(argv[1:])
+
+    if opt.doUsage:
+        usage()
+
+    if opt.videos is None or opt.models is None or opt.dsType is None:
+        dsinfo.warn('Options missing!')
+        usage()
+
+    if not opt.dsType in ['dt', 'kdt']:
+        dsinfo.fail('Model type %s not supported!' % opt.dsType)
+        return -1
+
+    if not opt.format in ['npz', 'pkl']:
+        dsinfo.fail('Model format %s not supported!' % opt.format)
+        return -1
+
+    if not opt.reduce is None and opt.dsType != 'kdt':
+        dsinfo.fail('Reduction is only supported for KDT models!')
+        return -1
+
+    if not opt.basis is None and opt.dsType != 'dt':
+        dsinfo.fail('Observation bases are only supported for DT models!')
+        return -1
+
+    if opt.format == 'pkl' and opt.profile != 'full':
+        dsinfo.fail('Distance-only models require npz format!')
+        return -1
+
+    try:
+        vidOpts = dsutil.videoOptions(opt.vSize, opt.vROI, opt.vStride, 
+                                      opt.vMaxFr)
+    except ErrorDS as e:
+        dsinfo.fail(e)
+        return -1
+
+    settings = { "type" : opt.dsType,
+                 "nStates" : opt.nStates,
+                 "svdRand" : opt.svdRand and opt.dsType == 'dt',
+                 "format" : opt.format,
+                 "profile" : opt.profile,
+                 "compact" : opt.compact,
+                 "video" : vidOpts }
+    # (only set if given, i.e., existing manifests stay valid)
+    if not opt.reduce is None:
+        settings["reduce"] = opt.reduce
+
+    basis = None
+    if not opt.basis is None:
+        try:
+            basis = ObservationBasis.load(opt.basis)
+        except (IOError, KeyError) as e:
+            dsinfo.fail('Cannot read basis %s: %s' % (opt.basis, e))
+            return -1
+        settings["basis"] = basis.id()
+
+    if not os.path.exists(opt.models):
+        os.makedirs(opt.models)
+    manifest = loadManifest(opt.models)
+    if not basis is None:
+        basis.save(os.path.join(opt.models, BASIS_FILE))
+
+    # map videos to model names (names need to be unique)
+    videos = findVideos(opt.videos, opt.pattern)
+    names = {}
+    for videoFile in videos:
+        name = modelName(videoFile, opt.videos, opt.format)
+        if name in names:
+            dsinfo.fail('%s and %s map to the same model %s!' %
+                        (names[name], videoFile, name))
+            return -1
+        names[name] = videoFile
+
+    # remove models of videos that no longer exist (entries of manifests
+    # without source information are removed if the video was not found)
+    for name in sorted(manifest.keys()):
+        if name in names:
+            continue
+        if ("video" in manifest[name] and 
+            os.path.exists(os.path.join(opt.videos, manifest[name]["video"]))):
+            continue
+        modelFile = os.path.join(opt.models, name)
+        if os.path.exists(modelFile):
+            os.remove(modelFile)
+        del manifest[name]
+        dsinfo.info("removed %s (video no longer exists)" % name)
+
+    # determine which models need to be (re-)built
+    jobs, infos = [], {}
+    for videoFile in videos:
+        name = modelName(videoFile, opt.videos, opt.format)
+        modelFile = os.path.join(opt.models, name)
+
+        entry = manifest.get(name)
+        infos[name] = videoInfo(videoFile, opt.videos, entry)
+        if (not opt.doForce and not entry is None and
+            os.path.exists(modelFile) and
+            entry["sha1"] == infos[name]["sha1"] and
+            json.dumps(entry["settings"], sort_keys=True) ==
+            json.dumps(settings, sort_keys=True)):
+            # update mtime, in case the video was touched only
+            entry.update(infos[name])
+            continue
+        jobs.append((videoFile, modelFile, settings))
+
+    dsinfo.info("%d templates, %d up-to-date, %d to build (%d processes)" %
+                (len(videos), len(videos) - len(jobs), len(jobs),
+                 opt.nProcs))
+
+    if opt.nProcs > 1 and len(jobs) > 1:
+        pool = Pool(min(opt.nProcs, len(jobs)))
+        results = pool.imap_unordered(fitModel, jobs)
+    else:
+        pool = None
+        results = (fitModel(job) for job in jobs)
+
+    nFail, tFit = 0, 0
+    try:
+        for (i, (name, fitTime, error)) in enumerate(results):
+            if not error is None:
+                dsinfo.fail("%s: %s" % (name, error.strip()))
+                manifest.pop(name, None)
+                nFail += 1
+                continue
+
+            entry = dict(infos[name])
+            entry.update({ "settings" : settings, "fitTime" : fitTime })
+            manifest[name] = entry
+            tFit += fitTime
+            if opt.verbose:
+                dsinfo.info("[%d/%d] %s (%.3f [sec])" %
+                            (i+1, len(jobs), name, fitTime))
+
+            # save progress regularly
+            if (i+1) % 32 == 0:
+                saveManifest(opt.models, manifest)
+    finally:
+        if not pool is None:
+            pool.close()
+            pool.join()
+        saveManifest(opt.models, manifest)
+
+    dsinfo.info("built %d models (%d failed), total fit time %.3f [sec]" %
+                (len(jobs) - nFail, nFail, tFit))
+    if nFail > 0:
+        return -1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -35,17 +35,18 @@ __status__  = "Development"
 # generic imports
 import os
 import sys
-import pickle
 import numpy as np
 from optparse import OptionParser
 
 # import supp. pyds packages
 import dsutil.dsutil as dsutil
 import dsutil.dsinfo as dsinfo
+import dsutil.dsio as dsio
 import dscore.dsdist as dsdist
 
 # import pyds classes
 from dscore.dsexcp import ErrorDS
+from dsutil.dscache import FrameCache, SysIDCache
 from dscore.system import NonLinearDS
 from dscore.dskpca import KPCAParam, rbfK, RBFParam
 
@@ -66,10 +67,21 @@ OPTIONS (Overview):
     
         'vFile' - AVI video file
         'aFile' - ASCII data file
+        'bFile' - Binary data file (see ascii2bin.py)
         'lFile' - Image list file 
         
+    [-z ARG] -- Video frame (image) size, WxH or 'native' (default: 64x64
+                for videos, 'native' for images)
+    [-c ARG] -- Crop video frames to ROI X,Y,W,H before resizing
+    [-k ARG] -- Use every ARG-th video frame (default: 1)
+    [-l ARG] -- Use at most ARG video frames
+    [-j ARG] -- Decode video using ARG processes (default: 1)
+    [-C ARG] -- Cache decoded videos in directory ARG
+    [-E ARG] -- Cache estimated models in directory ARG
     [-n ARG] -- NLDS states (default: 5)
-    [-o ARG] -- Save KDT parameters to ARG 
+    [-o ARG] -- Save KDT parameters to ARG (*.npz or *.pkl)
+    [-d] -- Save distance-only KDT parameters (*.npz only)
+    [-r] -- Compact KDT after estimation (for distance computation only)
     [-v] -- Verbose output (default: False)
         
 AUTHOR: Roland Kwitt, Kitware Inc., 2013
@@ -85,8 +97,18 @@ def main(argv=None):
     parser = OptionParser(add_help_option=False)
     parser.add_option("-i", dest="iFile") 
     parser.add_option("-t", dest="iType")
+    parser.add_option("-z", dest="vSize")
+    parser.add_option("-c", dest="vROI")
+    parser.add_option("-k", dest="vStride")
+    parser.add_option("-l", dest="vMaxFr")
+    parser.add_option("-j", dest="vProcs", type="int", default=1)
+    parser.add_option("-C", dest="vCache")
+    parser.add_option("-E", dest="sCache")
     parser.add_option("-o", dest="oFile")
+    parser.add_option("-d", dest="profile", action="store_const", 
+                      const="distance", default="full")
     parser.add_option("-n", dest="nStates", type="int", default=5)
+    parser.add_option("-r", dest="compact", action="store_true", default=False)
     parser.add_option("-h", dest="shoHelp", action="store_true", default=False)
     parser.add_option("-v", dest="verbose", action="store_true", default=False) 
     opt, args = parser.parse_args()
@@ -98,18 +120,37 @@ def main(argv=None):
     dataSiz = None
     try:
         if opt.iType == 'vFile':
-            (dataMat, dataSiz) = dsutil.loadDataFromVideoFile(opt.iFile)
+            vidOpts = dsutil.videoOptions(opt.vSize, opt.vROI, opt.vStride,
+                                          opt.vMaxFr)
+            if not opt.vCache is None:
+                cache = FrameCache(opt.vCache)
+                (dataMat, dataSiz) = cache.loadDataFromVideoFile(opt.iFile,
+                    opt.vProcs, **vidOpts)
+                if opt.verbose:
+                    dsinfo.info("Cache: %(hits)d hits, %(misses)d misses, "
+                                "%(evictions)d evictions" % cache.stats())
+            elif opt.vProcs > 1:
+                (dataMat, dataSiz) = dsutil.loadDataFromVideoFileMP(opt.iFile,
+                    opt.vProcs, **vidOpts)
+            else:
+                (dataMat, dataSiz) = dsutil.loadDataFromVideoFile(opt.iFile,
+                                                                  **vidOpts)
         elif opt.iType == 'aFile':
             (dataMat, dataSiz) = dsutil.loadDataFromASCIIFile(opt.iFile)
+        elif opt.iType == 'bFile':
+            (dataMat, dataSiz) = dsutil.loadDataFromBinaryFile(opt.iFile)
         elif opt.iType == 'lFile':
-            (dataMat, dataSiz) = dsutil.loadDataFromIListFile(opt.iFile)
+            imgOpts = dsutil.videoOptions(opt.vSize)
+            progress = dsutil.infoProgress if opt.verbose else None
+            (dataMat, dataSiz) = dsutil.loadDataFromIListFile(opt.iFile,
+                imgOpts.get("size"), None, progress)
         else:
             dsinfo.fail("Unsupported file type : %s" % opt.iType)    
             return -1
     
     # catch pyds exceptions
     except ErrorDS as e:
-        msg.fail(e)
+        dsinfo.fail(e)
         return -1
     
     try:
@@ -119,16 +160,25 @@ def main(argv=None):
         kpcaP._kPar._kCen = True
         kpcaP._kFun = rbfK
         
-        kdt = NonLinearDS(opt.nStates, kpcaP, opt.verbose)
-        kdt.suboptimalSysID(dataMat)
+        kdt = NonLinearDS(opt.nStates, kpcaP, opt.verbose, opt.compact)
+        if not opt.sCache is None:
+            cache = SysIDCache(opt.sCache)
+            kdt = cache.suboptimalSysID(kdt, dataMat)
+            if opt.verbose:
+                dsinfo.info("SysID cache: %(hits)d hits, %(diskHits)d disk "
+                            "hits, %(misses)d misses" % cache.stats())
+        else:
+            kdt.suboptimalSysID(dataMat)
+        if opt.verbose:
+            dsinfo.info('model footprint: %.1f [KB] (%.1f [KB] mapped)' % 
+                        (kdt.footprint()/1024., kdt.footprint(True)/1024.))
        
         if not opt.oFile is None:
             if not kdt.check():
                 dsinfo.fail('cannot write invalid model!')
                 return -1
             dsinfo.info('writing model to %s' % opt.oFile)
-            with open(opt.oFile, 'w') as fid:
-                pickle.dump(kdt, fid)
+            dsio.saveModel(kdt, opt.oFile, opt.profile)
 
     except ErrorDS as e:
         dsinfo.fail(e)
@@ -0,0 +1,87 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Convert binary distance matrices (e.g., written by detect.py) to ASCII.
+"""
+
+
+__license__ = "Apache License, Version 2.0"
+__author__  = "Roland Kwitt, Kitware Inc., 2013"
+__email__   = "E-Mail: roland.kwitt@kitware.com"
+__status__  = "Development"
+
+
+import sys
+from optparse import OptionParser
+
+import dsutil.dsinfo as dsinfo
+import dsutil.dssink as dssink
+
+
+def usage():
+    """Print usage information"""
+    print("""
+Convert a binary distance matrix to ASCII. The index files of the matrix
+(*.frames.npy, *.json, see dsutil/dssink.py) are written for the output
+file as well.
+
+USAGE:
+    {0} [OPTIONS]
+    {0} -h
+
+OPTIONS (Overview):
+
+    -i ARG -- Input distance matrix (.npy)
+    -o ARG -- Output ASCII file
+    [-p ARG] -- Number format (default: %.5f)
+
+AUTHOR: Roland Kwitt, Kitware Inc., 2013
+        roland.kwitt@kitware.com
+""".format(sys.argv[0]))
+    sys.exit(-1)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-i", dest="inFile")
+    parser.add_option("-o", dest="outFile")
+    parser.add_option("-p", dest="fmt", default='%.5f')
+    parser.add_option("-h", dest="shoHelp", action="store_true", default=False)
+    opt, args = parser.parse_args()
+
+    if opt.shoHelp:
+        usage()
+
+    if opt.inFile is None or opt.outFile is None:
+        dsinfo.warn('Options missing!')
+        usage()
+
+    dssink.exportText(opt.inFile, opt.outFile, opt.fmt)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
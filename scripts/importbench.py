@@ -0,0 +1,112 @@
+################################################################################
+#
+# Library: pydstk
+#
+# Copyright 2010 Kitware Inc. 28 Corporate Drive,
+# Clifton Park, NY, 12065, USA.
+#
+# All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 ( the "License" );
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+################################################################################
+
+
+"""Start-up (import time) benchmark of pydstk's entry points.
+
+Each entry point is imported in a fresh interpreter (several times); the
+import time and the heavy dependencies that got loaded are reported, e.g.,
+
+    python scripts/importbench.py -n 5 -o importbench.json
+"""
+
+
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+from optparse import OptionParser
+
+
+# entry points (modules in the repository root)
+ENTRY_POINTS = ['dt', 'kdt', 'dtdist', 'kdtdist', 'detect', 'detectd',
+                'detectc', 'gendb', 'mdexport', 'ascii2bin', 'dtalign',
+                'dtbasis']
+
+# dependencies to watch
+HEAVY = ['cv2', 'sklearn', 'scipy', 'termcolor']
+
+# code run in the fresh interpreter
+CODE = """
+import sys, time, json
+t0 = time.time()
+import %s
+t1 = time.time()
+print json.dumps({ "time" : t1 - t0,
+                   "heavy" : [m for m in %r if m in sys.modules] })
+"""
+
+
+def benchmark(entry, nRuns, baseDir):
+    """Import an entry point nRuns times (fresh interpreter each time).
+    """
+
+    times, heavy = [], []
+    for i in range(nRuns):
+        out = subprocess.check_output([sys.executable, '-c',
+                                       CODE % (entry, HEAVY)], cwd=baseDir)
+        res = json.loads(out.strip().split('\n')[-1])
+        times.append(res["time"])
+        heavy = res["heavy"]
+    return { "min" : np.min(times),
+             "median" : np.median(times),
+             "heavy" : heavy }
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = OptionParser(add_help_option=False)
+    parser.add_option("-n", dest="nRuns", type="int", default=5)
+    parser.add_option("-e", dest="entries")
+    parser.add_option("-o", dest="outFile")
+    parser.add_option("-h", dest="shoHelp", action="store_true", default=False)
+    opt, args = parser.parse_args()
+
+    if opt.shoHelp:
+        print("usage: %s [-n RUNS] [-e ENTRY1,ENTRY2,...] [-o JSONFILE]" %
+              sys.argv[0])
+        return 0
+
+    entries = ENTRY_POINTS
+    if not opt.entries is None:
+        entries = opt.entries.split(',')
+
+    baseDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    report = {}
+    for entry in entries:
+        report[entry] = benchmark(entry, opt.nRuns, baseDir)
+        print("%-10s min=%.3f [sec] median=%.3f [sec] loads: %s" %
+              (entry, report[entry]["min"], report[entry]["median"],
+               ', '.join(report[entry]["heavy"]) or '-'))
+
+    if not opt.outFile is None:
+        with open(opt.outFile, 'w') as fid:
+            json.dump(report, fid, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
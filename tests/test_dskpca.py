@@ -31,8 +31,9 @@ import sys
 import numpy as np
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
-from dscore.dskpca import KPCAParam, rbfK, RBFParam, kpca
+from dscore.dskpca import KPCAParam, rbfK, RBFParam, kpca, refineEig
 from dsutil.dsutil import loadDataFromASCIIFile
+from dscore.system import OnlineNonLinearDS
 
 
 TESTBASE = os.path.dirname(__file__)
@@ -87,4 +88,77 @@ def test_kpca():
     # don't care about the sign 
     err = np.linalg.norm(np.abs(baseKPCACoeff)-np.abs(X), 'fro')
     np.testing.assert_almost_equal(err, 0, 4)
-    
\ No newline at end of file
+    
+
+
+def test_kpca_warmStart():
+    """Test warm-started KPCA (eigenvectors of an overlapping window).
+    """
+    
+    # smooth sequence (mixture of sinusoids), 120-frame windows
+    rng = np.random.RandomState(0)
+    t = np.arange(122)/10.
+    F = np.vstack([f(w*t) for w in [0.5, 1.0, 1.5] for f in [np.sin, np.cos]])
+    data = rng.randn(20, 6).dot(F)
+    
+    def kpcaParam():
+        kpcaP = KPCAParam()
+        kpcaP._kPar = RBFParam()
+        kpcaP._kPar._kCen = True
+        kpcaP._kFun = rbfK
+        return kpcaP
+    
+    # eigenvectors of the previous (overlapping) window, shifted by 2 frames
+    prev = kpcaParam()
+    kpca(data[:,0:120], 5, prev)
+    A = np.asarray(prev._A)*np.sqrt(prev._l)
+    init = np.vstack((A[2:], np.zeros((2, 5))))
+    
+    cold = kpcaParam()
+    X0 = kpca(data[:,2:122], 5, cold)
+    # the refinement needs to be accepted (i.e., no fallback to a cold solve)
+    assert not refineEig(cold._kPar._kMat, init) is None
+    warm = kpcaParam()
+    X1 = kpca(data[:,2:122], 5, warm, init=init)
+    
+    np.testing.assert_almost_equal(warm._l, cold._l, 6)
+    np.testing.assert_almost_equal(np.abs(X1), np.abs(X0), 4)
+    
+    # no convergence (or too small problems) -> None
+    assert refineEig(cold._kPar._kMat, rng.randn(120, 5), 1) is None
+    assert refineEig(cold._kPar._kMat[0:20,0:20], init[0:20]) is None
+
+
+def test_refineEig_online():
+    """Test refinement of the (shifted) windows of an online NLDS.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    kpcaP = KPCAParam()
+    kpcaP._kPar = RBFParam()
+    kpcaP._kPar._kCen = True
+    kpcaP._kFun = rbfK
+    ds = OnlineNonLinearDS(5, kpcaP, 30, 1)
+    
+    (prev, nAcc, nWin) = (None, 0, 0)
+    for x in data.T:
+        ds.update(x)
+        if not ds.hasChanged():
+            continue
+        par = ds._kpcaParams
+        if not prev is None:
+            # previous eigenvectors, shifted by one frame (as with warmStart)
+            init = np.zeros(prev.shape)
+            init[0:-1] = prev[1:]
+            res = refineEig(par._kPar._kMat, init, minSize=0)
+            nWin += 1
+            if not res is None:
+                nAcc += 1
+                np.testing.assert_allclose(res[1], par._l, rtol=0,
+                                           atol=1e-5*par._l[0])
+        prev = np.asarray(par._A)*np.sqrt(np.abs(par._l))
+    
+    # the refinement is accepted for most windows
+    assert nWin > 10 and nAcc >= 0.75*nWin
@@ -31,15 +31,30 @@ import sys
 import json
 import copy
 import pickle
+import shutil
+import tempfile
 import unittest
 import numpy as np
+from multiprocessing.pool import ThreadPool
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from dscore.system import LinearDS
 from dsutil.dsutil import loadDataFromASCIIFile, orth
+from dsutil.dscache import SysIDCache
+from dsutil.dsutil import iterVideoBlocks
+import dsutil.dsbatch as dsbatch
+import dsutil.dssink as dssink
+import dsutil.dsio as dsio
+import gendb
 from dscore.system import NonLinearDS
+from dscore.system import OnlineLinearDS, ChangeSchedule, OnlineMultiDS, RingBuffer
+from dscore.system import OnlineNonLinearDS
+from dscore.dsdist import ldsMartinDistance, nldsMartinDistance, TemplateBank
+from dscore.dsdist import nldsIP
 from dscore.dskpca import KPCAParam, rbfK, RBFParam
+from dscore.dsbasis import ObservationBasis
+from dscore.dsexcp import ErrorDS
 
 
 TESTBASE = os.path.dirname(__file__) 
@@ -168,6 +183,533 @@ def test_convertToJCF():
         np.testing.assert_almost_equal(errC, 0, 5)
     
     
+def test_computeJCFTransform():
+    """Test JCF transform for various #states (random stable systems).
+    """
+    
+    np.random.seed(1234)
+    for N in [2, 3, 7, 20, 50]:
+        A = np.asmatrix(np.random.randn(N,N))
+        A /= 1.1*np.max(np.abs(np.linalg.eigvals(A)))
+        C = np.asmatrix(np.random.randn(100,N))
+        
+        P = LinearDS.computeJCFTransform(A,C)
+        J,_,X = LinearDS.computeRJF(A)
+        
+        # P*A*inv(P) is the real Jordan form, X^T*(C*inv(P)) = g^T*C
+        Ac = P*A*np.linalg.inv(P)
+        Cc = C*np.linalg.inv(P)
+        np.testing.assert_almost_equal(np.linalg.norm(Ac-J, 'fro'), 0)
+        np.testing.assert_almost_equal(np.asarray(X).dot(P), 
+                                       np.asarray(np.sum(C, axis=0)))
+    
+    
+def test_batchConversion():
+    """Test batch state-space mapping and JCF conversion (vs. single LDS).
+    """
+    
+    np.random.seed(1234)
+    dsFile = os.path.join(TESTBASE, "data/data1-dt-5c-center.pkl")
+    ds = pickle.load(open(dsFile))
+    
+    # similarity transforms of the LDS
+    ldsList = []
+    for i in range(10):
+        Q = np.asmatrix(orth(np.random.random((5,5))))
+        lds = copy.deepcopy(ds)
+        lds._Chat = ds._Chat*Q.T
+        lds._Ahat = Q*ds._Ahat*Q.T
+        lds._Qhat = Q*ds._Qhat*Q.T
+        lds._Xhat = Q*ds._Xhat
+        lds._initM0 = Q*ds._initM0
+        ldsList.append(lds)
+    
+    (mapped, err) = LinearDS.stateSpaceMapBatch(ds, ldsList, 4)
+    for (i, lds) in enumerate(ldsList):
+        (ref, refErr) = LinearDS.stateSpaceMap(ds, lds)
+        np.testing.assert_almost_equal(err[i], refErr)
+        for key in ['_Chat', '_Ahat', '_Qhat', '_initM0', '_initS0']:
+            np.testing.assert_almost_equal(getattr(mapped[i], key), 
+                                           getattr(ref, key))
+    
+    LinearDS.convertToJCFBatch(ldsList, 4)
+    for lds in ldsList:
+        ref = copy.deepcopy(lds)
+        ref.convertToJCF()
+        for key in ['_ChatJCF', '_AhatJCF', '_XhatJCF', '_initM0JCF']:
+            np.testing.assert_almost_equal(getattr(lds, key), 
+                                           getattr(ref, key))
+    
+    
+def test_RingBuffer():
+    """Test ring buffer windows (fill level, wrap-around, views).
+    """
+    
+    np.random.seed(1234)
+    data = np.random.random((10, 25)).astype(np.float32)
+    
+    buf = RingBuffer(7)
+    for t in range(data.shape[1]):
+        buf.append(data[:,t])
+        n = min(t+1, 7)
+        assert len(buf) == n
+        assert buf.full() == (n == 7)
+        for L in [1, n]:
+            Y = buf.window(L)
+            assert Y.dtype == np.float32
+            assert np.may_share_memory(Y, buf._data)
+            np.testing.assert_equal(Y, data[:,t+1-L:t+1])
+    
+    
+def test_OnlineLinearDS_adaptive():
+    """Test adaptive re-estimation schedule (static and changing input).
+    """
+    
+    np.random.seed(1234)
+    base = np.random.random((100, 3))
+    data = base[:, np.arange(200) % 3] + 0.01*np.random.randn(100, 200)
+    data[:, 150:] = np.random.random((100, 50))
+    
+    for schedule in [None, ChangeSchedule(2.0, 50.0)]:
+        ds = OnlineLinearDS(3, 20, 2, False, False, schedule)
+        nChanged = 0
+        for t in range(data.shape[1]):
+            ds.update(data[:,t])
+            if ds.check() and ds.hasChanged():
+                nChanged += 1
+        stats = ds.stats()
+        assert stats["executed"] == nChanged
+        assert stats["executed"] + stats["skipped"] >= 90
+        if schedule is None:
+            assert stats["skipped"] == 0 and stats["forced"] == 0
+        else:
+            assert stats["skipped"] > 40
+            assert stats["forced"] > 0
+    
+    
+def test_OnlineLinearDS_updateMany():
+    """Test block updates against frame-by-frame updates.
+    """
+    
+    np.random.seed(1234)
+    base = np.random.random((100, 3))
+    data = base[:, np.arange(200) % 3] + 0.01*np.random.randn(100, 200)
+    data[:, 150:] = np.random.random((100, 50))
+    
+    for (schedule, gram) in [(None, False), (None, True), 
+                             (ChangeSchedule(2.0, 50.0), False)]:
+        ds1 = OnlineLinearDS(3, 20, 2, False, False, schedule)
+        ds2 = OnlineLinearDS(3, 20, 2, False, False, copy.deepcopy(schedule))
+        
+        changed = []
+        for t in range(data.shape[1]):
+            ds1.update(data[:,t])
+            if ds1.hasChanged():
+                changed.append(t)
+        
+        # blocks of varying size (shorter and longer than the window)
+        res = []
+        for (b, n) in [(0, 7), (7, 30), (37, 1), (38, 162)]:
+            res += [b + i for i in ds2.updateMany(data[:,b:b+n], 
+                                                  None, gram)]
+        assert res == changed
+        assert ds1.stats() == ds2.stats()
+        np.testing.assert_almost_equal(ldsMartinDistance(ds1, ds2), 0, 3)
+    
+    
+def test_snapshot():
+    """Test read-only snapshots and concurrent distance computation.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    kpcaP = KPCAParam()
+    kpcaP._kPar = RBFParam()
+    kpcaP._kPar._kCen = True
+    kpcaP._kFun = rbfK
+    
+    nlds = OnlineNonLinearDS(5, kpcaP, 40, 4)
+    for x in data.T:
+        nlds.update(x)
+    snap = nlds.snapshot()
+    assert type(snap) is NonLinearDS and not hasattr(snap, '_buf')
+    assert not snap._kpcaParams._A.flags.writeable
+    assert not snap._kpcaParams._kPar._kMat.flags.writeable
+    
+    # distances on shared models do not modify them
+    kMat = snap._kpcaParams._kPar._kMat
+    d = nldsMartinDistance(snap, nlds)
+    pool = ThreadPool(4)
+    dists = pool.map(lambda i: nldsMartinDistance(snap, nlds), range(16))
+    pool.close()
+    assert dists == [d]*16
+    assert snap._kpcaParams._kPar._kMat is kMat
+    
+    # ... and are not affected by re-estimations of the source model 
+    nlds.suboptimalSysID(data[:,0:40].copy())
+    assert nldsMartinDistance(snap, nlds) != d
+    
+    
+def test_TemplateBank():
+    """Test one-vs-all NLDS distances against pairwise distances.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    models = []
+    for (b, e) in [(0, 30), (5, 48), (10, 40), (0, 48), (20, 45)]:
+        kpcaP = KPCAParam()
+        kpcaP._kPar = RBFParam()
+        kpcaP._kPar._kCen = True
+        kpcaP._kFun = rbfK
+        nlds = NonLinearDS(3, kpcaP, False)
+        nlds.suboptimalSysID(data[:,b:e].copy())
+        models.append(nlds)
+    
+    # small blocks, i.e., several templates per query
+    bank = TemplateBank(models[1:], 70)
+    dists = [nldsMartinDistance(models[0], m) for m in models[1:]]
+    # (float32 data, i.e., kernels differ slightly with the block layout)
+    np.testing.assert_almost_equal(bank.distances(models[0]), dists, 4)
+    np.testing.assert_almost_equal(bank.distances(models[0], 20, [3, 0]), 
+                                   [dists[3], dists[0]], 4)
+    
+    
+def test_NonLinearDS_reduce():
+    """Test reduced-set compression of NLDS support data.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    models = []
+    for (b, e) in [(0, 30), (0, 48)]:
+        kpcaP = KPCAParam()
+        kpcaP._kPar = RBFParam()
+        kpcaP._kPar._kCen = True
+        kpcaP._kFun = rbfK
+        nlds = NonLinearDS(3, kpcaP, False)
+        nlds.suboptimalSysID(data[:,b:e].copy())
+        models.append(nlds)
+    (query, nlds) = models
+    F0 = nldsIP(query, nlds)
+    d0 = nldsMartinDistance(query, nlds)
+    
+    # norms of the basis vectors (in feature space)
+    n0 = np.sqrt(np.diag(nldsIP(query, query)))
+    n1 = np.sqrt(np.diag(nldsIP(nlds, nlds)))
+    
+    err = nlds.reduce(1e-2)
+    assert np.max(err) <= 1e-2
+    assert nlds._kpcaParams._data.shape[1] < 48
+    assert nlds._kpcaParams._A.shape == (nlds._kpcaParams._data.shape[1], 3)
+    
+    # error bound of the inner products
+    F1 = nldsIP(query, nlds)
+    assert np.all(np.abs(F1 - F0) <= np.outer(n0, err*n1) + 1e-5)
+    np.testing.assert_almost_equal(nldsMartinDistance(query, nlds), d0, 2)
+    assert not nlds._kpcaParams._kPar._kCen
+    
+    
+def test_nldsIP_centering():
+    """Test that nldsIP (and TemplateBank) take kernel centering into account.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    models = []
+    for (b, e) in [(0, 30), (0, 48)]:
+        kpcaP = KPCAParam()
+        kpcaP._kPar = RBFParam()
+        kpcaP._kPar._kCen = True
+        kpcaP._kFun = rbfK
+        nlds = NonLinearDS(3, kpcaP, False)
+        nlds.suboptimalSysID(data[:,b:e].copy())
+        models.append(nlds)
+    (query, nlds) = models
+    F0 = nldsIP(query, nlds)
+    
+    # in the centered feature space, sum_i phi(y_i) is zero, i.e., adding 
+    # constants to the KPCA weights does not change the basis vectors
+    shifted = copy.deepcopy(nlds)
+    shifted._kpcaParams._A = nlds._kpcaParams._A + np.arange(1, 4)
+    np.testing.assert_almost_equal(nldsIP(query, shifted), F0, 5)
+    np.testing.assert_almost_equal(
+        TemplateBank([shifted]).innerProducts(query)[0], F0, 5)
+    
+    shifted._kpcaParams._kPar._kCen = False
+    assert np.max(np.abs(nldsIP(query, shifted) - F0)) > 1e-2
+    
+    
+def test_LinearDS_gramSysID():
+    """Test Gram-based system identification (against SVD-based).
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    lds1 = LinearDS(5, False, False)
+    lds1.suboptimalSysID(data)
+    lds2 = LinearDS(5, False, False)
+    lds2.gramSysID(data, data.T.dot(data).astype(np.double))
+    
+    np.testing.assert_almost_equal(lds1._Rhat, lds2._Rhat, 4)
+    np.testing.assert_almost_equal(ldsMartinDistance(lds1, lds2), 0, 3)
+    
+    
+def test_OnlineMultiDS():
+    """Test multi-window online LDS against single-window online LDS's.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    multi = OnlineMultiDS({10 : LinearDS(3), 20 : LinearDS(3)}, 2)
+    single = { 10 : OnlineLinearDS(3, 10, 2), 20 : OnlineLinearDS(3, 20, 2) }
+    for t in range(data.shape[1]):
+        multi.update(data[:,t])
+        for L in single:
+            single[L].update(data[:,t])
+            assert single[L].hasChanged() == (L in multi.changed())
+        for L in multi.changed():
+            d = ldsMartinDistance(multi.model(L), single[L])
+            np.testing.assert_almost_equal(d, 0, 3)
+    
+    
+def test_ObservationBasis():
+    """Test DT models in a (streamed) global observation basis.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    # the centered data has rank 47, i.e., the basis captures all of it
+    blocks = [data[:,i:i+16] for i in range(0, data.shape[1], 16)]
+    basis = ObservationBasis.fit(blocks, 47)
+    U = basis._U
+    np.testing.assert_almost_equal(U.T.dot(U), np.eye(47), 6)
+    
+    (full, proj) = ([], [])
+    for (b, e) in [(0, 30), (10, 48)]:
+        lds = LinearDS(5, False, False)
+        lds.suboptimalSysID(data[:,b:e].copy())
+        full.append(lds)
+        lds = LinearDS(5, False, False)
+        lds.suboptimalSysID(basis.project(data[:,b:e]))
+        proj.append(basis.assign(lds))
+    
+    d0 = ldsMartinDistance(full[0], full[1])
+    np.testing.assert_almost_equal(ldsMartinDistance(proj[0], proj[1]), d0, 3)
+    
+    # projecting a full-space model is equivalent to fitting in the basis
+    basis.projectModel(full[0])
+    np.testing.assert_almost_equal(ldsMartinDistance(full[0], proj[1]), d0, 3)
+    
+    # models of different bases are not comparable
+    other = ObservationBasis(orth(np.random.RandomState(0).randn(2304, 47)))
+    other.projectModel(full[1])
+    try:
+        ldsMartinDistance(proj[0], full[1])
+        assert False
+    except ErrorDS:
+        pass
+    
+    
+def test_gendb_basis_batch():
+    """Test batch mode on a template database built with an observation 
+    basis (gendb.py -b).
+    """
+    
+    videoFile = os.path.join(TESTBASE, "data/ultrasound.avi")
+    tmpDir = tempfile.mkdtemp()
+    try:
+        videoDir = os.path.join(tmpDir, "videos")
+        modelDir = os.path.join(tmpDir, "models")
+        os.makedirs(videoDir)
+        for name in ["ks01.avi", "ks02.avi"]:
+            shutil.copy(videoFile, os.path.join(videoDir, name))
+        
+        basisFile = os.path.join(tmpDir, "basis.npz")
+        blocks = (b for (b, _) in iterVideoBlocks(videoFile, 16))
+        ObservationBasis.fit(blocks, 8).save(basisFile)
+        assert gendb.main(['gendb.py', '-v', videoDir, '-m', modelDir, 
+                           '-t', 'dt', '-b', basisFile, '-p', '1']) is None
+        
+        # the basis (in the model directory) is not a model
+        modelFiles = dsbatch.listModels(modelDir)
+        assert [os.path.basename(f) for f in modelFiles] == ["ks01.npz", 
+                                                             "ks02.npz"]
+        rows = []
+        dsbatch.batchDistances(modelFiles, modelFiles, ldsMartinDistance, 20,
+                               callback=lambda i, row: rows.append(row))
+        np.testing.assert_almost_equal(np.array(rows), np.zeros((2, 2)), 3)
+        dsbatch.alignModels(modelFiles[0], modelFiles, 
+                            os.path.join(tmpDir, "aligned"))
+    finally:
+        shutil.rmtree(tmpDir)
+    
+    
+def test_gendb_names():
+    """Test model names of template videos in subdirectories and removal of
+    models whose video no longer exists (gendb.py).
+    """
+    
+    videoFile = os.path.join(TESTBASE, "data/ultrasound.avi")
+    tmpDir = tempfile.mkdtemp()
+    try:
+        videoDir = os.path.join(tmpDir, "videos")
+        modelDir = os.path.join(tmpDir, "models")
+        for sub in ["a", "b"]:
+            os.makedirs(os.path.join(videoDir, sub))
+            shutil.copy(videoFile, os.path.join(videoDir, sub, "ks01.avi"))
+        args = ['gendb.py', '-v', videoDir, '-m', modelDir, '-t', 'dt', 
+                '-l', '20', '-p', '1']
+        
+        assert gendb.main(args) is None
+        assert sorted(os.listdir(modelDir)) == ["a_ks01.npz", "b_ks01.npz", 
+                                                "manifest.json"]
+        
+        os.remove(os.path.join(videoDir, "b", "ks01.avi"))
+        assert gendb.main(args) is None
+        assert sorted(os.listdir(modelDir)) == ["a_ks01.npz", "manifest.json"]
+        assert gendb.loadManifest(modelDir).keys() == ["a_ks01.npz"]
+        
+        # names need to be unique
+        shutil.copy(videoFile, os.path.join(videoDir, "a_ks01.avi"))
+        assert gendb.main(args + ['-g', '*.avi']) == -1
+    finally:
+        shutil.rmtree(tmpDir)
+    
+    
+def test_footprint():
+    """Test that memory-mapped model data is counted separately.
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    lds = LinearDS(5, False, False)
+    lds.suboptimalSysID(data)
+    assert lds.footprint(True) == 0
+    
+    tmpDir = tempfile.mkdtemp()
+    try:
+        modelFile = os.path.join(tmpDir, "lds.npz")
+        dsio.saveModel(lds, modelFile)
+        mapped = dsio.loadModel(modelFile)
+        assert mapped.footprint(True) >= mapped._Chat.nbytes
+        assert mapped.footprint() < lds.footprint() - mapped._Chat.nbytes
+        del mapped
+    finally:
+        shutil.rmtree(tmpDir)
+    
+    
+def test_saveModel_distance():
+    """Test the 'distance' profile of the model format (dsio).
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    lds = LinearDS(5, False, False)
+    lds.suboptimalSysID(data[:,0:40])
+    ref = LinearDS(5, False, False)
+    ref.suboptimalSysID(data[:,10:])
+    
+    tmpDir = tempfile.mkdtemp()
+    try:
+        modelFile = os.path.join(tmpDir, "lds.npz")
+        dsio.saveModel(lds, modelFile, "distance")
+        model = dsio.loadModel(modelFile, False)
+        assert not hasattr(model, "_Xhat") and not hasattr(model, "_Yavg")
+        assert model.numFrames() == 40
+        assert model.check()
+        np.testing.assert_almost_equal(ldsMartinDistance(model, ref), 
+                                       ldsMartinDistance(lds, ref))
+    finally:
+        shutil.rmtree(tmpDir)
+    
+    
+def test_sinks():
+    """Test that all sinks write the same rows and index (loadRows, 
+    exportText).
+    """
+    
+    rows = np.random.RandomState(0).rand(40, 3)
+    tmpDir = tempfile.mkdtemp()
+    try:
+        res = []
+        for (kind, ext) in [('npy', 'npy'), ('mmap', 'npy'), ('txt', 'txt')]:
+            fileName = os.path.join(tmpDir, "%s.%s" % (kind, ext))
+            with dssink.openSink(fileName, 3, ['a', 'b', 'c'], None, 
+                                 kind) as sink:
+                for (f, row) in enumerate(rows):
+                    sink.write(f + 10, row)
+            res.append(dssink.loadRows(fileName))
+        
+        exported = os.path.join(tmpDir, "export.txt")
+        dssink.exportText(os.path.join(tmpDir, "npy.npy"), exported)
+        res.append(dssink.loadRows(exported))
+        assert open(exported).read() == open(os.path.join(tmpDir, 
+                                                          "txt.txt")).read()
+        
+        for (mat, frames, index) in res:
+            np.testing.assert_almost_equal(mat, rows, 5)
+            assert np.all(frames == np.arange(10, 50))
+            assert index["labels"] == ['a', 'b', 'c']
+    finally:
+        shutil.rmtree(tmpDir)
+    
+    
+def test_SysIDCache():
+    """Test memoized system identification (memory and disk tier).
+    """
+    
+    dataFile = os.path.join(TESTBASE, "data/data1.txt")
+    data, _ = loadDataFromASCIIFile(dataFile)
+    
+    def newKDT():
+        kpcaP = KPCAParam()
+        kpcaP._kPar = RBFParam()
+        kpcaP._kPar._kCen = True
+        kpcaP._kFun = rbfK
+        return NonLinearDS(5, kpcaP, False)
+    
+    lds0 = LinearDS(5, False, False)
+    lds0.suboptimalSysID(data)
+    kdt0 = newKDT()
+    kdt0.suboptimalSysID(data)
+    
+    cacheDir = tempfile.mkdtemp()
+    try:
+        cache = SysIDCache(cacheDir, maxEntries=1)
+        ldss = [cache.suboptimalSysID(LinearDS(5, False, False), data),
+                cache.suboptimalSysID(LinearDS(5, False, True), data)]
+        # different parameters, i.e., miss (and eviction from memory)
+        kdt1 = cache.suboptimalSysID(newKDT(), data)
+        assert cache.stats() == { "hits" : 1, "diskHits" : 0, "misses" : 2,
+                                  "evictions" : 1 }
+        
+        cache = SysIDCache(cacheDir)
+        ldss.append(cache.suboptimalSysID(LinearDS(5, False, False), data))
+        kdt2 = cache.suboptimalSysID(newKDT(), data)
+        assert cache.stats()["diskHits"] == 2
+        
+        for lds in ldss:
+            _, err = LinearDS.stateSpaceMap(lds0, lds)
+            np.testing.assert_almost_equal(err, 0)
+        for kdt in [kdt1, kdt2]:
+            np.testing.assert_almost_equal(
+                NonLinearDS.naiveCompare(kdt0, kdt), 0)
+        
+        # other data, i.e., miss
+        cache.suboptimalSysID(LinearDS(5, False, False), data[:,1:])
+        assert cache.stats()["misses"] == 1
+    finally:
+        shutil.rmtree(cacheDir)
+    
+    
 if __name__ == "__main__":
     pass
     